@@ -1,18 +1,21 @@
 from langchain.agents import create_agent
+from config import CONTEXT_REPORT_DEBUG
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_ollama import ChatOllama
 from langgraph.checkpoint.memory import MemorySaver
 from app.eckert_agent.memory.chat_memory import ChatMemory
+from app.eckert_agent.memory.chat_memory_partitions import start_partition_maintenance
+from app.eckert_agent.memory.context_window import ContextWindowManager
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.state import CompiledStateGraph
 
 # from langgraph.checkpoint import
 
 from app.eckert_agent.memory.chat_memory import get_postgres_memory
-from app.eckert_agent.memory.pg_checkpointer import get_postgres_checkpointer
+from app.eckert_agent.memory.conversation_store import ConversationStore
 from app.eckert_agent.skills.test_add import AddToolInput
 from app.eckert_agent.tool.agent_tools import get_agent_tools
 from app.eckert_agent.model.ollama import OllamaModel
@@ -23,7 +26,7 @@ from dotenv import load_dotenv
 # from typing import TypedDict, List
 load_dotenv()
 from pydantic import BaseModel, Field
-from typing import List, Any
+from typing import List, Any, Optional
 from langchain_core.messages import BaseMessage
 from langchain_core.agents import AgentStep
 # from langgraph.checkpoint.sqlite import SqliteSaver
@@ -54,6 +57,8 @@ class AgentState(BaseModel):
     # 3. （可选）自定义扩展字段（按需添加，不违反 AgentState 限制）
     user_id: str = Field(default="default_user", description="用户唯一标识")
     session_id: str = Field(default="default_session", description="会话唯一标识")
+    user_input: str = Field(default="", description="本轮用户输入（每轮对话运行一次图）")
+    knowledge_context: str = Field(default="", description="本轮知识库检索内容（每轮重新检索，不写回检查点）")
 
 # class ToolMetaSchema(BaseModel):
 #     """工具元数据 Schema（结构化描述工具信息）"""
@@ -79,12 +84,19 @@ class OllamaAgent:
         self.llm = OllamaModel().get_llm() # 核心：Ollama自定义模型初始化
         # self.tools = get_agent_tools()
         self.prompt = self._build_ollama_prompt()  # 核心：Ollama轻量化prompt
-        # self.checkpointer = get_postgres_checkpointer()
 
         self.session_config =RunnableConfig(configurable={"thread_id": "debug_test_001"})
         # self.session_config = {"configurable": {"thread_id": "debug_test_001"}}
         # self.checkpointer = MemorySaver()
         self.postgres_memory = ChatMemory()
+        # 对话进程负责 chat_memory 月度分区的后台维护（CHAT_MEMORY_PARTITIONING=monthly 时，每个进程一个）
+        start_partition_maintenance()
+        # 对话存储：按 CONVERSATION_SOURCE 决定检查点或 chat_memory 为权威来源，每轮只写一次
+        self.conversation_store = ConversationStore(self.postgres_memory)
+        self.checkpointer = self.conversation_store.checkpointer()
+        # 上下文窗口管理：每轮按 token 预算裁剪送入模型的历史
+        self.context_manager = ContextWindowManager()
+        self.last_context_report = None
         # self.graph_config = {
         #     "configurable": {"thread_id": "agent_session_001"}
         # }
@@ -118,77 +130,110 @@ class OllamaAgent:
         # Ollama适配：仅保留3个核心占位符，顺序不可变
         return SystemMessage(content=system_prompt)
 
-    from langchain_core.messages import AIMessage, BaseMessage
-    from typing import List
+    @staticmethod
+    def read_user_input() -> Optional[str]:
+        """读取一轮用户输入，输入「exit/退出」时返回 None"""
+        print("用户：", end="", flush=True)
+        user_input = input().strip()
+        if user_input.lower() in ["exit", "退出"]:
+            print("=== 对话结束 ===")
+            return None
+        return user_input
+
+    def _load_memory_node(self, state: AgentState) -> AgentState:
+        """加载对话历史（检查点已恢复历史时不读库）"""
+        history = self.conversation_store.load_history(state.session_id, state.messages)
+        if history:
+            state.messages.extend(history)
+        return state
 
     def agent_node(self, state: AgentState) -> AgentState:
         """
-        包装 create_agent() 生成的子图，在节点内部实现循环对话
-        直到用户输入「exit/退出」，才终止循环并返回最终状态
+        包装 create_agent() 生成的子图，处理一轮对话（state.user_input）
+        每轮运行一次图：开启检查点时每轮结束即落一次检查点，中途退出不会丢失已完成的轮次
         """
-        # 步骤 1：初始化当前状态（继承节点传入的初始状态，保留外部上下文）
-        current_state = state
-        print("=== 进入内部循环对话（输入 'exit' 或 '退出' 结束对话）===")
-        print("用户：", end="", flush=True)
+        if not state.user_input:
+            return state
+        new_human_message, model_state, context_report = self._prepare_turn(state)
+
+        # 步骤 2：流式调用子图，获取 AI 响应并拼接完整内容
+        full_response_content = ""
+        for chunk in self.base_agent.stream(model_state):
+            full_response_content += self._consume_chunk(chunk, context_report)
+
+        messages = self._finish_turn(state, new_human_message, full_response_content, context_report)
+        # checkpoint 模式下只更新 chat_memory 投影（async 时只入队），流式输出结束即可接收下一轮输入
+        self.conversation_store.record_turn(state.session_id, state.user_input, full_response_content)
+        print("\n")
+
+        # 步骤 4：返回写回检查点的状态（checkpoint 模式下按摘要/条数上限裁剪，检查点不会无限增长）
+        return AgentState(
+            messages=self.conversation_store.trim_checkpoint(messages),
+            intermediate_steps=state.intermediate_steps,
+            session_id=state.session_id
+        )
+
+    async def aagent_node(self, state: AgentState) -> AgentState:
+        """agent_node 的异步版本（ainvoke/astream 运行时）：子图走 astream，记忆读写走异步连接池，不占用执行器线程"""
+        if not state.user_input:
+            return state
+        new_human_message, model_state, context_report = self._prepare_turn(state)
+
+        full_response_content = ""
+        async for chunk in self.base_agent.astream(model_state):
+            full_response_content += self._consume_chunk(chunk, context_report)
+
+        messages = self._finish_turn(state, new_human_message, full_response_content, context_report)
+        await self.conversation_store.arecord_turn(state.session_id, state.user_input, full_response_content)
+        print("\n")
 
-        # 步骤 2：搭建对话循环（核心：持续交互直到触发退出条件）
-        while True:
-            # 子步骤 2.1：接收用户输入（循环内的新输入）
-            user_input = input().strip()
-
-            # 子步骤 2.2：判断退出条件，触发循环终止
-            if user_input.lower() in ["exit", "退出"]:
-                print("=== 内部循环对话结束 ===")
-                break
-
-            # 子步骤 2.3：封装用户输入为 HumanMessage，追加到当前状态的 messages 中
-            new_human_message = HumanMessage(content=user_input)
-            updated_messages = current_state.messages.copy()
-            updated_messages.append(new_human_message)
-            current_state = AgentState(
-                messages=updated_messages,
-                intermediate_steps=current_state.intermediate_steps
-            )
-
-            # 子步骤 2.4：流式调用子图，获取 AI 响应并拼接完整内容
-            full_response_content = ""
-            final_ai_message = None
-
-            # checkpoint = self.checkpointer.get(self.session_config)
-            # print("checkpoint: "+checkpoint, end="", flush=True)
-
-            for chunk in self.base_agent.stream(current_state):
-                # 健壮提取 chunk 中的有效内容
-                try:
-                    current_content = chunk['model']['messages'][0].content
-                except (IndexError, KeyError):
-                    current_content = ""
-
-                if current_content:
-                    print("AI: "+current_content, end="", flush=True)
-                    full_response_content += current_content
-
-            # 子步骤 2.5：封装 AI 响应为 AIMessage，更新当前状态（关键：维护上下文）
-            if full_response_content:
-                final_ai_message = AIMessage(content=full_response_content)
-                # 追加 AI 回复到 messages，更新当前状态（为下一轮对话做准备）
-                new_messages = current_state.messages.copy()
-                new_messages.append(final_ai_message)
-                current_state = AgentState(
-                    messages=new_messages
-                )
-
-            self.postgres_memory.save_message(state.session_id, "user", user_input)
-            self.postgres_memory.save_message(state.session_id, "assistant", full_response_content)
-            # 子步骤 2.6：准备下一轮输入，保持交互格式整洁
-            print("\n")
-            print("用户：", end="", flush=True)
-
-        # 步骤 3：循环终止，返回最终更新后的状态（包含完整循环对话历史）
         return AgentState(
-            messages=current_state.messages,
-            intermediate_steps=current_state.intermediate_steps
+            messages=await self.conversation_store.atrim_checkpoint(messages),
+            intermediate_steps=state.intermediate_steps,
+            session_id=state.session_id
+        )
+
+    def _prepare_turn(self, state: AgentState):
+        """步骤 1：封装用户输入为 HumanMessage，按 token 预算裁剪历史（从最新一轮向前填充）与知识库内容"""
+        new_human_message = HumanMessage(content=state.user_input)
+        fitted_history, knowledge_context, context_report = self.context_manager.fit(
+            state.messages,
+            system_prompt=self.prompt.content,
+            knowledge_context=state.knowledge_context,
+            user_input=state.user_input
         )
+        # 知识库内容按预算截断后作为系统消息放在历史之前
+        knowledge_messages = [SystemMessage(content=knowledge_context)] if knowledge_context else []
+        model_state = AgentState(
+            messages=knowledge_messages + fitted_history + [new_human_message],
+            intermediate_steps=state.intermediate_steps
+        )
+        return new_human_message, model_state, context_report
+
+    @staticmethod
+    def _consume_chunk(chunk, context_report) -> str:
+        """健壮提取子图输出块中的有效内容并打印，记录模型 prefill 耗时与实际输入 token 数"""
+        try:
+            model_message = chunk['model']['messages'][0]
+            current_content = model_message.content
+            context_report.record_prefill(model_message)
+        except (IndexError, KeyError):
+            current_content = ""
+        if current_content:
+            print("AI: "+current_content, end="", flush=True)
+        return current_content
+
+    def _finish_turn(self, state: AgentState, new_human_message: HumanMessage, full_response_content: str,
+                     context_report) -> List[BaseMessage]:
+        """步骤 3：追加本轮问答（关键：维护上下文）"""
+        messages = state.messages + [new_human_message]
+        if full_response_content:
+            messages.append(AIMessage(content=full_response_content))
+
+        self.last_context_report = context_report
+        if CONTEXT_REPORT_DEBUG:
+            print("\n" + context_report.summary(), end="", flush=True)
+        return messages
 
     def _build_langgraph(self) -> CompiledStateGraph:
         """构建 LangGraph 流程（保留你的骨架，嵌入 create_agent() 生成的 Agent 核心）"""
@@ -196,10 +241,12 @@ class OllamaAgent:
         graph = StateGraph(AgentState)
 
         # 2. 保留你的核心节点（现在节点内部调用 create_agent() 生成的 Agent 子图）
-        graph.add_node("ollama_agent", self.agent_node)
+        graph.add_node("load_memory", self._load_memory_node)
+        graph.add_node("ollama_agent", RunnableLambda(self.agent_node, afunc=self.aagent_node))
 
         # 3. 保留你的流程边定义（可扩展多节点，如添加 RAG 节点、校验节点）
-        graph.add_edge(START, "ollama_agent")
+        graph.add_edge(START, "load_memory")
+        graph.add_edge("load_memory", "ollama_agent")
         graph.add_edge("ollama_agent", END)
 
         # 4. （可选）若需扩展多节点，可继续添加，例如：
@@ -207,7 +254,7 @@ class OllamaAgent:
         # graph.add_edge("ollama_agent", "rag_node")
         # graph.add_edge("rag_node", END)
 
-        compiled_graph = graph.compile()
+        compiled_graph = graph.compile(checkpointer=self.checkpointer)
         return compiled_graph
 
     # 5. 编译完整图（对外提供入口）
@@ -216,24 +263,20 @@ class OllamaAgent:
     #     graph = self._build_langgraph()
     #     return graph.compile()
 
-    def run(self) -> str:
+    def run(self) -> AgentState:
         """
         对外统一接口：运行Ollama Agent+LangGraph+自动记忆
+        每轮用户输入运行一次图，直到用户输入「exit/退出」
 
-        :return: Agent最终回复
+        :return: 最后一轮的图状态
         """
-        initial_inputs = AgentState(messages=[])
-        # graph_config = {
-        #     "configurable": {"thread_id": "agent_session_001"}
-        # }
-
-        # 执行LangGraph流程，自动加载记忆+流程状态
-        print("AI 回复：", end="\n", flush=True)
-        res = self.graph.get_state(self.session_config)
-        final_state = self.graph.invoke(input=initial_inputs, config=self.session_config)
-        # final_response = final_state["messages"][-1].content
-        res=self.graph.get_state(self.session_config)
-        print(final_state, end="\n")
+        session_id = "debug_test_001"
+        final_state = None
+        print("=== 进入对话（输入 'exit' 或 '退出' 结束对话）===")
+        while (user_input := self.read_user_input()) is not None:
+            # 只传 session_id 与本轮输入：开启检查点时历史随检查点恢复，不会被空消息列表覆盖
+            final_state = self.graph.invoke(input=self.conversation_store.graph_input(session_id, user_input),
+                                            config=self.session_config)
         return final_state
 
 # ===================== 测试用例（Ollama自定义模型专属） =====================
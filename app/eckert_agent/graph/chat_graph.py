@@ -1,5 +1,6 @@
+import asyncio
 from anyio.lowlevel import checkpoint
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import SystemMessage, HumanMessage
@@ -11,7 +12,6 @@ from app.eckert_agent.memory.knowledge_retriever import KnowledgeRetriever
 from app.eckert_agent.model.ollama import OllamaModel
 from app.eckert_agent.memory.chat_memory import ChatMemory
 from app.eckert_agent.prompts.PromptTemplateManager import PromptTemplateManager
-from app.eckert_agent.memory.pg_checkpointer import get_postgres_checkpointer
 
 # 定义LangGraph状态结构（独立在模块内）
 # 必要导入
@@ -66,20 +66,31 @@ class ChatGraph:
         )
         # 初始化独立ReActAgent
         self.agent = OllamaAgent()
-        self.compiled_graph = self._build_graph()
+        # 对话存储与 Agent 共用：检查点权威时历史随检查点恢复，chat_memory 只作投影
+        self.conversation_store = self.agent.conversation_store
+        self.compiled_graph = self._build_graph(self.conversation_store.checkpointer())
+        # 异步运行使用异步检查点存储，首次 arun 时编译
+        self.acompiled_graph = None if self.conversation_store.uses_checkpoint else self.compiled_graph
 
     def _load_memory_node(self, state: AgentState) -> AgentState:
-        """节点1：加载数据库记忆"""
-        res= self.postgres_memory.get_history_as_messages(state.session_id)
-        state.messages.extend(res)
+        """节点1：加载数据库记忆（检查点已恢复历史时不读库）；按 token 预算裁剪由 agent_node 每轮结合用户输入完成"""
+        res = self.conversation_store.load_history(state.session_id, state.messages)
+        return self._extend_history(state, res)
+
+    async def _aload_memory_node(self, state: AgentState) -> AgentState:
+        """节点1（异步图运行时）：通过异步连接池加载记忆，不阻塞事件循环"""
+        res = await self.conversation_store.aload_history(state.session_id, state.messages)
+        return self._extend_history(state, res)
+
+    @staticmethod
+    def _extend_history(state: AgentState, res) -> AgentState:
+        if res:
+            state.messages.extend(res)
         return state
 
     def _search_knowledge_node(self, state: AgentState) -> AgentState:
-        """新增节点2：检索知识库"""
-        # user_input = state.messages[0].content
-        # # 检索并格式化知识库内容
-        # state["knowledge_context"] = self.knowledge_retriever.format_knowledge(user_input)
-        # print(f"\n{state['knowledge_context']}\n")  # 可选：打印检索结果，便于调试
+        """节点2：按本轮用户输入检索知识库，结果由 agent_node 按 token 预算截断后送入模型"""
+        state.knowledge_context = self.knowledge_retriever.format_knowledge(state.user_input) if state.user_input else ""
         return state
 
     def _chat_node(self, state: AgentState) -> AgentState:
@@ -109,17 +120,18 @@ class ChatGraph:
             print(chunk, end="", flush=True)
         print("\n")
 
-        self.postgres_memory.save_message(state["session_id"], "user", state["user_input"])
-        self.postgres_memory.save_message(state["session_id"], "assistant", full_response)
+        self.postgres_memory.save_turn(state["session_id"], state["user_input"], full_response)
         state["assistant_response"] = full_response.strip()
         return state
 
-    def _build_graph(self):
+    def _build_graph(self, checkpointer=None):
         """构建并编译LangGraph（内部方法）"""
         graph = StateGraph(AgentState)
         # 添加节点
-        graph.add_node("load_memory", self._load_memory_node)
-        graph.add_node("chat", self.agent.agent_node)
+        # 同步运行走 _load_memory_node，ainvoke/astream 运行走 _aload_memory_node
+        graph.add_node("load_memory", RunnableLambda(self._load_memory_node, afunc=self._aload_memory_node))
+        # 同步运行走 agent_node，异步运行走 aagent_node（astream 流式生成与异步记忆读写在同一事件循环上交错）
+        graph.add_node("chat", RunnableLambda(self.agent.agent_node, afunc=self.agent.aagent_node))
         graph.add_node("search_knowledge", self._search_knowledge_node)
         # 定义流程
         graph.add_edge(START, "load_memory")
@@ -128,16 +140,30 @@ class ChatGraph:
         graph.add_edge("search_knowledge", "chat")
         graph.add_edge("chat", END)
         # 编译图
-        # memory=get_postgres_checkpointer()
-        compiled_graph = graph.compile()
+        compiled_graph = graph.compile(checkpointer=checkpointer)
         return compiled_graph
 
     def run(self) -> AgentState:
-        """对外暴露的运行方法"""
-        initial_state = AgentState(messages=[])
-        initial_state.session_id="eckert_001"
-        # session_config = RunnableConfig(configurable={"thread_id": "eckert_001"})
-        return self.compiled_graph.invoke(initial_state)
+        """对外暴露的运行方法：每轮用户输入运行一次图（开启检查点时每轮落一次检查点）"""
+        session_id = "eckert_001"
+        session_config = RunnableConfig(configurable={"thread_id": session_id})
+        final_state = None
+        while (user_input := self.agent.read_user_input()) is not None:
+            final_state = self.compiled_graph.invoke(self.conversation_store.graph_input(session_id, user_input),
+                                                     config=session_config)
+        return final_state
+
+    async def arun(self) -> AgentState:
+        """异步运行：记忆读写走异步连接池"""
+        if self.acompiled_graph is None:
+            self.acompiled_graph = self._build_graph(await self.conversation_store.acheckpointer())
+        session_id = "eckert_001"
+        session_config = RunnableConfig(configurable={"thread_id": session_id})
+        final_state = None
+        while (user_input := await asyncio.to_thread(self.agent.read_user_input)) is not None:
+            final_state = await self.acompiled_graph.ainvoke(
+                self.conversation_store.graph_input(session_id, user_input), config=session_config)
+        return final_state
 
     def add_knowledge_doc(self, title: str, content: str, keywords: str = ""):
         self.knowledge_retriever.add_knowledge(title, content, keywords)
\ No newline at end of file
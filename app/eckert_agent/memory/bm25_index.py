@@ -0,0 +1,200 @@
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import BM25_K1, BM25_B
+from app.eckert_agent.memory.index_file import TermTable, pack_strings
+
+# 英文/数字/下划线按整词（工具名、函数名等精确匹配），中文等其余文字按连续片段切字符二元组，标点忽略
+_TOKEN_PATTERN = re.compile(r"[a-z0-9_]+|[^\W0-9_a-z]+")
+_WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+# 待合并的倒排记录超过该数量（且超过已合并部分的 10%）时合并进主倒排表
+_COMPACT_MIN_PENDING = 100_000
+# 单个词频上限（uint8 存储；BM25 词频项本身饱和，截断不影响排序）
+_MAX_TF = 255
+
+
+def ngram_terms(text: str) -> List[str]:
+    """切词：英文数字整词 + 其余字符的二元组（长度为 1 的片段保留单字），不需要中文分词器"""
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if _WORD_PATTERN.fullmatch(token) or len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+class BM25Index:
+    """
+    进程内 BM25 索引（字符二元组，适合没有 zhparser 的中文全文检索）
+    倒排表为数组存储：所有词的倒排记录拼成两个连续数组（文档行号 int32、词频 uint8），
+    offsets[term]:offsets[term+1] 为该词的倒排区间，每条记录 5 字节；
+    新增文档先追加到待合并数组（array 模块，紧凑存储），积累到一定量后排序合并进主倒排表
+    从索引文件加载时（from_sections）倒排表与词表直接引用映射内存，只有文档 id/长度数组复制到内存（每篇 12 字节）
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        # 词 → 词 id：索引文件中的词表（只读，二分查找）+ 之后出现的新词（id 接在文件词表之后）
+        self._frozen_vocab: Optional[TermTable] = None
+        self.vocab: Dict[str, int] = {}
+        self._doc_ids = array("q")
+        self._doc_lens = array("I")
+        self._total_len = 0
+        # 主倒排表（CSR）
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int32)
+        self._tfs = np.empty(0, dtype=np.uint8)
+        # 待合并的倒排记录
+        self._pending_terms = array("i")
+        self._pending_rows = array("i")
+        self._pending_tfs = array("B")
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    @property
+    def postings(self) -> int:
+        return len(self._rows) + len(self._pending_rows)
+
+    @property
+    def vocab_size(self) -> int:
+        return len(self.vocab) + (len(self._frozen_vocab) if self._frozen_vocab is not None else 0)
+
+    def _term_id(self, term: str) -> Optional[int]:
+        if self._frozen_vocab is not None:
+            term_id = self._frozen_vocab.get(term)
+            if term_id is not None:
+                return term_id
+        return self.vocab.get(term)
+
+    def memory_bytes(self) -> int:
+        """倒排表与文档数组占用的字节数（不含词表字典）"""
+        arrays = (self._offsets, self._rows, self._tfs)
+        pending = (self._pending_terms, self._pending_rows, self._pending_tfs, self._doc_ids, self._doc_lens)
+        return sum(a.nbytes for a in arrays) + sum(a.itemsize * len(a) for a in pending)
+
+    def add(self, doc_ids: Sequence[int], texts: Sequence[str]):
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                row = len(self._doc_ids)
+                terms = ngram_terms(text)
+                self._doc_ids.append(doc_id)
+                self._doc_lens.append(len(terms))
+                self._total_len += len(terms)
+                for term, tf in Counter(terms).items():
+                    term_id = self._term_id(term)
+                    if term_id is None:
+                        term_id = self.vocab[term] = self.vocab_size
+                    self._pending_terms.append(term_id)
+                    self._pending_rows.append(row)
+                    self._pending_tfs.append(min(tf, _MAX_TF))
+            if len(self._pending_rows) >= max(_COMPACT_MIN_PENDING, len(self._rows) // 10):
+                self._compact()
+
+    def compact(self):
+        """把待合并的倒排记录排序合并进主倒排表"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        if not self._pending_rows:
+            return
+        counts = np.diff(self._offsets)
+        terms = np.concatenate([
+            np.repeat(np.arange(len(counts), dtype=np.int32), counts),
+            np.frombuffer(self._pending_terms, dtype=np.int32),
+        ])
+        rows = np.concatenate([self._rows, np.frombuffer(self._pending_rows, dtype=np.int32)])
+        tfs = np.concatenate([self._tfs, np.frombuffer(self._pending_tfs, dtype=np.uint8)])
+        # 稳定排序：同一个词内行号保持递增
+        order = np.argsort(terms, kind="stable")
+        self._rows, self._tfs = rows[order], tfs[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=self.vocab_size))]).astype(np.int64)
+        self._pending_terms, self._pending_rows, self._pending_tfs = array("i"), array("i"), array("B")
+
+    def _postings(self, term_id: int, pending_terms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        rows, tfs = [], []
+        if term_id + 1 < len(self._offsets):
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            rows.append(self._rows[start:end])
+            tfs.append(self._tfs[start:end])
+        if len(pending_terms):
+            hit = pending_terms == term_id
+            rows.append(np.frombuffer(self._pending_rows, dtype=np.int32)[hit])
+            tfs.append(np.frombuffer(self._pending_tfs, dtype=np.uint8)[hit])
+        if not rows:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint8)
+        return np.concatenate(rows), np.concatenate(tfs)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """返回 [(文档 id, BM25 分数)]，按分数从高到低"""
+        with self._lock:
+            total = len(self._doc_ids)
+            term_ids = [term_id for term_id in map(self._term_id, dict.fromkeys(ngram_terms(query)))
+                        if term_id is not None]
+            if not total or not term_ids:
+                return []
+            avg_len = self._total_len / total
+            doc_lens = np.frombuffer(self._doc_lens, dtype=np.uint32)
+            pending_terms = np.frombuffer(self._pending_terms, dtype=np.int32)
+            all_rows, all_scores = [], []
+            for term_id in term_ids:
+                rows, tfs = self._postings(term_id, pending_terms)
+                if not len(rows):
+                    continue
+                idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+                tfs = tfs.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * doc_lens[rows] / avg_len)
+                all_rows.append(rows)
+                all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+            if not all_rows:
+                return []
+            rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+            keep = np.argsort(-scores, kind="stable")[:top_k]
+            doc_ids = np.frombuffer(self._doc_ids, dtype=np.int64)
+            return [(int(doc_ids[rows[i]]), float(scores[i])) for i in keep]
+
+    def sections(self) -> Dict[str, np.ndarray]:
+        """
+        写入索引文件的段（先合并待合并记录）：词表按 utf-8 字节序排序后重新编号（加载时二分查找，不建字典），
+        倒排区间随之重排；另有文档 id、文档长度与总长度
+        """
+        with self._lock:
+            self._compact()
+            frozen = list(self._frozen_vocab.terms()) if self._frozen_vocab is not None else []
+            terms = frozen + sorted(self.vocab, key=self.vocab.get)
+            order = np.array(sorted(range(len(terms)), key=lambda i: terms[i].encode("utf-8")), dtype=np.int64)
+            counts = np.diff(self._offsets)[order]
+            offsets = np.zeros(len(order) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            # 新编号第 j 个词的倒排区间取自旧编号 order[j] 的区间
+            take = np.repeat(self._offsets[:-1][order] - offsets[:-1], counts) + np.arange(offsets[-1])
+            term_blob, term_offsets = pack_strings(terms[i] for i in order.tolist())
+            return {
+                "bm25_terms": term_blob, "bm25_term_offsets": term_offsets,
+                "bm25_offsets": offsets, "bm25_rows": self._rows[take], "bm25_tfs": self._tfs[take],
+                "bm25_doc_ids": np.frombuffer(self._doc_ids, dtype=np.int64).copy(),
+                "bm25_doc_lens": np.frombuffer(self._doc_lens, dtype=np.uint32).copy(),
+                "bm25_total_len": np.array([self._total_len], dtype=np.int64),
+            }
+
+    @classmethod
+    def from_sections(cls, sections: Mapping[str, np.ndarray], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        index = cls(k1, b)
+        index._frozen_vocab = TermTable(sections["bm25_terms"], sections["bm25_term_offsets"])
+        index._offsets, index._rows, index._tfs = (
+            sections["bm25_offsets"], sections["bm25_rows"], sections["bm25_tfs"])
+        index._doc_ids = array("q", sections["bm25_doc_ids"].tobytes())
+        index._doc_lens = array("I", sections["bm25_doc_lens"].tobytes())
+        index._total_len = int(sections["bm25_total_len"][0])
+        return index
@@ -1,33 +1,82 @@
 
-from langchain_core.messages import HumanMessage, AIMessage
-from typing import List, Dict
-from config import PG_HOST, PG_PORT, PG_USER, PG_PASSWORD, PG_DB, MAX_MEMORY_LEN
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from typing import List, Dict, Optional, Sequence, Tuple
+from config import MAX_MEMORY_LEN
+from config import SUMMARY_ENABLED, SUMMARY_TRIGGER_LEN, SUMMARY_KEEP_RECENT, HISTORY_CACHE_ENABLED, WRITE_BEHIND_ENABLED
+from config import CHAT_MEMORY_PARTITIONING
+from app.eckert_agent.memory.chat_memory_partitions import ChatMemoryPartitionManager
+from app.eckert_agent.memory.conversation_summarizer import ConversationSummarizer, SUMMARY_ROLE, summary_message
+from app.eckert_agent.memory.pg_pool import (
+    PG_CONN_PARAMS, pooled_connection, apooled_connection, autocommit_connection, create_index_concurrently,
+)
+from app.eckert_agent.memory.session_cache import SessionHistoryCache, get_session_cache
+from app.eckert_agent.memory.write_behind import WriteBehindQueue, flush_session, get_write_behind_queue
 from langchain_core.chat_history import BaseChatMessageHistory
 import psycopg  # 核心导入，替代 psycopg2
 from psycopg import OperationalError, ProgrammingError  # 异常类导入路径不变（兼容）
 from psycopg.rows import dict_row
+
+# 读取会话滚动摘要
+_SUMMARY_SQL = "SELECT content FROM chat_memory WHERE session_id = %s AND role = %s"
+
+
 class ChatMemory(BaseChatMessageHistory):
-    """ChatMemory 对话记忆封装类"""
-
-    def __init__(self):
-        self.conn_params = {
-            "host": PG_HOST,
-            "port": PG_PORT,
-            "user": PG_USER,
-            "password": PG_PASSWORD,
-            "dbname": PG_DB
-        }
+    """
+    ChatMemory 对话记忆封装类
+    开启滚动摘要时不再按 MAX_MEMORY_LEN 直接删除旧消息，而是由后台任务把较早的轮次折叠进
+    每个会话唯一的摘要行（role=summary），读取历史时返回 摘要 + 最近的原文
+    读取经过进程内会话历史缓存（写穿），热点会话的连续对话不需要回读数据库
+    可选异步落库（WRITE_BEHIND_ENABLED）：save_turn(defer=True) 只入队即返回，由后台线程批量写入，
+    读取历史前会先等待该会话未落库的消息写完
+    同步接口走同步连接池；a 开头的异步接口（aget_messages / aadd_messages / aclear / asave_turn 等）
+    走异步连接池，不阻塞事件循环，可与 LLM 流式输出并行
+    """
+    # 后台摘要任务：全进程共用一个工作线程，同一会话同时只排一个任务
+    _compact_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-memory-compact")
+    _compact_pending = set()
+    _compact_lock = threading.Lock()
+    # 建表/建索引每个进程只执行一次
+    _table_ready = False
+
+    def __init__(self, summarizer: Optional[ConversationSummarizer] = None,
+                 history_cache: Optional[SessionHistoryCache] = None, session_id: Optional[str] = None):
+        """
+        :param summarizer: 自定义摘要器，不传时按配置创建；SUMMARY_ENABLED=false 时不做摘要
+        :param history_cache: 会话历史缓存，不传时使用进程内共享缓存；HISTORY_CACHE_ENABLED=false 时不缓存
+        :param session_id: 默认会话 ID（clear 等不带会话参数的接口使用）
+        """
+        self.conn_params = PG_CONN_PARAMS
         self.table_name="chat_memory"
         self.max_memory_len = MAX_MEMORY_LEN
+        self.summary_trigger_len = SUMMARY_TRIGGER_LEN
+        self.summary_keep_recent = SUMMARY_KEEP_RECENT
+        self.summarizer = summarizer or (ConversationSummarizer() if SUMMARY_ENABLED else None)
+        # 默认读取条数：开启摘要时未摘要消息最多约 summary_trigger_len 条，否则为 max_memory_len
+        self.history_limit = max(self.max_memory_len, self.summary_trigger_len) if self.summarizer else self.max_memory_len
+        self.history_cache = history_cache or (get_session_cache() if HISTORY_CACHE_ENABLED else None)
+        self.session_id = session_id
+        # 异步落库队列进程内共用，入队时带上本实例的 save_batch
+        self.write_behind: Optional[WriteBehindQueue] = get_write_behind_queue() if WRITE_BEHIND_ENABLED else None
+        if not ChatMemory._table_ready:
+            self._init_table()
+            ChatMemory._table_ready = True
 
     def _get_connection(self):
-        """获取数据库连接（内部方法）"""
-        try:
-            return psycopg.connect(**self.conn_params)
-        except psycopg.OperationalError as e:
-            raise Exception(f"ChatMemory 连接失败：{str(e)}")
+        """从共享连接池借出连接（内部方法，with 退出时提交并归还）"""
+        return pooled_connection("ChatMemory")
+
+    def _aget_connection(self):
+        """从异步连接池借出连接（内部方法，async with 退出时提交并归还）"""
+        return apooled_connection("ChatMemory")
 
     def _init_table(self):
+        """
+        建表：表不存在时连同索引一起创建（空表建索引不阻塞）；已有表只检查索引，
+        缺少时提示执行 python chat_memory_cli.py migrate-indexes（CONCURRENTLY 在线建索引），启动时不做锁表的 DDL
+        """
         create_sql = f"""
         CREATE TABLE IF NOT EXISTS chat_memory (
             id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
@@ -37,72 +86,345 @@ class ChatMemory(BaseChatMessageHistory):
             created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP 
         );
         
-         
-        CREATE INDEX IF NOT EXISTS idx_chat_memory_session_id ON chat_memory (session_id);
+        -- 历史读取、裁剪、摘要都按 (session_id, id) 走索引
+        CREATE INDEX IF NOT EXISTS idx_chat_memory_session_id_id ON chat_memory (session_id, id DESC);
         """
-        with psycopg.connect(**self.conn_params) as conn:
+        if CHAT_MEMORY_PARTITIONING != "none":
+            # 分区表：表不存在时建表与分区，已有表只检查；补建分区与清理由后台维护（start_partition_maintenance）完成
+            with self._get_connection() as conn:
+                with conn.cursor() as cur:
+                    ChatMemoryPartitionManager().ensure_schema(cur)
+                conn.commit()
+            return
+        with self._get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(create_sql)
+                cur.execute("SELECT to_regclass('chat_memory'), to_regclass('idx_chat_memory_session_id_id')")
+                table, index = cur.fetchone()
+                if table is None:
+                    cur.execute(create_sql)
+                elif index is None:
+                    print("❌ chat_memory 缺少 (session_id, id) 复合索引，历史读取会变慢，"
+                          "请执行 python chat_memory_cli.py migrate-indexes")
             conn.commit()
+
     def save_message(self, session_id: str, role: str, content: str):
         """保存单条对话消息到数据库"""
-        if role not in ["user", "assistant"]:
-            raise ValueError("角色只能是 user 或 assistant")
+        self.save_messages(session_id, [{"role": role, "content": content}])
 
+    def save_turn(self, session_id: str, user_input: str, assistant_response: str, defer: bool = False):
+        """
+        保存一轮对话（用户输入 + 助手回复），一次往返写入
+        :param defer: 为 True 且开启了异步落库时只入队即返回（队列满时按配置阻塞或抛 WriteBehindFullError）
+        """
+        messages = [
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": assistant_response},
+        ]
+        if defer and self.write_behind is not None:
+            self.write_behind.enqueue(session_id, messages, self.save_batch)
+            return
+        self.save_messages(session_id, messages)
+
+    def save_batch(self, batches: List[Tuple[str, List[Dict]]]):
+        """
+        多个会话的消息一次事务写入（异步落库队列的写入函数）：每个会话一条语句，整批以 pipeline 模式发送
+        :param batches: [(session_id, [role+content 消息, ...]), ...]
+        """
+        statements = [(session_id, *self._save_statement(session_id, messages))
+                      for session_id, messages in batches if messages]
+        if not statements:
+            return
+        results = []
         with self._get_connection() as conn:
-            with conn.cursor() as cur:
-                # 插入新消息
-                cur.execute(
-                    """
+            with conn.pipeline():
+                cursors = []
+                for _, sql, params, _ in statements:
+                    cur = conn.cursor()
+                    cur.execute(sql, params)
+                    cursors.append(cur)
+                conn.commit()
+                for cur in cursors:
+                    results.append(cur.fetchone())
+                    cur.close()
+        # 已提交后的缓存/摘要处理出错不能让调用方重试写入，否则会重复落库
+        for (session_id, _, _, messages), (ids, unsummarized) in zip(statements, results):
+            try:
+                self._after_save(session_id, messages, ids, unsummarized)
+            except Exception as e:
+                print(f"❌ 会话 {session_id} 写入后处理失败：{str(e)}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待异步落库队列中的消息全部写完（未开启时直接返回）；有消息写入失败时返回 False"""
+        return self.write_behind.flush(timeout) if self.write_behind is not None else True
+
+    def save_messages(self, session_id: str, messages: List[Dict]):
+        """
+        批量保存消息（role+content，时间正序）：单条多行 INSERT + 裁剪/计数合并为一条语句，
+        与 BEGIN/COMMIT 一起以 pipeline 模式发送，整批只需一次网络往返
+        - 未开启滚动摘要：按 id 阈值删除超出 max_memory_len 的旧消息（走 session_id + id 索引）
+        - 开启滚动摘要：返回未摘要消息数，超过阈值时交给后台折叠
+        """
+        if not messages:
+            return
+        sql, params, messages = self._save_statement(session_id, messages)
+        with self._get_connection() as conn:
+            with conn.pipeline():
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    conn.commit()
+                    ids, unsummarized = cur.fetchone()
+        self._after_save(session_id, messages, ids, unsummarized)
+
+    def _save_statement(self, session_id: str, messages: List[Dict]) -> Tuple[str, List, List[Dict]]:
+        """构建批量保存语句，返回 (sql, 参数, 实际写入的消息)"""
+        for message in messages:
+            if message["role"] not in ["user", "assistant"]:
+                raise ValueError("角色只能是 user 或 assistant")
+        if self.summarizer is None:
+            # 超出上限的部分插入后也会被删除，直接只写最新的 max_memory_len 条
+            messages = messages[-self.max_memory_len:]
+
+        values_sql = ", ".join(["(%s, %s, %s)"] * len(messages))
+        params = [v for message in messages for v in (session_id, message["role"], message["content"])]
+        # 返回新行 id（写穿缓存用）与未摘要消息数；
+        # CTE 中的 INSERT 与主语句共享快照，主语句看不到新插入的行，计数时按新行数修正
+        if self.summarizer is not None:
+            sql = f"""
+                WITH inserted AS (
                     INSERT INTO chat_memory (session_id, role, content)
-                    VALUES (%s, %s, %s)
-                    """,
-                    (session_id, role, content)
+                    VALUES {values_sql}
+                    RETURNING id
                 )
-                # 清理超出长度的历史
-                cur.execute(
-                    """
+                SELECT (SELECT array_agg(id ORDER BY id) FROM inserted),
+                       (SELECT count(*) FROM inserted)
+                     + (SELECT count(*) FROM chat_memory WHERE session_id = %s AND role <> %s)
+                """
+            params += [session_id, SUMMARY_ROLE]
+        else:
+            # 已有消息只需保留 max_memory_len - 新消息数 条：删除 id 不大于第 (该数 + 1) 新的那条
+            sql = f"""
+                WITH inserted AS (
+                    INSERT INTO chat_memory (session_id, role, content)
+                    VALUES {values_sql}
+                    RETURNING id
+                ),
+                trimmed AS (
                     DELETE
                     FROM chat_memory
                     WHERE session_id = %s
-                      AND id NOT IN (SELECT id
-                                     FROM chat_memory
-                                     WHERE session_id = %s
-                                     ORDER BY created_at DESC
-                        LIMIT %s
-                        )
-                    """,
-                    (session_id, session_id, self.max_memory_len)
+                      AND role <> %s
+                      AND id <= (SELECT id
+                                 FROM chat_memory
+                                 WHERE session_id = %s
+                                   AND role <> %s
+                                 ORDER BY id DESC
+                                 OFFSET %s LIMIT 1)
                 )
-            conn.commit()
+                SELECT (SELECT array_agg(id ORDER BY id) FROM inserted), 0
+                """
+            keep_existing = max(self.max_memory_len - len(messages), 0)
+            params += [session_id, SUMMARY_ROLE, session_id, SUMMARY_ROLE, keep_existing]
 
-    def clear(self) -> None:
+        return sql, params, messages
+
+    def _after_save(self, session_id: str, messages: List[Dict], ids: List[int], unsummarized: int):
+        """写入提交后：写穿会话缓存，未摘要消息超过阈值时提交后台摘要"""
+        if self.history_cache is not None:
+            self.history_cache.append_rows(
+                session_id,
+                [{"id": id_, "role": m["role"], "content": m["content"]} for id_, m in zip(ids, messages)],
+                self.history_limit
+            )
+        if unsummarized > self.summary_trigger_len:
+            self.schedule_compaction(session_id)
+
+    def clear(self, session_id: Optional[str] = None) -> None:
+        """清空会话的全部消息与摘要（不传时清空默认会话），同时使缓存失效"""
+        session_id = session_id or self.session_id
+        if session_id is None:
+            raise ValueError("未指定要清空的会话 ID")
+        if self.write_behind is not None:
+            # 先写完排队中的消息，避免清空后又被写回
+            flush_session(session_id)
         delete_sql = f"DELETE FROM {self.table_name} WHERE session_id = %s;"
-        with psycopg.connect(**self.conn_params) as conn:
+        with self._get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(delete_sql, (self.session_id,))
+                cur.execute(delete_sql, (session_id,))
             conn.commit()
-    def get_history(self, session_id: str) -> List[Dict]:
-        """获取原始对话历史（role+content），仅返回最新20条"""
+        if self.history_cache is not None:
+            self.history_cache.invalidate(session_id)
+    def get_history(self, session_id: str, limit: Optional[int] = None, before_id: Optional[int] = None) -> List[Dict]:
+        """
+        获取原始对话历史（id+role+content），按 (session_id, id DESC) 索引只读最新 limit 条
+        :param limit: 最多返回条数，默认 history_limit
+        :param before_id: 键集分页：只返回 id 小于它的消息（传上一页第一条的 id 读取更早的一页）
+        :return: 时间正序（早→晚）的消息列表
+        """
+        limit = limit or self.history_limit
+        if self.write_behind is not None:
+            flush_session(session_id)
+        cache = self.history_cache if before_id is None and limit <= self.history_limit else None
+        if cache is not None:
+            rows = cache.get_rows(session_id, limit, self.history_limit)
+            if rows is not None:
+                return rows
+            # 未命中时按缓存窗口读取并回填，之后更小的 limit 也能命中
+            version = cache.version(session_id)
+            rows = self._query_history(session_id, self.history_limit, None)
+            cache.store_rows(session_id, rows, self.history_limit, version)
+            return rows[-limit:]
+        return self._query_history(session_id, limit, before_id)
+
+    @staticmethod
+    def _history_statement(session_id: str, limit: int, before_id: Optional[int]) -> Tuple[str, List]:
+        params = [session_id, SUMMARY_ROLE]
+        # 分页条件只在需要时拼接，保证 id 上界能作为索引扫描的起点
+        before_sql = ""
+        if before_id is not None:
+            before_sql = "AND id < %s"
+            params.append(before_id)
+        params.append(limit)
+        sql = f"""
+            SELECT id, role, content
+            FROM (SELECT id, role, content
+                  FROM chat_memory
+                  WHERE session_id = %s
+                    AND role <> %s
+                    {before_sql}
+                  ORDER BY id DESC  -- 1. 先按 id 倒序走索引，只取最新 limit 条
+                  LIMIT %s) latest
+            ORDER BY id  -- 2. 在数据库内恢复为正序（早→晚），保证上下文逻辑连贯
+            """
+        return sql, params
+
+    def _query_history(self, session_id: str, limit: int, before_id: Optional[int]) -> List[Dict]:
+        sql, params = self._history_statement(session_id, limit, before_id)
         with self._get_connection() as conn:
             with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+
+    def get_summary(self, session_id: str) -> Optional[str]:
+        """获取会话的滚动摘要（没有时返回 None）"""
+        if self.history_cache is not None:
+            hit, summary = self.history_cache.get_summary(session_id)
+            if hit:
+                return summary
+            version = self.history_cache.version(session_id)
+            summary = self._query_summary(session_id)
+            self.history_cache.store_summary(session_id, summary, version)
+            return summary
+        return self._query_summary(session_id)
+
+    def _query_summary(self, session_id: str) -> Optional[str]:
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_SUMMARY_SQL, (session_id, SUMMARY_ROLE))
+                row = cur.fetchone()
+        return row[0] if row else None
+
+    def schedule_compaction(self, session_id: str):
+        """提交后台摘要任务（同一会话已在排队时忽略）"""
+        with ChatMemory._compact_lock:
+            if session_id in ChatMemory._compact_pending:
+                return
+            ChatMemory._compact_pending.add(session_id)
+        try:
+            ChatMemory._compact_executor.submit(self._compact_in_background, session_id)
+        except RuntimeError:
+            # 进程退出阶段（如异步落库队列最后一次写入）不再提交后台任务，下次写入时会重新触发
+            with ChatMemory._compact_lock:
+                ChatMemory._compact_pending.discard(session_id)
+
+    def _compact_in_background(self, session_id: str):
+        try:
+            self.compact(session_id)
+        except Exception as e:
+            print(f"❌ 会话 {session_id} 摘要失败：{str(e)}")
+        finally:
+            with ChatMemory._compact_lock:
+                ChatMemory._compact_pending.discard(session_id)
+
+    def compact(self, session_id: str) -> int:
+        """
+        把较早的轮次折叠进摘要行，保留最近 summary_keep_recent 条原文（从用户消息开始，保证整轮）
+        摘要生成（可能调用模型）在事务外进行，写入时用会话级 advisory 锁并校验摘要未被其他进程改写
+        :return: 折叠的消息条数
+        """
+        if self.summarizer is None:
+            return 0
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_SUMMARY_SQL, (session_id, SUMMARY_ROLE))
+                row = cur.fetchone()
+                previous_summary = row[0] if row else None
+                cur.execute(
+                    """
+                    SELECT id, role, content
+                    FROM chat_memory
+                    WHERE session_id = %s
+                      AND role <> %s
+                    ORDER BY id
+                    """,
+                    (session_id, SUMMARY_ROLE)
+                )
+                rows = cur.fetchall()
+        if len(rows) <= self.summary_trigger_len:
+            return 0
+        boundary = max(len(rows) - self.summary_keep_recent, 0)
+        # 保留部分从用户消息开始，避免把一轮对话拆成两半
+        while boundary < len(rows) and rows[boundary][1] != "user":
+            boundary += 1
+        folded = rows[:boundary]
+        if not folded:
+            return 0
+        summary = self.summarizer.summarize(
+            previous_summary,
+            [{"role": role, "content": content} for _, role, content in folded]
+        )
+
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{self.table_name}:{session_id}",))
+                cur.execute(_SUMMARY_SQL, (session_id, SUMMARY_ROLE))
+                row = cur.fetchone()
+                if (row[0] if row else None) != previous_summary:
+                    # 其他进程已完成摘要，放弃本次结果
+                    conn.rollback()
+                    return 0
                 cur.execute(
                     """
-                    SELECT role, content
+                    DELETE
                     FROM chat_memory
                     WHERE session_id = %s
-                    ORDER BY created_at DESC  -- 1. 先按时间倒序（最新的记录排在前面）
+                      AND (role = %s OR id <= %s)
+                    """,
+                    (session_id, SUMMARY_ROLE, folded[-1][0])
+                )
+                cur.execute(
+                    """
+                    INSERT INTO chat_memory (session_id, role, content)
+                    VALUES (%s, %s, %s)
                     """,
-                    (session_id,)
+                    (session_id, SUMMARY_ROLE, summary)
                 )
-                # 3. 反转结果，恢复为「创建时间正序」（早→晚），保证上下文逻辑连贯
-                latest_20_records = cur.fetchall()
-                return [dict(row) for row in latest_20_records]
+            conn.commit()
+        if self.history_cache is not None:
+            self.history_cache.invalidate(session_id)
+        print(f"✅ 会话 {session_id} 已折叠 {len(folded)} 条消息进摘要")
+        return len(folded)
 
     def get_history_as_messages(self, session_id: str) -> List:
-        """将历史转为LangChain消息对象（适配ChatPromptTemplate）"""
+        """将历史转为LangChain消息对象（适配ChatPromptTemplate），有滚动摘要时摘要放在最前面"""
         raw_history = self.get_history(session_id)
+        summary = self.get_summary(session_id) if self.summarizer is not None else None
+        return self._to_messages(summary, raw_history)
+
+    @staticmethod
+    def _to_messages(summary: Optional[str], raw_history: List[Dict]) -> List:
         messages = []
+        if summary:
+            messages.append(summary_message(summary))
         for msg in raw_history:
             if msg["role"] == "user":
                 messages.append(HumanMessage(content=msg["content"]))
@@ -110,6 +432,156 @@ class ChatMemory(BaseChatMessageHistory):
                 messages.append(AIMessage(content=msg["content"]))
         return messages
 
+    @staticmethod
+    def _from_messages(messages: Sequence[BaseMessage]) -> List[Dict]:
+        """LangChain 消息转为 role+content（只支持用户与助手消息）"""
+        rows = []
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                role = "user"
+            elif isinstance(message, AIMessage):
+                role = "assistant"
+            else:
+                raise ValueError(f"只能保存用户或助手消息，收到：{message.type}")
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            rows.append({"role": role, "content": content})
+        return rows
+
+    def _require_session(self) -> str:
+        if self.session_id is None:
+            raise ValueError("未指定会话 ID：请在创建 ChatMemory 时传入 session_id")
+        return self.session_id
+
+    # ========== BaseChatMessageHistory 接口（绑定 self.session_id） ==========
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.get_history_as_messages(self._require_session())
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.save_messages(self._require_session(), self._from_messages(messages))
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        return await self.aget_history_as_messages(self._require_session())
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        await self.asave_messages(self._require_session(), self._from_messages(messages))
+
+    # ========== 异步接口（异步连接池，不阻塞事件循环） ==========
+    async def asave_message(self, session_id: str, role: str, content: str):
+        await self.asave_messages(session_id, [{"role": role, "content": content}])
+
+    async def asave_turn(self, session_id: str, user_input: str, assistant_response: str, defer: bool = False):
+        """异步保存一轮对话（用户输入 + 助手回复），一次往返写入；defer 语义同 save_turn"""
+        messages = [
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": assistant_response},
+        ]
+        if defer and self.write_behind is not None:
+            # 队列满且策略为 block 时入队会等待，放到线程里不阻塞事件循环
+            await asyncio.to_thread(self.write_behind.enqueue, session_id, messages, self.save_batch)
+            return
+        await self.asave_messages(session_id, messages)
+
+    async def asave_messages(self, session_id: str, messages: List[Dict]):
+        """异步批量保存消息（语义同 save_messages）"""
+        if not messages:
+            return
+        sql, params, messages = self._save_statement(session_id, messages)
+        async with self._aget_connection() as conn:
+            async with conn.pipeline():
+                async with conn.cursor() as cur:
+                    await cur.execute(sql, params)
+                    await conn.commit()
+                    ids, unsummarized = await cur.fetchone()
+        self._after_save(session_id, messages, ids, unsummarized)
+
+    async def aget_history(self, session_id: str, limit: Optional[int] = None,
+                           before_id: Optional[int] = None) -> List[Dict]:
+        """异步读取原始对话历史（语义同 get_history，同样经过会话缓存）"""
+        limit = limit or self.history_limit
+        if self.write_behind is not None:
+            await asyncio.to_thread(flush_session, session_id)
+        cache = self.history_cache if before_id is None and limit <= self.history_limit else None
+        if cache is not None:
+            rows = cache.get_rows(session_id, limit, self.history_limit)
+            if rows is not None:
+                return rows
+            version = cache.version(session_id)
+            rows = await self._aquery_history(session_id, self.history_limit, None)
+            cache.store_rows(session_id, rows, self.history_limit, version)
+            return rows[-limit:]
+        return await self._aquery_history(session_id, limit, before_id)
+
+    async def _aquery_history(self, session_id: str, limit: int, before_id: Optional[int]) -> List[Dict]:
+        sql, params = self._history_statement(session_id, limit, before_id)
+        async with self._aget_connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(sql, params)
+                return await cur.fetchall()
+
+    async def aget_summary(self, session_id: str) -> Optional[str]:
+        """异步获取会话的滚动摘要"""
+        if self.history_cache is not None:
+            hit, summary = self.history_cache.get_summary(session_id)
+            if hit:
+                return summary
+            version = self.history_cache.version(session_id)
+            summary = await self._aquery_summary(session_id)
+            self.history_cache.store_summary(session_id, summary, version)
+            return summary
+        return await self._aquery_summary(session_id)
+
+    async def _aquery_summary(self, session_id: str) -> Optional[str]:
+        async with self._aget_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(_SUMMARY_SQL, (session_id, SUMMARY_ROLE))
+                row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def aget_history_as_messages(self, session_id: str) -> List:
+        """异步读取历史并转为 LangChain 消息对象"""
+        raw_history = await self.aget_history(session_id)
+        summary = await self.aget_summary(session_id) if self.summarizer is not None else None
+        return self._to_messages(summary, raw_history)
+
+    async def aclear(self, session_id: Optional[str] = None) -> None:
+        """异步清空会话的全部消息与摘要"""
+        session_id = session_id or self._require_session()
+        if self.write_behind is not None:
+            await asyncio.to_thread(flush_session, session_id)
+        async with self._aget_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"DELETE FROM {self.table_name} WHERE session_id = %s;", (session_id,))
+            await conn.commit()
+        if self.history_cache is not None:
+            self.history_cache.invalidate(session_id)
+
 # 记忆获取函数，供RunnableWithMessageHistory调用
 def get_postgres_memory() -> ChatMemory:
-    return ChatMemory()
\ No newline at end of file
+    return ChatMemory()
+
+
+def migrate_indexes() -> Dict:
+    """
+    chat_memory 索引迁移（一次性，可在线执行）：CONCURRENTLY 创建 (session_id, id DESC) 复合索引，
+    再删除被它覆盖的 session_id 单列索引，期间不阻塞读写；分区表建表时已带索引，无需迁移
+    :return: 是否新建了复合索引、是否删除了旧索引
+    """
+    with autocommit_connection("ChatMemory 索引迁移") as conn:
+        with conn.cursor() as cur:
+            kind = ChatMemoryPartitionManager().partition_kind(cur)
+        if kind is None:
+            raise Exception("chat_memory 表不存在，请先启动一次应用建表")
+        if kind != "none":
+            print(f"✅ chat_memory 为 {kind} 分区表，建表时已带索引，无需迁移")
+            return {"created": False, "dropped": False}
+        created = create_index_concurrently(
+            conn, "idx_chat_memory_session_id_id",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chat_memory_session_id_id ON chat_memory (session_id, id DESC)"
+        )
+        dropped = conn.execute("SELECT to_regclass('idx_chat_memory_session_id')").fetchone()[0] is not None
+        if dropped:
+            conn.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_chat_memory_session_id")
+    print(f"✅ chat_memory 索引迁移完成：{'新建' if created else '已有'}复合索引，"
+          f"{'已删除' if dropped else '没有'}旧的 session_id 单列索引")
+    return {"created": created, "dropped": dropped}
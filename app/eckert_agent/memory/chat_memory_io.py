@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime, timezone
+from typing import Dict, IO, Iterable, List, Optional
+
+from app.eckert_agent.memory.conversation_summarizer import SUMMARY_ROLE
+from app.eckert_agent.memory.pg_pool import pooled_connection
+from app.eckert_agent.memory.session_cache import get_session_cache
+
+TRANSFER_FORMATS = ("ndjson", "csv")
+EXPORT_COLUMNS = ("id", "session_id", "role", "content", "created_at")
+IMPORT_COLUMNS = ("session_id", "role", "content", "created_at")
+IMPORT_ROLES = ("user", "assistant", SUMMARY_ROLE)
+
+
+def _export_query(session_ids: Optional[List[str]], since: Optional[datetime], until: Optional[datetime]):
+    """拼接导出查询（只拼接固定的条件片段，取值全部走参数）"""
+    conditions, params = [], []
+    if session_ids:
+        conditions.append("session_id = ANY(%s)")
+        params.append(list(session_ids))
+    if since is not None:
+        conditions.append("created_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("created_at < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM chat_memory {where} ORDER BY session_id, id"
+    return query, params
+
+
+def export_sessions(output: IO[bytes], fmt: str = "ndjson", session_ids: Optional[List[str]] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict:
+    """
+    通过 COPY ... TO STDOUT 流式导出会话历史（按会话、消息顺序），内存占用与总行数无关
+    - csv：服务端直接生成 CSV（带表头），原样写入 output
+    - ndjson：逐行解码 COPY 数据，每条消息一行 JSON
+    :param output: 二进制输出流（文件或 sys.stdout.buffer）
+    :param session_ids: 只导出指定会话，默认全部
+    :param since / until: 按 created_at 过滤的时间范围 [since, until)
+    :return: 导出行数、耗时、行/秒
+    """
+    if fmt not in TRANSFER_FORMATS:
+        raise ValueError(f"导出格式只能是 {' / '.join(TRANSFER_FORMATS)}")
+    query, params = _export_query(session_ids, since, until)
+    rows = 0
+    start = time.perf_counter()
+    with pooled_connection("ChatMemory 导出") as conn:
+        with conn.cursor() as cur:
+            if fmt == "csv":
+                copy_sql = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+                with cur.copy(copy_sql, params) as copy:
+                    for data in copy:
+                        output.write(data)
+                rows = cur.rowcount
+            else:
+                with cur.copy(f"COPY ({query}) TO STDOUT", params) as copy:
+                    copy.set_types(["int8", "text", "text", "text", "timestamptz"])
+                    for row in copy.rows():
+                        record = dict(zip(EXPORT_COLUMNS, row))
+                        record["created_at"] = record["created_at"].isoformat()
+                        output.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+                        rows += 1
+    elapsed = time.perf_counter() - start
+    return {"rows": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed) if elapsed else 0}
+
+
+def _ndjson_records(source: IO[bytes]) -> Iterable[Dict]:
+    for line_no, line in enumerate(source, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise Exception(f"第 {line_no} 行不是合法的 JSON：{str(e)}")
+
+
+def _csv_records(source: IO[bytes]) -> Iterable[Dict]:
+    reader = csv.DictReader(io.TextIOWrapper(source, encoding="utf-8", newline=""))
+    missing = {"session_id", "role", "content"} - set(reader.fieldnames or [])
+    if missing:
+        raise Exception(f"CSV 表头缺少列：{', '.join(sorted(missing))}")
+    yield from reader
+
+
+def _merge_summary(cur, session_id: str, summary: str):
+    """把导入的摘要合并进会话唯一的摘要行（已有时追加在后面，没有时新建），与后台摘要共用会话级 advisory 锁"""
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"chat_memory:{session_id}",))
+    cur.execute(
+        "UPDATE chat_memory SET content = content || E'\\n' || %s WHERE session_id = %s AND role = %s",
+        (summary, session_id, SUMMARY_ROLE)
+    )
+    if cur.rowcount == 0:
+        cur.execute("INSERT INTO chat_memory (session_id, role, content) VALUES (%s, %s, %s)",
+                    (session_id, SUMMARY_ROLE, summary))
+
+
+def import_sessions(source: IO[bytes], fmt: str = "ndjson") -> Dict:
+    """
+    通过 COPY ... FROM STDIN 流式导入会话历史（逐行解析、逐行写入 COPY 流，整个文件一个事务）
+    - 每条记录需要 session_id / role / content，created_at 缺省为导入时刻；id 列忽略，由数据库重新分配
+    - role 只能是 user / assistant / summary，其他取值整体报错
+    - 摘要行不走 COPY：同一会话的多条摘要按文件顺序合并，再并入该会话已有的摘要行，保持每个会话最多一行
+    - 按文件顺序写入，同一会话内的消息顺序保持不变；导入不做 max_memory_len 裁剪，原样保留全部历史
+    - 导入失败整体回滚
+    :param source: 二进制输入流（文件或 sys.stdin.buffer）
+    :return: 导入行数、合并的摘要数、会话数、耗时、行/秒
+    """
+    if fmt not in TRANSFER_FORMATS:
+        raise ValueError(f"导入格式只能是 {' / '.join(TRANSFER_FORMATS)}")
+    records = _ndjson_records(source) if fmt == "ndjson" else _csv_records(source)
+    imported_at = datetime.now(timezone.utc)
+    sessions = set()
+    summaries: Dict[str, List[str]] = {}
+    rows = 0
+    start = time.perf_counter()
+    with pooled_connection("ChatMemory 导入") as conn:
+        with conn.cursor() as cur:
+            with cur.copy(f"COPY chat_memory ({', '.join(IMPORT_COLUMNS)}) FROM STDIN") as copy:
+                for record_no, record in enumerate(records, 1):
+                    try:
+                        session_id, role, content = record["session_id"], record["role"], record["content"]
+                    except KeyError as e:
+                        raise Exception(f"第 {record_no} 条记录缺少字段：{str(e)}")
+                    if role not in IMPORT_ROLES:
+                        raise Exception(f"第 {record_no} 条记录的 role 不合法：{role!r}，只能是 {' / '.join(IMPORT_ROLES)}")
+                    sessions.add(session_id)
+                    if role == SUMMARY_ROLE:
+                        summaries.setdefault(session_id, []).append(content)
+                        continue
+                    copy.write_row((session_id, role, content, record.get("created_at") or imported_at))
+                    rows += 1
+            for session_id, parts in summaries.items():
+                _merge_summary(cur, session_id, "\n".join(parts))
+        conn.commit()
+    elapsed = time.perf_counter() - start
+    # 本进程缓存中的这些会话已过期
+    cache = get_session_cache()
+    for session_id in sessions:
+        cache.invalidate(session_id)
+    return {
+        "rows": rows,
+        "summaries": len(summaries),
+        "sessions": len(sessions),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed) if elapsed else 0,
+    }
@@ -0,0 +1,393 @@
+import argparse
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+from psycopg import errors
+
+from config import (
+    CHAT_MEMORY_PARTITIONING, CHAT_MEMORY_HASH_PARTITIONS, CHAT_MEMORY_PREMAKE_MONTHS, CHAT_MEMORY_RETENTION_MONTHS,
+    CHAT_MEMORY_MAINTENANCE_INTERVAL,
+)
+from app.eckert_agent.memory.pg_pool import autocommit_connection, pooled_connection
+
+PARTITION_MODES = ("none", "monthly", "hash")
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _this_month() -> date:
+    today = datetime.now(timezone.utc).date()
+    return date(today.year, today.month, 1)
+
+
+def _month_start(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+class ChatMemoryPartitionManager:
+    """
+    chat_memory 分区管理
+    - monthly：按 created_at 月度范围分区（分区名 chat_memory_pYYYYMM），自动提前创建未来分区，
+      超过保留期的分区先 DETACH 再整体 DROP，不产生逐行删除的死元组与索引膨胀；
+      DEFAULT 分区（chat_memory_pdefault）接住没有对应月分区的行（维护滞后、时钟偏差、导入的未来时间），写入不会失败
+    - hash：按 session_id 哈希分区（分区名 chat_memory_hNN），把索引与 vacuum 成本分摊到固定数量的小表，不做按时间清理
+    分区表主键必须包含分区键，分别为 (id, created_at) 与 (id, session_id)；id 仍为全局自增
+    """
+
+    def __init__(self, mode: str = CHAT_MEMORY_PARTITIONING, hash_partitions: int = CHAT_MEMORY_HASH_PARTITIONS,
+                 premake_months: int = CHAT_MEMORY_PREMAKE_MONTHS, retention_months: int = CHAT_MEMORY_RETENTION_MONTHS,
+                 table_name: str = "chat_memory", lock_timeout: float = 2.0, detach_attempts: int = 5):
+        """
+        :param mode: none / monthly / hash
+        :param hash_partitions: 哈希分区数
+        :param premake_months: 月度分区提前创建的月数
+        :param retention_months: 保留的月数（含当月），0 表示不清理
+        :param lock_timeout: 清理时等待父表锁的上限（秒），超时放弃本次尝试，不让排队的锁堵住读写
+        :param detach_attempts: 每个过期分区 DETACH 的尝试次数，仍拿不到锁时留到下一次维护
+        """
+        if mode not in PARTITION_MODES:
+            raise ValueError(f"分区方式只能是 {' / '.join(PARTITION_MODES)}")
+        self.mode = mode
+        self.hash_partitions = hash_partitions
+        self.premake_months = premake_months
+        self.retention_months = retention_months
+        self.table_name = table_name
+        self.default_partition = f"{table_name}_pdefault"
+        self.lock_timeout = lock_timeout
+        self.detach_attempts = detach_attempts
+        self._timer: Optional[threading.Timer] = None
+
+    # ========== 建表 ==========
+    def _parent_sql(self, parent: str, index_name: str) -> str:
+        """分区父表 DDL（parent 为实际表名，迁移时先用临时名创建）"""
+        if self.mode == "monthly":
+            partition_by, primary_key = "RANGE (created_at)", "id, created_at"
+        else:
+            partition_by, primary_key = "HASH (session_id)", "id, session_id"
+        return f"""
+        CREATE TABLE IF NOT EXISTS {parent} (
+            id BIGINT GENERATED ALWAYS AS IDENTITY,
+            session_id VARCHAR(100) NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY ({primary_key})
+        ) PARTITION BY {partition_by};
+
+        CREATE INDEX IF NOT EXISTS {index_name} ON {parent} (session_id, id DESC);
+        """
+
+    def partition_kind(self, cur) -> Optional[str]:
+        """现有表的分区方式：None（表不存在）、none、monthly、hash"""
+        cur.execute(
+            """
+            SELECT c.relkind, p.partstrat
+            FROM pg_class c
+                     LEFT JOIN pg_partitioned_table p ON p.partrelid = c.oid
+            WHERE c.oid = to_regclass(%s)
+            """,
+            (self.table_name,)
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return {"r": "monthly", "h": "hash"}.get(row[1], "none")
+
+    def ensure_schema(self, cur) -> bool:
+        """
+        启动检查：表不存在时按配置创建分区表与分区（空表，不会堵住读写）；已有表只检查，不做 DDL，
+        缺少的月分区由后台维护或 python -m app.eckert_agent.memory.chat_memory_partitions maintain 补建
+        :return: 当前表是否为配置的分区方式
+        """
+        kind = self.partition_kind(cur)
+        if kind is None:
+            cur.execute(self._parent_sql(self.table_name, f"idx_{self.table_name}_session_id_id"))
+            self.ensure_partitions(cur)
+            return True
+        if kind != self.mode:
+            print(f"❌ {self.table_name} 当前为 {kind} 分区方式，与配置 {self.mode} 不一致，"
+                  f"请执行 python -m app.eckert_agent.memory.chat_memory_partitions migrate")
+            return False
+        if self.mode == "monthly":
+            cur.execute("SELECT to_regclass(%s)", (f"{self.table_name}_p{_this_month():%Y%m}",))
+            if cur.fetchone()[0] is None:
+                print(f"❌ {self.table_name} 缺少当月分区，新消息暂时写入 DEFAULT 分区，等待后台维护补建")
+        return True
+
+    def ensure_partitions(self, cur, parent: Optional[str] = None, start_month: Optional[date] = None) -> List[str]:
+        """
+        创建缺失的分区：monthly 从 start_month（默认当月）到未来 premake_months 个月，并补齐 DEFAULT 分区；
+        hash 补齐全部余数分区（哈希分区不支持 DEFAULT）
+        :return: 新建的分区名
+        """
+        parent = parent or self.table_name
+        created = []
+        if self.mode == "monthly":
+            month = start_month or _this_month()
+            last = _add_months(_this_month(), self.premake_months)
+            while month <= last:
+                name = f"{self.table_name}_p{month:%Y%m}"
+                upper = _add_months(month, 1)
+                cur.execute("SELECT to_regclass(%s)", (name,))
+                if cur.fetchone()[0] is None:
+                    self._create_month_partition(cur, parent, name, month, upper)
+                    created.append(name)
+                month = upper
+            cur.execute("SELECT to_regclass(%s)", (self.default_partition,))
+            if cur.fetchone()[0] is None:
+                cur.execute(f"CREATE TABLE {self.default_partition} PARTITION OF {parent} DEFAULT")
+                created.append(self.default_partition)
+        elif self.mode == "hash":
+            for remainder in range(self.hash_partitions):
+                name = f"{self.table_name}_h{remainder:02d}"
+                cur.execute("SELECT to_regclass(%s)", (name,))
+                if cur.fetchone()[0] is None:
+                    cur.execute(
+                        f"CREATE TABLE {name} PARTITION OF {parent} "
+                        f"FOR VALUES WITH (MODULUS {self.hash_partitions}, REMAINDER {remainder})"
+                    )
+                    created.append(name)
+        return created
+
+    def _create_month_partition(self, cur, parent: str, name: str, month: date, upper: date):
+        """
+        创建月分区；DEFAULT 分区里已有该月的行（维护滞后期间写入）时不能直接建，
+        同一事务内先把这些行移到临时表，建好分区后再经父表写回（按原 id）
+        """
+        lower_ts, upper_ts = _month_start(month), _month_start(upper)
+        moved = 0
+        cur.execute("SELECT to_regclass(%s)", (self.default_partition,))
+        if cur.fetchone()[0] is not None:
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {self.default_partition} "
+                        f"WHERE created_at >= %s AND created_at < %s)", (lower_ts, upper_ts))
+            if cur.fetchone()[0]:
+                cur.execute(f"CREATE TEMP TABLE {name}_moving (LIKE {parent}) ON COMMIT DROP")
+                cur.execute(
+                    f"""
+                    WITH moved AS (
+                        DELETE FROM {self.default_partition} WHERE created_at >= %s AND created_at < %s
+                        RETURNING id, session_id, role, content, created_at
+                    )
+                    INSERT INTO {name}_moving (id, session_id, role, content, created_at) SELECT * FROM moved
+                    """,
+                    (lower_ts, upper_ts)
+                )
+                moved = cur.rowcount
+        cur.execute(
+            f"CREATE TABLE {name} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+        if moved:
+            cur.execute(
+                f"""
+                INSERT INTO {parent} (id, session_id, role, content, created_at) OVERRIDING SYSTEM VALUE
+                SELECT id, session_id, role, content, created_at FROM {name}_moving
+                """
+            )
+            cur.execute(f"DROP TABLE {name}_moving")
+            print(f"✅ {name}：从 DEFAULT 分区移入 {moved} 行")
+
+    # ========== 保留期清理 ==========
+    def expired_partitions(self, cur) -> List[Dict]:
+        """
+        超过保留期的整月分区（只处理 monthly 方式）：仍挂在父表上的，以及上次已 DETACH 但还没删掉的
+        :return: [{partition, attached, rows（行数估计）, bytes}]
+        """
+        if self.mode != "monthly" or self.retention_months <= 0:
+            return []
+        cutoff = _add_months(_this_month(), -(self.retention_months - 1))
+        prefix = f"{self.table_name}_p"
+        cur.execute(
+            """
+            SELECT c.relname, i.inhparent IS NOT NULL, c.reltuples::bigint, pg_total_relation_size(c.oid)
+            FROM pg_class c
+                     LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = to_regclass(%s)
+            WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace AND c.relname LIKE %s
+            ORDER BY c.relname
+            """,
+            (self.table_name, prefix.replace("_", r"\_") + "%")
+        )
+        expired = []
+        for name, attached, rows, size in cur.fetchall():
+            suffix = name[len(prefix):]
+            if len(suffix) != 6 or not suffix.isdigit():
+                continue
+            if date(int(suffix[:4]), int(suffix[4:]), 1) < cutoff:
+                expired.append({"partition": name, "attached": attached, "rows": max(rows, 0), "bytes": size})
+        return expired
+
+    def apply_retention(self) -> List[Dict]:
+        """
+        删除超过保留期的整月分区：每个分区在自动提交连接上先 DETACH（短事务，lock_timeout 内拿不到父表锁就稍后重试，
+        不在锁队列里堵住读写），脱离父表后再 DROP（只锁该表本身）；DEFAULT 分区中过期的行逐行删除
+        存在 DEFAULT 分区时 PostgreSQL 不允许 DETACH ... CONCURRENTLY，因此用短锁超时 + 重试代替
+        :return: 删除的分区信息（名称、行数估计、占用字节）
+        """
+        if self.mode != "monthly" or self.retention_months <= 0:
+            return []
+        cutoff = _month_start(_add_months(_this_month(), -(self.retention_months - 1)))
+        dropped = []
+        with autocommit_connection("ChatMemory 分区清理") as conn:
+            conn.execute(f"SET lock_timeout = {int(self.lock_timeout * 1000)}")
+            with conn.cursor() as cur:
+                expired = self.expired_partitions(cur)
+            for item in expired:
+                # 父表被长事务占着时其余分区同样拿不到锁，整体留到下一次维护
+                if item["attached"] and not self._detach(conn, item["partition"]):
+                    break
+                conn.execute(f"DROP TABLE IF EXISTS {item['partition']}")
+                dropped.append({key: item[key] for key in ("partition", "rows", "bytes")})
+            if conn.execute("SELECT to_regclass(%s)", (self.default_partition,)).fetchone()[0] is not None:
+                try:
+                    conn.execute(f"DELETE FROM {self.default_partition} WHERE created_at < %s", (cutoff,))
+                except errors.LockNotAvailable:
+                    pass
+        return dropped
+
+    def _detach(self, conn, name: str) -> bool:
+        """把分区从父表脱离（锁超时后退避重试），仍失败时返回 False，留到下一次维护"""
+        for attempt in range(self.detach_attempts):
+            try:
+                conn.execute(f"ALTER TABLE {self.table_name} DETACH PARTITION {name}")
+                return True
+            except errors.LockNotAvailable:
+                time.sleep(min(0.5 * 2 ** attempt, 10))
+        print(f"❌ {name} 多次等待 {self.table_name} 的锁超时，留到下一次维护再清理")
+        return False
+
+    def run_maintenance(self) -> Dict:
+        """维护任务：提前创建分区（单独提交）+ 删除过期分区（每个分区单独处理），失败不影响下一次运行"""
+        result = {"created": [], "dropped": []}
+        if self.mode == "none":
+            return result
+        with pooled_connection("ChatMemory 分区维护") as conn:
+            with conn.cursor() as cur:
+                if self.partition_kind(cur) != self.mode:
+                    return result
+                # 建分区要锁父表：lock_timeout 内拿不到锁就放弃本次（整个事务回滚），不在锁队列里堵住读写
+                cur.execute(f"SET LOCAL lock_timeout = {int(self.lock_timeout * 1000)}")
+                try:
+                    result["created"] = self.ensure_partitions(cur)
+                except errors.LockNotAvailable:
+                    conn.rollback()
+                    print(f"❌ 等待 {self.table_name} 的锁超时，分区留到下一次维护再创建")
+                else:
+                    conn.commit()
+        result["dropped"] = self.apply_retention()
+        if result["created"] or result["dropped"]:
+            reclaimed = sum(item["bytes"] for item in result["dropped"])
+            print(f"✅ chat_memory 分区维护：新建 {len(result['created'])} 个，"
+                  f"删除 {len(result['dropped'])} 个（释放 {reclaimed / 1024 / 1024:.1f} MB）")
+        return result
+
+    def start_background(self, interval: float = CHAT_MEMORY_MAINTENANCE_INTERVAL):
+        """启动后台定时维护（守护线程，启动后立即执行一次，之后每隔 interval 秒执行）"""
+        def tick():
+            try:
+                self.run_maintenance()
+            except Exception as e:
+                print(f"❌ chat_memory 分区维护失败：{str(e)}")
+            self._timer = threading.Timer(interval, tick)
+            self._timer.daemon = True
+            self._timer.start()
+
+        if self._timer is None:
+            self._timer = threading.Timer(0, tick)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop_background(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    # ========== 迁移 ==========
+    def migrate(self) -> Dict:
+        """
+        把现有普通表迁移为分区表（单个事务，期间锁住旧表）：
+        1. 以临时名创建分区父表、从最早数据所在月到未来 premake_months 个月的分区，以及 DEFAULT 分区
+           （created_at 晚于预建范围的行，如时钟偏差或导入的未来时间，落入 DEFAULT 分区，之后建对应月分区时自动移出）
+        2. 按原 id 复制全部数据，自增序列跳到最大 id 之后
+        3. 旧表改名为 {table}_legacy 保留备份，新表改为正式表名
+        :return: 迁移的行数与旧表备份名
+        """
+        if self.mode == "none":
+            raise ValueError("分区方式为 none，无需迁移")
+        legacy = f"{self.table_name}_legacy"
+        staging = f"{self.table_name}_partitioned"
+        with pooled_connection("ChatMemory 分区迁移") as conn:
+            with conn.cursor() as cur:
+                kind = self.partition_kind(cur)
+                if kind == self.mode:
+                    print(f"✅ {self.table_name} 已经是 {self.mode} 分区表")
+                    return {"rows": 0, "legacy_table": None}
+                if kind != "none":
+                    raise Exception(f"{self.table_name} 不存在或已是其他分区方式（{kind}），无法迁移")
+                cur.execute(f"LOCK TABLE {self.table_name} IN ACCESS EXCLUSIVE MODE")
+                cur.execute(f"SELECT min(created_at) FROM {self.table_name}")
+                oldest = cur.fetchone()[0]
+                # 旧表索引改名，新表使用正式索引名
+                cur.execute(f"ALTER INDEX IF EXISTS idx_{self.table_name}_session_id_id "
+                            f"RENAME TO idx_{legacy}_session_id_id")
+                cur.execute(self._parent_sql(staging, f"idx_{self.table_name}_session_id_id"))
+                start_month = date(oldest.year, oldest.month, 1) if oldest is not None else None
+                self.ensure_partitions(cur, parent=staging, start_month=start_month)
+                cur.execute(
+                    f"""
+                    INSERT INTO {staging} (id, session_id, role, content, created_at)
+                    OVERRIDING SYSTEM VALUE
+                    SELECT id, session_id, role, content, created_at
+                    FROM {self.table_name}
+                    """
+                )
+                rows = cur.rowcount
+                cur.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"(SELECT coalesce(max(id), 0) + 1 FROM {staging}), false)",
+                    (staging,)
+                )
+                cur.execute(f"ALTER TABLE {self.table_name} RENAME TO {legacy}")
+                cur.execute(f"ALTER TABLE {staging} RENAME TO {self.table_name}")
+            conn.commit()
+        print(f"✅ {self.table_name} 已迁移为 {self.mode} 分区表，共 {rows} 行，旧表保留为 {legacy}")
+        return {"rows": rows, "legacy_table": legacy}
+
+
+_maintenance: Optional[ChatMemoryPartitionManager] = None
+_maintenance_lock = threading.Lock()
+
+
+def start_partition_maintenance() -> Optional[ChatMemoryPartitionManager]:
+    """
+    按配置启动进程内唯一的月度分区后台维护（提前建分区、DEFAULT 分区行移入新分区、删除过期分区）
+    只由长期运行的对话进程调用，命令行导入导出等一次性任务不启动
+    """
+    global _maintenance
+    if CHAT_MEMORY_PARTITIONING != "monthly":
+        return None
+    with _maintenance_lock:
+        if _maintenance is None:
+            _maintenance = ChatMemoryPartitionManager()
+            _maintenance.start_background()
+        return _maintenance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chat_memory 分区管理")
+    parser.add_argument("command", choices=["migrate", "maintain"], help="migrate：普通表迁移为分区表；maintain：创建/清理分区")
+    parser.add_argument("--mode", choices=["monthly", "hash"], default=None, help="分区方式（默认读取 CHAT_MEMORY_PARTITIONING）")
+    args = parser.parse_args()
+    manager = ChatMemoryPartitionManager(mode=args.mode or CHAT_MEMORY_PARTITIONING)
+    if args.command == "migrate":
+        print(manager.migrate())
+    else:
+        print(manager.run_maintenance())
+
+
+if __name__ == "__main__":
+    main()
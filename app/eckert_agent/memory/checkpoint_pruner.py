@@ -0,0 +1,181 @@
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from config import (
+    CHECKPOINT_KEEP_LAST, CHECKPOINT_KEEP_SECONDS, CHECKPOINT_PRUNE_BATCH, CHECKPOINT_PRUNE_INTERVAL,
+)
+from app.eckert_agent.memory.pg_pool import pooled_connection
+
+# 删除超出保留范围的检查点及其 pending writes，返回删除行数与字节数
+_PRUNE_CHECKPOINTS_SQL = """
+WITH ranked AS (
+    SELECT thread_id, checkpoint_ns, checkpoint_id,
+           row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn,
+           (checkpoint ->> 'ts')::timestamptz AS ts
+    FROM checkpoints
+    WHERE thread_id = ANY(%(threads)s)
+),
+doomed AS (
+    SELECT thread_id, checkpoint_ns, checkpoint_id
+    FROM ranked
+    WHERE rn > %(keep_last)s
+      AND (%(cutoff)s::timestamptz IS NULL OR ts < %(cutoff)s::timestamptz)
+),
+deleted_checkpoints AS (
+    DELETE FROM checkpoints c
+    USING doomed d
+    WHERE c.thread_id = d.thread_id AND c.checkpoint_ns = d.checkpoint_ns AND c.checkpoint_id = d.checkpoint_id
+    RETURNING pg_column_size(c.*) AS size
+),
+deleted_writes AS (
+    DELETE FROM checkpoint_writes w
+    USING doomed d
+    WHERE w.thread_id = d.thread_id AND w.checkpoint_ns = d.checkpoint_ns AND w.checkpoint_id = d.checkpoint_id
+    RETURNING pg_column_size(w.*) AS size
+)
+SELECT (SELECT count(*) FROM deleted_checkpoints),
+       (SELECT coalesce(sum(size), 0) FROM deleted_checkpoints),
+       (SELECT count(*) FROM deleted_writes),
+       (SELECT coalesce(sum(size), 0) FROM deleted_writes)
+"""
+
+# 删除不再被任何检查点引用的通道快照
+# 只删版本号低于该通道当前最新引用版本的快照：并发写入时快照先于检查点落库，新版本号一定更高，不会被误删
+_PRUNE_BLOBS_SQL = """
+WITH deleted_blobs AS (
+    DELETE FROM checkpoint_blobs b
+    WHERE b.thread_id = ANY(%(threads)s)
+      AND b.version < (SELECT max(c.checkpoint -> 'channel_versions' ->> b.channel)
+                       FROM checkpoints c
+                       WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns)
+      AND NOT EXISTS (SELECT 1
+                      FROM checkpoints c
+                      WHERE c.thread_id = b.thread_id
+                        AND c.checkpoint_ns = b.checkpoint_ns
+                        AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version)
+    RETURNING pg_column_size(b.*) AS size
+)
+SELECT count(*), coalesce(sum(size), 0) FROM deleted_blobs
+"""
+
+_STAT_KEYS = ("checkpoints", "writes", "blobs", "bytes", "threads")
+
+
+class CheckpointPruner:
+    """
+    LangGraph 检查点清理（checkpoints / checkpoint_writes / checkpoint_blobs）
+    - 每个 (thread_id, checkpoint_ns) 保留最近 keep_last 个检查点，以及 keep_seconds 秒内的检查点，最新一个始终保留
+    - 增量执行：每次按 thread_id 顺序处理一批 thread（一个事务），记住位置，下次从后面继续，到末尾后从头开始
+    - 统计删除的行数与字节数（pg_column_size，逻辑大小；磁盘空间在 VACUUM 后复用）
+    注意：不识别 DeltaChannel 的快照链，使用 DeltaChannel 的图不要开启清理（本项目的图未使用）
+    """
+
+    def __init__(self, keep_last: int = CHECKPOINT_KEEP_LAST, keep_seconds: float = CHECKPOINT_KEEP_SECONDS,
+                 batch_size: int = CHECKPOINT_PRUNE_BATCH):
+        """
+        :param keep_last: 每个 thread 保留的最近检查点数，0 表示只按时间保留
+        :param keep_seconds: 保留最近多少秒内的检查点，0 表示只按条数保留
+        :param batch_size: 每批处理的 thread 数
+        """
+        if keep_last <= 0 and keep_seconds <= 0:
+            raise ValueError("keep_last 与 keep_seconds 至少设置一个")
+        self.keep_last = keep_last
+        self.keep_seconds = keep_seconds
+        self.batch_size = batch_size
+        self._cursor = ""
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self.totals = dict.fromkeys(_STAT_KEYS, 0)
+
+    def _next_threads(self, cur) -> List[str]:
+        cur.execute(
+            "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id > %s ORDER BY thread_id LIMIT %s",
+            (self._cursor, self.batch_size)
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def prune_threads(self, thread_ids: List[str]) -> Dict:
+        """清理指定 thread（一个事务）"""
+        result = dict.fromkeys(_STAT_KEYS, 0)
+        if not thread_ids:
+            return result
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.keep_seconds) if self.keep_seconds > 0 else None
+        params = {"threads": list(thread_ids), "keep_last": max(self.keep_last, 1), "cutoff": cutoff}
+        with pooled_connection("检查点清理") as conn:
+            with conn.cursor() as cur:
+                cur.execute(_PRUNE_CHECKPOINTS_SQL, params)
+                checkpoints, checkpoint_bytes, writes, write_bytes = cur.fetchone()
+                cur.execute(_PRUNE_BLOBS_SQL, params)
+                blobs, blob_bytes = cur.fetchone()
+            conn.commit()
+        result.update(checkpoints=checkpoints, writes=writes, blobs=blobs,
+                      bytes=int(checkpoint_bytes + write_bytes + blob_bytes), threads=len(thread_ids))
+        return result
+
+    def run_once(self) -> Dict:
+        """处理下一批 thread，返回本批统计"""
+        with self._lock:
+            with pooled_connection("检查点清理") as conn:
+                with conn.cursor() as cur:
+                    thread_ids = self._next_threads(cur)
+            # 已到末尾：下次从头开始
+            self._cursor = thread_ids[-1] if len(thread_ids) == self.batch_size else ""
+            result = self.prune_threads(thread_ids)
+            for key in _STAT_KEYS:
+                self.totals[key] += result[key]
+        if result["checkpoints"] or result["blobs"]:
+            print(f"✅ 检查点清理：{result['threads']} 个 thread，删除检查点 {result['checkpoints']} 个、"
+                  f"writes {result['writes']} 行、blobs {result['blobs']} 行（{result['bytes'] / 1024:.1f} KB）")
+        return result
+
+    def run_all(self) -> Dict:
+        """从头到尾处理全部 thread（一次性清理/命令行使用）"""
+        total = dict.fromkeys(_STAT_KEYS, 0)
+        self._cursor = ""
+        while True:
+            result = self.run_once()
+            for key in _STAT_KEYS:
+                total[key] += result[key]
+            if not self._cursor:
+                return total
+
+    def start_background(self, interval: float = CHECKPOINT_PRUNE_INTERVAL):
+        """启动后台增量清理（守护线程，每隔 interval 秒处理一批）"""
+        def tick():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ 检查点清理失败：{str(e)}")
+            self._timer = threading.Timer(interval, tick)
+            self._timer.daemon = True
+            self._timer.start()
+
+        if self._timer is None:
+            self._timer = threading.Timer(interval, tick)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop_background(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self) -> Dict:
+        """启动以来累计删除的行数与字节数"""
+        return dict(self.totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清理 LangGraph 检查点")
+    parser.add_argument("--keep-last", type=int, default=CHECKPOINT_KEEP_LAST, help="每个 thread 保留的最近检查点数")
+    parser.add_argument("--keep-seconds", type=float, default=CHECKPOINT_KEEP_SECONDS, help="保留最近多少秒内的检查点")
+    parser.add_argument("--batch-size", type=int, default=CHECKPOINT_PRUNE_BATCH, help="每批处理的 thread 数")
+    args = parser.parse_args()
+    pruner = CheckpointPruner(keep_last=args.keep_last, keep_seconds=args.keep_seconds, batch_size=args.batch_size)
+    print(pruner.run_all())
+
+
+if __name__ == "__main__":
+    main()
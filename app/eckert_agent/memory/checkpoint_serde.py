@@ -0,0 +1,77 @@
+import struct
+import threading
+from typing import Any, Optional, Tuple
+
+import zstandard
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from config import CHECKPOINT_COMPRESSION, CHECKPOINT_ZSTD_LEVEL, CHECKPOINT_COMPRESS_MIN_BYTES
+
+# 类型名后缀：带后缀的数据为压缩格式，不带后缀的（旧数据、小数据）直接交给内层序列化器
+ZSTD_SUFFIX = "+zstd"
+# 压缩数据头：魔数 + 格式版本（1 字节），之后是 zstd 帧
+_MAGIC = b"EKZ"
+_HEADER = struct.Struct("!3sB")
+FORMAT_VERSION = 1
+
+
+class ZstdSerializer(SerializerProtocol):
+    """
+    检查点压缩序列化器：内层序列化器（默认 JsonPlusSerializer，msgpack 二进制编码）输出的字节再做 zstd 压缩
+    - 存储格式：类型名追加 +zstd，数据为 4 字节头（EKZ + 格式版本）+ zstd 帧
+    - 小于 min_bytes 的数据不压缩，按内层格式原样存储（压缩收益小于头部与 CPU 开销）
+    - 读取时没有 +zstd 后缀的数据直接交给内层序列化器，开启压缩前写入的检查点仍可读取
+    """
+
+    def __init__(self, serde: Optional[SerializerProtocol] = None, level: int = CHECKPOINT_ZSTD_LEVEL,
+                 min_bytes: int = CHECKPOINT_COMPRESS_MIN_BYTES):
+        """
+        :param serde: 内层序列化器，默认 JsonPlusSerializer
+        :param level: zstd 压缩级别（1~22，越高越小越慢）
+        :param min_bytes: 小于该字节数的数据不压缩
+        """
+        self.serde = serde or JsonPlusSerializer()
+        self.level = level
+        self.min_bytes = min_bytes
+        # zstd 压缩/解压对象不是线程安全的，每个线程各一份
+        self._local = threading.local()
+
+    def _compressor(self) -> "zstandard.ZstdCompressor":
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor
+
+    def _decompressor(self) -> "zstandard.ZstdDecompressor":
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        typ, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_bytes:
+            return typ, data
+        return f"{typ}{ZSTD_SUFFIX}", _HEADER.pack(_MAGIC, FORMAT_VERSION) + self._compressor().compress(data)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        typ, payload = data
+        if not typ.endswith(ZSTD_SUFFIX):
+            return self.serde.loads_typed(data)
+        magic, version = _HEADER.unpack_from(payload)
+        if magic != _MAGIC:
+            raise ValueError("检查点数据头损坏，无法解压")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支持的检查点压缩格式版本：{version}")
+        raw = self._decompressor().decompress(bytes(payload[_HEADER.size:]))
+        return self.serde.loads_typed((typ[:-len(ZSTD_SUFFIX)], raw))
+
+
+def get_checkpoint_serde() -> Optional[SerializerProtocol]:
+    """按配置返回检查点序列化器（none 时返回 None，使用 LangGraph 默认序列化器）"""
+    if CHECKPOINT_COMPRESSION == "zstd":
+        return ZstdSerializer()
+    if CHECKPOINT_COMPRESSION == "none":
+        return None
+    raise ValueError("CHECKPOINT_COMPRESSION 只能是 zstd 或 none")
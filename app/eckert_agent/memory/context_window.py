@@ -0,0 +1,153 @@
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from pydantic import BaseModel, Field
+
+from config import CONTEXT_MAX_TOKENS, CONTEXT_RESERVE_TOKENS
+
+# 每条消息的固定开销（角色标记、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    低成本 token 估算（不加载分词器）
+    中日韩字符约 1 字 1 token，其余字符约 4 个字符 1 token
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "가" <= ch <= "힯" or "＀" <= ch <= "￯")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ContextBudgetReport(BaseModel):
+    """单次请求的上下文预算报告"""
+    budget: int = Field(..., description="可用于输入的 token 预算（已扣除输出预留）")
+    system_tokens: int = Field(default=0, description="系统提示词（含会话摘要）token 数")
+    knowledge_tokens: int = Field(default=0, description="知识库内容 token 数（截断后）")
+    user_tokens: int = Field(default=0, description="用户输入 token 数")
+    history_tokens: int = Field(default=0, description="保留的历史消息 token 数")
+    kept_messages: int = Field(default=0, description="保留的历史消息条数")
+    dropped_messages: int = Field(default=0, description="丢弃的历史消息条数")
+    dropped_tokens: int = Field(default=0, description="丢弃的 token 数（历史 + 知识库截断）")
+    prefill_ms: Optional[float] = Field(default=None, description="模型 prefill 耗时（毫秒，来自 Ollama 返回）")
+    prompt_eval_count: Optional[int] = Field(default=None, description="模型实际计算的输入 token 数")
+
+    @property
+    def total_tokens(self) -> int:
+        return self.system_tokens + self.knowledge_tokens + self.user_tokens + self.history_tokens
+
+    def record_prefill(self, message: BaseMessage) -> "ContextBudgetReport":
+        """
+        从模型回复的 response_metadata 中读取 prefill 耗时与实际输入 token 数
+        一次请求内多次调用模型（如工具调用循环）时累加
+        """
+        metadata = getattr(message, "response_metadata", None) or {}
+        if metadata.get("prompt_eval_duration") is not None:
+            self.prefill_ms = (self.prefill_ms or 0.0) + metadata["prompt_eval_duration"] / 1e6
+        if metadata.get("prompt_eval_count") is not None:
+            self.prompt_eval_count = (self.prompt_eval_count or 0) + metadata["prompt_eval_count"]
+        return self
+
+    def summary(self) -> str:
+        prefill = f"{self.prefill_ms:.1f}ms" if self.prefill_ms is not None else "-"
+        return (
+            f"📊 上下文：{self.total_tokens}/{self.budget} tokens（历史 {self.kept_messages} 条），"
+            f"丢弃 {self.dropped_messages} 条 / {self.dropped_tokens} tokens，prefill {prefill}"
+        )
+
+
+class ContextWindowManager:
+    """
+    上下文窗口管理：按 token 预算组装 系统提示词 + 知识库内容 + 历史 + 用户输入
+    固定部分（系统提示词、历史开头的会话摘要、用户输入）必须保留，知识库内容超预算时截断，
+    剩余预算从最新一轮对话开始向前填充，整轮保留或整轮丢弃
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, reserve_tokens: int = CONTEXT_RESERVE_TOKENS,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        """
+        :param max_tokens: 模型上下文窗口大小
+        :param reserve_tokens: 预留给模型输出的 token 数
+        :param token_counter: 自定义 token 计数函数（如真实分词器），默认使用低成本估算
+        """
+        self.max_tokens = max_tokens
+        self.reserve_tokens = reserve_tokens
+        self.token_counter = token_counter or estimate_tokens
+
+    def count_message_tokens(self, message: BaseMessage) -> int:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        return self.token_counter(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """按 token 预算截断文本（二分查找截断位置）"""
+        if max_tokens <= 0:
+            return ""
+        if self.token_counter(text) <= max_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.token_counter(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+    @staticmethod
+    def _group_turns(history: List[BaseMessage]) -> List[List[BaseMessage]]:
+        """按轮次分组：每轮以用户消息开始（工具调用等中间消息归入所在轮次）"""
+        turns: List[List[BaseMessage]] = []
+        for message in history:
+            if isinstance(message, HumanMessage) or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+        return turns
+
+    def fit(self, history: List[BaseMessage], system_prompt: str = "", knowledge_context: str = "",
+            user_input: str = "") -> Tuple[List[BaseMessage], str, ContextBudgetReport]:
+        """
+        在预算内组装上下文
+        :param history: 历史消息（时间正序，开头的系统消息视为会话摘要，始终保留）
+        :param system_prompt: 系统提示词
+        :param knowledge_context: 知识库检索内容
+        :param user_input: 本轮用户输入
+        :return: (保留的历史消息（时间正序）, 截断后的知识库内容, 预算报告)
+        """
+        budget = max(self.max_tokens - self.reserve_tokens, 0)
+        report = ContextBudgetReport(budget=budget)
+        report.system_tokens = self.token_counter(system_prompt) + MESSAGE_OVERHEAD_TOKENS if system_prompt else 0
+        report.user_tokens = self.token_counter(user_input) + MESSAGE_OVERHEAD_TOKENS if user_input else 0
+
+        # 历史开头的系统消息（滚动摘要）与系统提示词一样固定保留
+        pinned: List[BaseMessage] = []
+        while len(pinned) < len(history) and isinstance(history[len(pinned)], SystemMessage):
+            pinned.append(history[len(pinned)])
+        history = history[len(pinned):]
+        report.system_tokens += sum(self.count_message_tokens(m) for m in pinned)
+
+        remaining = budget - report.system_tokens - report.user_tokens
+        knowledge_full = self.token_counter(knowledge_context)
+        knowledge_context = self._truncate(knowledge_context, remaining)
+        report.knowledge_tokens = self.token_counter(knowledge_context)
+        report.dropped_tokens += knowledge_full - report.knowledge_tokens
+        remaining -= report.knowledge_tokens
+
+        kept_turns: List[List[BaseMessage]] = []
+        turns = self._group_turns(history)
+        # 从最新一轮开始向前填充；一旦某轮放不下，更早的轮次全部丢弃，保证上下文连续
+        for idx in range(len(turns) - 1, -1, -1):
+            turn_tokens = sum(self.count_message_tokens(m) for m in turns[idx])
+            if turn_tokens > remaining:
+                for dropped in turns[:idx + 1]:
+                    report.dropped_messages += len(dropped)
+                    report.dropped_tokens += sum(self.count_message_tokens(m) for m in dropped)
+                break
+            kept_turns.append(turns[idx])
+            remaining -= turn_tokens
+            report.history_tokens += turn_tokens
+
+        kept = pinned + [message for turn in reversed(kept_turns) for message in turn]
+        report.kept_messages = len(kept)
+        return kept, knowledge_context, report
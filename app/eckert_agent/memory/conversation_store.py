@@ -0,0 +1,129 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from config import CONVERSATION_SOURCE, CONVERSATION_PROJECTION
+from app.eckert_agent.memory.chat_memory import ChatMemory
+from app.eckert_agent.memory.conversation_summarizer import summary_from_message, summary_message
+from app.eckert_agent.memory.pg_checkpointer import get_postgres_checkpointer, aget_postgres_checkpointer
+from app.eckert_agent.memory.write_behind import get_write_behind_queue
+
+CONVERSATION_SOURCES = ("checkpoint", "chat_memory")
+PROJECTION_MODES = ("sync", "async", "off")
+
+
+class ConversationStore:
+    """
+    对话存储适配器：统一对话历史的读写入口，一轮对话只写一次、读一次
+    - checkpoint：LangGraph 检查点为权威来源，同一 thread 的历史随检查点恢复，不再读 chat_memory；
+      chat_memory 降为派生投影（导出、检索等离线用途），按 projection 同步写、后台队列批量写或不写；
+      检查点中还没有消息的会话（开启前的老会话）从 chat_memory 引导一次
+    - chat_memory：chat_memory 表为权威来源，每次运行从表中加载历史，图不挂载检查点
+    """
+
+    def __init__(self, memory: Optional[ChatMemory] = None, source: str = CONVERSATION_SOURCE,
+                 projection: str = CONVERSATION_PROJECTION):
+        """
+        :param memory: chat_memory 读写对象，不传时新建
+        :param source: 权威来源：checkpoint 或 chat_memory
+        :param projection: checkpoint 模式下 chat_memory 投影的写入方式：sync、async 或 off
+        """
+        if source not in CONVERSATION_SOURCES:
+            raise ValueError("CONVERSATION_SOURCE 只能是 checkpoint 或 chat_memory")
+        if projection not in PROJECTION_MODES:
+            raise ValueError("CONVERSATION_PROJECTION 只能是 sync、async 或 off")
+        self.memory = memory or ChatMemory()
+        self.source = source
+        self.projection = projection
+        # 异步投影使用进程内共用的后台批量写入队列（未开启 WRITE_BEHIND_ENABLED 时也挂上）
+        if self.uses_checkpoint and projection == "async" and self.memory.write_behind is None:
+            self.memory.write_behind = get_write_behind_queue()
+
+    @property
+    def uses_checkpoint(self) -> bool:
+        return self.source == "checkpoint"
+
+    def checkpointer(self) -> Optional[BaseCheckpointSaver]:
+        """图编译时挂载的检查点存储（chat_memory 模式返回 None）"""
+        return get_postgres_checkpointer() if self.uses_checkpoint else None
+
+    async def acheckpointer(self) -> Optional[BaseCheckpointSaver]:
+        return await aget_postgres_checkpointer() if self.uses_checkpoint else None
+
+    @staticmethod
+    def graph_input(session_id: str, user_input: str = "") -> Dict:
+        """
+        图运行的输入（每轮对话运行一次图，checkpoint 模式下每轮落一次检查点）：只带 session_id 与本轮用户输入，不带 messages
+        checkpoint 模式下不会用空列表覆盖检查点恢复出的历史；chat_memory 模式下状态本来就从空开始
+        """
+        return {"session_id": session_id, "user_input": user_input}
+
+    def load_history(self, session_id: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        返回需要追加到状态中的历史消息
+        :param messages: 当前状态中已有的消息（checkpoint 模式下为检查点恢复出的历史，非空时不读库）
+        """
+        if self.uses_checkpoint and messages:
+            return []
+        return self.memory.get_history_as_messages(session_id)
+
+    async def aload_history(self, session_id: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        if self.uses_checkpoint and messages:
+            return []
+        return await self.memory.aget_history_as_messages(session_id)
+
+    def record_turn(self, session_id: str, user_input: str, assistant_response: str):
+        """
+        记录一轮对话
+        checkpoint 模式下消息已随图状态写入检查点，这里只按 projection 更新 chat_memory 投影；
+        chat_memory 模式下写入 chat_memory（开启 WRITE_BEHIND_ENABLED 时只入队）
+        """
+        if not self.uses_checkpoint:
+            self.memory.save_turn(session_id, user_input, assistant_response, defer=True)
+        elif self.projection != "off":
+            self.memory.save_turn(session_id, user_input, assistant_response, defer=self.projection == "async")
+
+    async def arecord_turn(self, session_id: str, user_input: str, assistant_response: str):
+        """record_turn 的异步版本：同步写入走异步连接池"""
+        if not self.uses_checkpoint:
+            await self.memory.asave_turn(session_id, user_input, assistant_response, defer=True)
+        elif self.projection != "off":
+            await self.memory.asave_turn(session_id, user_input, assistant_response,
+                                         defer=self.projection == "async")
+
+    def trim_checkpoint(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        checkpoint 模式下对写回检查点的消息执行与 chat_memory 相同的保留策略（chat_memory 模式原样返回）
+        - 开启摘要：消息超过 summary_trigger_len 条时，把较早的轮次折叠进开头的摘要系统消息，保留最近 summary_keep_recent 条
+        - 未开启摘要：只保留最近 max_memory_len 条
+        保留部分从用户消息开始，保证整轮；检查点中的消息因此不会无限增长
+        """
+        if not self.uses_checkpoint:
+            return messages
+        previous_summary = summary_from_message(messages[0]) if messages else None
+        history = messages[1:] if previous_summary is not None else list(messages)
+        summarizer = self.memory.summarizer
+        limit = self.memory.summary_trigger_len if summarizer else self.memory.max_memory_len
+        if len(history) <= limit:
+            return messages
+        boundary = len(history) - (self.memory.summary_keep_recent if summarizer else self.memory.max_memory_len)
+        while boundary < len(history) and not isinstance(history[boundary], HumanMessage):
+            boundary += 1
+        if summarizer is None:
+            head = [messages[0]] if previous_summary is not None else []
+            return head + history[boundary:]
+        summary = summarizer.summarize(previous_summary, ChatMemory._from_messages(
+            [message for message in history[:boundary] if message.type in ("human", "ai")]))
+        return [summary_message(summary)] + history[boundary:]
+
+    async def atrim_checkpoint(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """trim_checkpoint 的异步版本：开启摘要时摘要器可能调用模型，放到线程里执行，不阻塞事件循环"""
+        if self.memory.summarizer is None:
+            return self.trim_checkpoint(messages)
+        return await asyncio.to_thread(self.trim_checkpoint, messages)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待排队中的 chat_memory 写入完成（进程退出时写入队列也会自动落库）"""
+        return self.memory.flush(timeout)
@@ -0,0 +1,135 @@
+import re
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from config import OLLAMA_MODEL, SUMMARY_METHOD, SUMMARY_MODEL, SUMMARY_MAX_CHARS
+
+# 摘要行在 chat_memory 中的角色标记（每个会话最多一行）
+SUMMARY_ROLE = "summary"
+# 后台摘要调用的调度优先级（数值越大越靠后，不抢占交互请求）
+SUMMARY_PRIORITY = 10
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])")
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.S)
+
+SUMMARY_PROMPT = """你是对话摘要助手。请把【已有摘要】和【新增对话】合并为一份新的摘要：
+1. 保留用户身份、偏好、需求、已确认的结论和未完成的事项
+2. 删除寒暄和重复内容，使用简洁的中文短句，按时间顺序分条列出
+3. 总长度不超过 {max_chars} 字，只输出摘要本身
+
+【已有摘要】
+{previous_summary}
+
+【新增对话】
+{dialogue}"""
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    """取首句并折叠空白，超长截断"""
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END.split(text, maxsplit=1)[0].strip() or text
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars] + "…"
+
+
+def format_dialogue(messages: List[Dict]) -> str:
+    """把 role+content 列表格式化为对话文本"""
+    names = {"user": "用户", "assistant": "助手"}
+    return "\n".join(f"{names.get(m['role'], m['role'])}：{m['content']}" for m in messages)
+
+
+class ConversationSummarizer:
+    """
+    对话摘要器：把较早的轮次与已有摘要合并为一段长度受控的摘要
+    - extractive：每轮取用户问题与助手回答的首句，超长时淘汰最早的条目（无模型调用）
+    - llm：调用轻量模型生成摘要，失败时回退抽取式
+    """
+
+    def __init__(self, method: str = SUMMARY_METHOD, max_chars: int = SUMMARY_MAX_CHARS,
+                 model: str = SUMMARY_MODEL, llm=None):
+        """
+        :param method: extractive 或 llm
+        :param max_chars: 摘要最大字数
+        :param model: llm 方式使用的模型名（与主模型不同时复用同一连接池）
+        :param llm: 自定义 LangChain 聊天模型（优先于 model）
+        """
+        if method not in ("extractive", "llm"):
+            raise ValueError("摘要方式只能是 extractive 或 llm")
+        self.method = method
+        self.max_chars = max_chars
+        self.model = model
+        self._llm = llm
+
+    def _get_llm(self):
+        if self._llm is None:
+            from app.eckert_agent.model.ollama import OllamaModel
+            llm = OllamaModel().get_llm()
+            # 摘要模型与主模型不同时共享路由与连接池，只替换模型名
+            self._llm = llm if self.model == OLLAMA_MODEL else llm.model_copy(update={"model": self.model})
+        return self._llm
+
+    def summarize(self, previous_summary: Optional[str], messages: List[Dict]) -> str:
+        """
+        合并已有摘要与新折叠的消息
+        :param previous_summary: 已有摘要（可为空）
+        :param messages: 待折叠的消息（role+content，时间正序）
+        """
+        if not messages:
+            return previous_summary or ""
+        if self.method == "llm":
+            try:
+                return self._summarize_llm(previous_summary, messages)
+            except Exception as e:
+                print(f"❌ LLM 摘要失败，回退抽取式摘要：{str(e)}")
+        return self._summarize_extractive(previous_summary, messages)
+
+    def _summarize_extractive(self, previous_summary: Optional[str], messages: List[Dict]) -> str:
+        lines = [line for line in (previous_summary or "").splitlines() if line.strip()]
+        question = None
+        for message in messages:
+            if message["role"] == "user":
+                if question is not None:
+                    lines.append(f"- 用户：{question}")
+                question = _first_sentence(message["content"], 80)
+            elif message["role"] == "assistant":
+                answer = _first_sentence(message["content"], 120)
+                lines.append(f"- 用户：{question}；助手：{answer}" if question is not None else f"- 助手：{answer}")
+                question = None
+        if question is not None:
+            lines.append(f"- 用户：{question}")
+        # 超出长度时淘汰最早的条目，保证摘要大小基本恒定
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > self.max_chars:
+            lines.pop(0)
+        return "\n".join(lines)[:self.max_chars]
+
+    def _summarize_llm(self, previous_summary: Optional[str], messages: List[Dict]) -> str:
+        prompt = SUMMARY_PROMPT.format(
+            max_chars=self.max_chars,
+            previous_summary=previous_summary or "（无）",
+            dialogue=format_dialogue(messages),
+        )
+        response = self._get_llm().invoke(
+            [HumanMessage(content=prompt)],
+            config={"metadata": {"priority": SUMMARY_PRIORITY}}
+        )
+        content = response.content if isinstance(response.content, str) else str(response.content)
+        summary = _THINK_BLOCK.sub("", content).strip()
+        if not summary:
+            raise ValueError("模型返回的摘要为空")
+        return summary[:self.max_chars]
+
+
+_SUMMARY_MESSAGE_PREFIX = "以下是本会话更早对话的摘要：\n"
+
+
+def summary_message(summary: str) -> SystemMessage:
+    """把摘要包装为放在历史最前面的系统消息"""
+    return SystemMessage(content=f"{_SUMMARY_MESSAGE_PREFIX}{summary}")
+
+
+def summary_from_message(message: BaseMessage) -> Optional[str]:
+    """summary_message 的逆操作：是摘要系统消息时返回摘要正文，否则返回 None"""
+    if isinstance(message, SystemMessage) and isinstance(message.content, str) \
+            and message.content.startswith(_SUMMARY_MESSAGE_PREFIX):
+        return message.content[len(_SUMMARY_MESSAGE_PREFIX):]
+    return None
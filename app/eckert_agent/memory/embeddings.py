@@ -0,0 +1,85 @@
+import re
+import zlib
+from typing import List, Sequence
+
+import numpy as np
+from langchain_ollama import OllamaEmbeddings
+
+from config import EMBEDDING_PROVIDER, EMBEDDING_MODEL, EMBEDDING_DIM, EMBEDDING_BATCH_SIZE, OLLAMA_BASE_URL
+
+# 英文/数字按词切分，其余字符（中文等）逐字切分
+_TOKEN_PATTERN = re.compile(r"[a-z0-9_]+|[^\sa-z0-9_]")
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化（内积即余弦相似度），全零行保持为零"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def encode_vector(vector: np.ndarray) -> bytes:
+    """向量 → 入库的字节串（float32 小端，知识库表 embedding 列）"""
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """encode_vector 的逆操作"""
+    return np.frombuffer(data, dtype="<f4")
+
+
+class HashingEmbedder:
+    """
+    本地确定性哈希嵌入（离线可用，不需要模型）：词/字的一元、二元特征经 crc32 哈希到固定维度，带符号累加后归一化
+    只能匹配字面上相近的文本，语义能力远弱于模型嵌入，用于离线开发、压测与兜底
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        # 嵌入器标识（写入索引文件，加载时校验向量出自同一个嵌入器）
+        self.name = f"hashing:{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        return tokens + [f"{a}\x00{b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in self._features(text)), dtype=np.uint32)
+            if not hashes.size:
+                continue
+            # 低位决定维度，最高位决定符号（减少哈希冲突带来的偏差）
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            vectors[row] = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+        return normalize_rows(vectors)
+
+
+class OllamaEmbedder:
+    """Ollama 嵌入接口（/api/embed），按 batch_size 分批请求，输出归一化后的 float32 矩阵"""
+
+    def __init__(self, model: str = EMBEDDING_MODEL, base_url: str = OLLAMA_BASE_URL,
+                 batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.client = OllamaEmbeddings(model=model, base_url=base_url)
+        self.batch_size = batch_size
+        self.dim = None
+        self.name = f"ollama:{model}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        batches = [
+            np.asarray(self.client.embed_documents(list(texts[start:start + self.batch_size])), dtype=np.float32)
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        if not batches:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        vectors = np.concatenate(batches)
+        self.dim = vectors.shape[1]
+        return normalize_rows(vectors)
+
+
+def get_embedder():
+    """按配置返回嵌入器：ollama 或 hashing"""
+    if EMBEDDING_PROVIDER == "ollama":
+        return OllamaEmbedder()
+    if EMBEDDING_PROVIDER == "hashing":
+        return HashingEmbedder()
+    raise ValueError("EMBEDDING_PROVIDER 只能是 ollama 或 hashing")
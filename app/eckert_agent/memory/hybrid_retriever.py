@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import RRF_K, HYBRID_CANDIDATES
+from app.eckert_agent.memory.bm25_index import BM25Index
+from app.eckert_agent.memory.index_file import MappedIndexFile
+from app.eckert_agent.memory.vector_index import VectorIndex
+from app.eckert_agent.memory.vector_retriever import VectorRetriever
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合：每一路排名中第 r 名（从 1 开始）贡献 1 / (k + r)，只看名次不看原始分数，
+    BM25 与余弦相似度量纲不同也能直接合并
+    :return: [(文档 id, 融合分数)]，按分数从高到低
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(VectorRetriever):
+    """
+    知识库混合检索：字符二元组 BM25（精确词、工具名）+ 向量检索（换一种说法的问题），倒数排名融合
+    文档加载、增量加入、索引文件与向量检索复用 VectorRetriever，两路索引共用同一份文档（索引文件中也是同一份）
+    """
+
+    def __init__(self, table_name: str = "knowledge_base", embedder=None, index: Optional[VectorIndex] = None,
+                 bm25: Optional[BM25Index] = None, candidates: int = HYBRID_CANDIDATES, rrf_k: int = RRF_K,
+                 batch_size: int = 1000, **kwargs):
+        """
+        :param candidates: 每一路召回参与融合的候选数（不少于 top_k）
+        :param rrf_k: 倒数排名融合常数
+        """
+        super().__init__(table_name, embedder=embedder, index=index, batch_size=batch_size, **kwargs)
+        self.bm25 = bm25 or BM25Index()
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def _add(self, docs: List[Dict]):
+        super()._add(docs)
+        self.bm25.add([doc["id"] for doc in docs], [self.document_text(doc) for doc in docs])
+
+    def _reset(self):
+        super()._reset()
+        self.bm25 = BM25Index(k1=self.bm25.k1, b=self.bm25.b)
+
+    def index_sections(self) -> Dict[str, np.ndarray]:
+        return {**super().index_sections(), **self.bm25.sections()}
+
+    def _open_sections(self, mapped: MappedIndexFile) -> Optional[Dict]:
+        if "bm25_offsets" not in mapped:
+            print(f"❌ 索引文件 {mapped.path} 不含 BM25 倒排表（由纯向量检索生成），改为从数据库加载")
+            return None
+        state = super()._open_sections(mapped)
+        if state is not None:
+            state["bm25"] = BM25Index.from_sections(
+                {name: mapped.array(name) for name in (
+                    "bm25_terms", "bm25_term_offsets", "bm25_offsets", "bm25_rows", "bm25_tfs",
+                    "bm25_doc_ids", "bm25_doc_lens", "bm25_total_len")},
+                k1=self.bm25.k1, b=self.bm25.b)
+        return state
+
+    def _search_vectors(self, queries: List[str], vectors: np.ndarray, top_k: int) -> List[List[Dict]]:
+        depth = max(self.candidates, top_k)
+        results = []
+        for query, vector_hits in zip(queries, self._vector_rankings(vectors, depth)):
+            keyword_ranking = [doc_id for doc_id, _ in self.bm25.search(query, depth) if doc_id in self.documents]
+            vector_ranking = [doc_id for doc_id, _ in vector_hits]
+            fused = reciprocal_rank_fusion([keyword_ranking, vector_ranking], self.rrf_k)[:top_k]
+            results.append([{**self.documents[doc_id], "rank": score} for doc_id, score in fused])
+        return results
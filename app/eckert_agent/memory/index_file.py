@@ -0,0 +1,211 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+import numpy as np
+
+# 文件格式：魔数 + 头部长度 | JSON 头部（格式版本、元数据、各段的偏移/类型/形状） | 按 64 字节对齐的各段原始数组
+MAGIC = b"EKIDX\x00\x00\x00"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sQ")
+_ALIGN = 64
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def write_index_file(path, sections: Mapping[str, np.ndarray], meta: Dict) -> int:
+    """
+    写入索引文件：先写同目录下的临时文件并 fsync，再 os.replace 原子替换
+    已映射旧文件的进程不受影响（旧文件在最后一个映射释放后才回收），之后打开的进程读到新文件
+    :param sections: 段名 → 数组（按 C 连续顺序原样写入）
+    :param meta: 写入头部的元数据（需可 JSON 序列化）
+    :return: 文件字节数
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    layout, offset = {}, 0
+    for name, array in sections.items():
+        offset = _aligned(offset)
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset += array.nbytes
+    header = json.dumps({"format": FORMAT_VERSION, "meta": meta, "sections": layout},
+                        ensure_ascii=False).encode("utf-8")
+    data_start = _aligned(_PREFIX.size + len(header))
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, len(header)) + header)
+            for name, array in sections.items():
+                f.seek(data_start + layout[name]["offset"])
+                f.write(np.ascontiguousarray(array).data)
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return data_start + offset
+
+
+def file_identity(path) -> Optional[Tuple[int, int, int]]:
+    """文件标识（inode、修改时间、大小），用于判断索引文件是否已被替换；文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class MappedIndexFile:
+    """
+    只读映射的索引文件：各段通过 np.frombuffer 直接指向映射内存，不复制
+    多个进程映射同一文件时共享操作系统页缓存；映射在最后一个引用它的数组释放后关闭
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} 不是知识库索引文件")
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_len].decode("utf-8"))
+        if header["format"] != FORMAT_VERSION:
+            raise ValueError(f"{self.path} 的格式版本为 {header['format']}，当前只支持 {FORMAT_VERSION}")
+        self.meta: Dict = header["meta"]
+        self._sections: Dict = header["sections"]
+        self._data_start = _aligned(_PREFIX.size + header_len)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    @property
+    def nbytes(self) -> int:
+        return self.identity[2]
+
+    def array(self, name: str) -> np.ndarray:
+        """取出一段（只读数组，指向映射内存）"""
+        section = self._sections[name]
+        dtype = np.dtype(section["dtype"])
+        count = int(np.prod(section["shape"], dtype=np.int64))
+        return np.frombuffer(self._mmap, dtype=dtype, count=count,
+                             offset=self._data_start + section["offset"]).reshape(section["shape"])
+
+
+def pack_strings(values) -> Tuple[np.ndarray, np.ndarray]:
+    """字符串序列 → (utf-8 拼接后的字节数组, 起止偏移数组)，第 i 个为 blob[offsets[i]:offsets[i+1]]"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class TermTable:
+    """映射内存中按 utf-8 字节序排好的词表，二分查找（词 id 即排序后的位置，启动时不需要构建字典）"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, term_id: int) -> bytes:
+        return self._blob[self._offsets[term_id]:self._offsets[term_id + 1]].tobytes()
+
+    def get(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        pos = bisect.bisect_left(self, key)
+        return pos if pos < len(self) and self[pos] == key else None
+
+    def terms(self) -> Iterator[str]:
+        for term_id in range(len(self)):
+            yield self[term_id].decode("utf-8")
+
+
+def document_sections(documents: Mapping[int, Dict]) -> Dict[str, np.ndarray]:
+    """文档表的段：按 id 排序的 id 数组 + 每篇文档 JSON（title/content/keywords）的起止偏移与字节数组"""
+    ids = np.fromiter(documents.keys(), dtype=np.int64, count=len(documents))
+    ids.sort()
+    blob, offsets = pack_strings(
+        json.dumps({field: documents[doc_id].get(field) or "" for field in ("title", "content", "keywords")},
+                   ensure_ascii=False)
+        for doc_id in ids.tolist()
+    )
+    return {"doc_ids": ids, "doc_offsets": offsets, "doc_blob": blob}
+
+
+class MappedDocuments(MutableMapping):
+    """
+    文档 id → 文档行，底层为映射内存中的文档表（命中时才解码该文档）
+    之后的增删记在内存中（新增/覆盖的文档放在 added，删除或被覆盖的底层文档记入 removed）
+    """
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray, blob: np.ndarray):
+        self._ids = ids
+        self._offsets = offsets
+        self._blob = blob
+        self._added: Dict[int, Dict] = {}
+        self._removed = set()
+
+    @classmethod
+    def from_file(cls, mapped: MappedIndexFile) -> "MappedDocuments":
+        return cls(mapped.array("doc_ids"), mapped.array("doc_offsets"), mapped.array("doc_blob"))
+
+    def _position(self, doc_id: int) -> int:
+        """底层文档表中的位置，不存在返回 -1"""
+        pos = int(np.searchsorted(self._ids, doc_id))
+        return pos if pos < len(self._ids) and self._ids[pos] == doc_id else -1
+
+    def __contains__(self, doc_id) -> bool:
+        if doc_id in self._added:
+            return True
+        return doc_id not in self._removed and self._position(doc_id) >= 0
+
+    def __getitem__(self, doc_id: int) -> Dict:
+        doc = self._added.get(doc_id)
+        if doc is not None:
+            return doc
+        pos = -1 if doc_id in self._removed else self._position(doc_id)
+        if pos < 0:
+            raise KeyError(doc_id)
+        raw = self._blob[self._offsets[pos]:self._offsets[pos + 1]].tobytes()
+        return {"id": int(doc_id), **json.loads(raw.decode("utf-8"))}
+
+    def __setitem__(self, doc_id: int, doc: Dict):
+        if doc_id not in self._added and self._position(doc_id) >= 0:
+            self._removed.add(doc_id)
+        self._added[doc_id] = doc
+
+    def __delitem__(self, doc_id: int):
+        if doc_id in self._added:
+            del self._added[doc_id]
+        elif doc_id not in self._removed and self._position(doc_id) >= 0:
+            self._removed.add(doc_id)
+        else:
+            raise KeyError(doc_id)
+
+    def __iter__(self) -> Iterator[int]:
+        for doc_id in self._ids.tolist():
+            if doc_id not in self._removed:
+                yield doc_id
+        yield from self._added
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._removed) + len(self._added)
@@ -0,0 +1,242 @@
+import hashlib
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from psycopg import sql
+
+from config import KNOWLEDGE_CHUNK_MAX_CHARS, KNOWLEDGE_INGEST_BATCH
+from app.eckert_agent.memory.knowledge_retriever import KnowledgeRetriever
+from app.eckert_agent.memory.pg_pool import pooled_connection
+
+MARKDOWN_PATTERNS = ("*.md", "*.markdown")
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+class MarkdownChunk(NamedTuple):
+    heading: str
+    content: str
+
+
+def iter_markdown_files(root: Path, patterns: Sequence[str] = MARKDOWN_PATTERNS) -> Iterator[Path]:
+    """递归遍历目录下的 markdown 文件（按路径排序，结果稳定）"""
+    yield from sorted({path for pattern in patterns for path in root.rglob(pattern) if path.is_file()})
+
+
+def split_markdown(lines: Iterable[str], max_chars: int = KNOWLEDGE_CHUNK_MAX_CHARS) -> Iterator[MarkdownChunk]:
+    """
+    流式切分 markdown：按标题切节（代码块内的 # 不算标题），节内超过 max_chars 时在空行处继续切，
+    超过 2 倍仍无空行（如超长代码块）时强制切分；heading 为各级标题路径（H1 > H2 > H3）
+    """
+    headings: List[str] = []
+    buffer: List[str] = []
+    size = 0
+    in_fence = False
+
+    def flush() -> Iterator[MarkdownChunk]:
+        nonlocal buffer, size
+        content = "\n".join(buffer).strip()
+        buffer, size = [], 0
+        if content:
+            yield MarkdownChunk(" > ".join(headings), content)
+
+    for line in lines:
+        line = line.rstrip("\n")
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        heading = None if in_fence else _HEADING.match(line)
+        if heading:
+            yield from flush()
+            level = len(heading.group(1))
+            del headings[level - 1:]
+            # 跳级标题（如 H1 后直接 H3）按实际层数记录
+            headings.append(heading.group(2))
+            continue
+        buffer.append(line)
+        size += len(line) + 1
+        if (size >= max_chars and not in_fence and not line.strip()) or size >= max_chars * 2:
+            yield from flush()
+    yield from flush()
+
+
+def content_hash(content: str) -> str:
+    """切片内容哈希（空白归一化后 sha256），用于去重"""
+    return hashlib.sha256(" ".join(content.split()).encode("utf-8")).hexdigest()
+
+
+def source_key(path: Path) -> str:
+    """来源标识：在当前工作目录下时为相对路径（与机器无关），否则为绝对路径"""
+    path = path.resolve()
+    try:
+        return path.relative_to(Path.cwd().resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class KnowledgeIngestor:
+    """
+    知识库批量导入：遍历目录 → markdown 按标题/长度切片 → 每批嵌入 → 内容哈希去重 → 批量写入（文本与向量）
+    - 增量：来源表记录每个文件的哈希，未变化的文件直接跳过；变化的文件在同一事务内删除旧切片、写入新切片
+    - 去重：content_hash 唯一索引，重复切片（跨文件或文件内）只保留第一次写入的一份；
+      该切片随原文件删除或修改后，其他文件中的相同内容要等那些文件再次导入时才会补回
+    - 嵌入：每批切片写入前嵌入，向量存入 embedding 列，各进程加载进程内索引时直接读取，不再重复嵌入
+    - 每个有变化的文件在写入事务内递增一次知识库版本号，检索缓存随之失效
+    """
+
+    def __init__(self, retriever: Optional[KnowledgeRetriever] = None, max_chars: int = KNOWLEDGE_CHUNK_MAX_CHARS,
+                 batch_size: int = KNOWLEDGE_INGEST_BATCH, embed: Optional[bool] = None):
+        """
+        :param retriever: 目标知识库，不传时使用默认的 knowledge_base
+        :param max_chars: 单个切片的最大字符数
+        :param batch_size: 每批写入（嵌入）的切片数
+        :param embed: 是否在导入时嵌入并存储向量，不传时按检索方式决定（hybrid/vector 嵌入，fulltext 不嵌入）
+        """
+        self.retriever = retriever or KnowledgeRetriever()
+        self.max_chars = max_chars
+        self.batch_size = batch_size
+        self.embed = self.retriever.search_mode != "fulltext" if embed is None else embed
+        self.table = sql.Identifier(self.retriever.table_name)
+        self.sources_table = sql.Identifier(f"{self.retriever.table_name}_sources")
+        self._init_table()
+
+    def _init_table(self):
+        with pooled_connection("PostgreSQL 知识库") as conn:
+            # 去重依赖 content_hash 唯一索引（新表建表时创建，老表由迁移补齐）
+            hash_index = f"idx_{self.retriever.table_name}_content_hash"
+            if conn.execute("SELECT to_regclass(%s)", (hash_index,)).fetchone()[0] is None:
+                raise Exception(f"知识库表 {self.retriever.table_name} 缺少 content_hash 唯一索引，"
+                                f"请先执行 python knowledge_cli.py migrate")
+            if self.embed and not self.retriever.has_embedding:
+                raise Exception(f"知识库表 {self.retriever.table_name} 缺少 embedding 列，"
+                                f"请先执行 python knowledge_cli.py migrate")
+            conn.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {sources} (
+                    source TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    chunk_count INT NOT NULL,
+                    ingested_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """).format(sources=self.sources_table))
+
+    def ingest_directory(self, root, patterns: Sequence[str] = MARKDOWN_PATTERNS, prune: bool = False) -> Dict:
+        """
+        导入目录下的 markdown 文件（来源记为 source_key，在仓库根目录运行时为仓库内相对路径）
+        :param prune: 为 True 时删除 root 目录下已不存在的文件的切片与来源记录
+        :return: 文件数、跳过/删除的文件数、写入/重复的切片数、耗时、文档/秒、切片/秒
+        """
+        root = Path(root)
+        start = time.perf_counter()
+        report = {"files": 0, "skipped_files": 0, "removed_files": 0, "chunks": 0, "duplicate_chunks": 0}
+        with pooled_connection("PostgreSQL 知识库") as conn:
+            known = dict(conn.execute(sql.SQL("SELECT source, file_hash FROM {sources}").format(
+                sources=self.sources_table)).fetchall())
+        seen = set()
+        for path in iter_markdown_files(root, patterns):
+            source = source_key(path)
+            seen.add(source)
+            digest = file_hash(path)
+            if known.get(source) == digest:
+                report["skipped_files"] += 1
+                continue
+            inserted, duplicates = self.ingest_file(path, source, digest)
+            report["files"] += 1
+            report["chunks"] += inserted
+            report["duplicate_chunks"] += duplicates
+        if prune:
+            prefix = source_key(root).rstrip("/") + "/"
+            for source in {key for key in known if key.startswith(prefix)} - seen:
+                self.remove_source(source)
+                report["removed_files"] += 1
+        elapsed = time.perf_counter() - start
+        report["seconds"] = round(elapsed, 3)
+        report["docs_per_sec"] = round(report["files"] / elapsed, 1) if elapsed else 0
+        # 切片吞吐按处理的切片计（含因重复跳过的）
+        processed = report["chunks"] + report["duplicate_chunks"]
+        report["chunks_per_sec"] = round(processed / elapsed) if elapsed else 0
+        return report
+
+    def ingest_file(self, path: Path, source: str, digest: Optional[str] = None) -> Tuple[int, int]:
+        """
+        导入单个文件（同一事务内替换该来源的全部切片并更新来源表）
+        :return: (写入的切片数, 因重复跳过的切片数)
+        """
+        digest = digest or file_hash(path)
+        inserted, attempted, new_docs = 0, 0, []
+        with pooled_connection("PostgreSQL 知识库") as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("DELETE FROM {table} WHERE source = %s RETURNING id").format(table=self.table),
+                            (source,))
+                removed = [row[0] for row in cur.fetchall()]
+                with open(path, encoding="utf-8") as f:
+                    batch = []
+                    for chunk in split_markdown(f, self.max_chars):
+                        batch.append(chunk)
+                        if len(batch) >= self.batch_size:
+                            new_docs += self._insert_batch(cur, source, path.stem, batch)
+                            attempted += len(batch)
+                            batch = []
+                    if batch:
+                        new_docs += self._insert_batch(cur, source, path.stem, batch)
+                        attempted += len(batch)
+                inserted = len(new_docs)
+                version = (self.retriever.bump_version(cur, [doc["id"] for doc in new_docs], removed)
+                           if removed or new_docs else None)
+                cur.execute(sql.SQL("""
+                    INSERT INTO {sources} (source, file_hash, chunk_count) VALUES (%s, %s, %s)
+                    ON CONFLICT (source) DO UPDATE
+                    SET file_hash = EXCLUDED.file_hash, chunk_count = EXCLUDED.chunk_count, ingested_at = CURRENT_TIMESTAMP
+                """).format(sources=self.sources_table), (source, digest, inserted))
+            conn.commit()
+        self.retriever.sync_memory_index(removed, new_docs, version)
+        return inserted, attempted - inserted
+
+    def _insert_batch(self, cur, source: str, keywords: str, chunks: List[MarkdownChunk]) -> List[Dict]:
+        """
+        一条 INSERT ... SELECT unnest 写入一批切片（开启嵌入时连同向量），内容哈希冲突的跳过，
+        返回实际写入的行（含向量，进程内索引同步时直接使用）
+        """
+        titles = [chunk.heading or keywords for chunk in chunks]
+        contents = [chunk.content for chunk in chunks]
+        embeddings = self.retriever.embed_documents(
+            [{"title": title, "content": content, "keywords": keywords} for title, content in zip(titles, contents)]
+        ) if self.embed else [None] * len(chunks)
+        embedder = self.retriever.embedder_name if self.embed else None
+        # 老表（未迁移、不嵌入）没有 embedding/embedder 列
+        has_embedding = self.retriever.has_embedding
+        vector_columns = sql.SQL(", embedding, embedder" if has_embedding else "")
+        cur.execute(sql.SQL("""
+            INSERT INTO {table} (title, content, keywords, source, content_hash{vector_columns})
+            SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::text[]{vector_arrays})
+            ON CONFLICT (content_hash) DO NOTHING
+            RETURNING id, title, content, keywords{vector_columns}
+        """).format(table=self.table, vector_columns=vector_columns,
+                    vector_arrays=sql.SQL(", %s::bytea[], %s::text[]" if has_embedding else "")), (
+            titles, contents, [keywords] * len(chunks), [source] * len(chunks), [content_hash(c) for c in contents],
+            *((embeddings, [embedder] * len(chunks)) if has_embedding else ()),
+        ))
+        columns = [column.name for column in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def remove_source(self, source: str) -> int:
+        """删除一个来源文件的全部切片与来源记录，返回删除的切片数"""
+        with pooled_connection("PostgreSQL 知识库") as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("DELETE FROM {table} WHERE source = %s RETURNING id").format(table=self.table),
+                            (source,))
+                removed = [row[0] for row in cur.fetchall()]
+                cur.execute(sql.SQL("DELETE FROM {sources} WHERE source = %s").format(sources=self.sources_table),
+                            (source,))
+                version = self.retriever.bump_version(cur, removed_ids=removed) if removed else None
+            conn.commit()
+        self.retriever.sync_memory_index(removed, [], version)
+        return len(removed)
@@ -1,79 +1,424 @@
+import time
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
 
-import psycopg
-from typing import List, Dict
-from config import PG_HOST, PG_PORT, PG_USER, PG_PASSWORD, PG_DB
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from config import KNOWLEDGE_TS_CONFIG, KNOWLEDGE_WEIGHT_TITLE, KNOWLEDGE_WEIGHT_KEYWORDS, KNOWLEDGE_WEIGHT_CONTENT
+from config import KNOWLEDGE_SEARCH_MODE, KNOWLEDGE_CACHE_ENABLED, KNOWLEDGE_CACHE_VERSION_CHECK, KNOWLEDGE_INDEX_DIR
+from app.eckert_agent.memory.pg_pool import (
+    PG_CONN_PARAMS, autocommit_connection, create_index_concurrently, pooled_connection,
+)
+from app.eckert_agent.memory.embeddings import encode_vector
+from app.eckert_agent.memory.hybrid_retriever import HybridRetriever
+from app.eckert_agent.memory.retrieval_cache import RetrievalCache, get_retrieval_cache, make_retrieval_key
+from app.eckert_agent.memory.vector_retriever import VectorRetriever
+
+SEARCH_MODES = ("hybrid", "vector", "fulltext")
+
+# 变更记录保留的版本数：落后更多版本的进程内索引只能从数据库整体重新加载
+_CHANGE_LOG_KEEP = 1000
+
+# 检索语句：只查预先生成的 search_vector（GIN 索引），不再对每行现算 to_tsvector
+_SEARCH_SQL = """
+SELECT id, title, content, keywords, ts_rank(%(weights)s::float4[], {vector}, query) AS rank
+FROM {table}, plainto_tsquery(%(config)s::regconfig, %(query)s) AS query
+WHERE {vector} @@ query
+ORDER BY rank DESC, id
+LIMIT %(top_k)s
+"""
+
+# search_vector 的生成表达式（{config} 为文本搜索配置）；老表执行迁移前检索时按同一表达式现算
+_SEARCH_VECTOR_EXPR = """
+setweight(to_tsvector({config}::regconfig, coalesce(title, '')), 'A') ||
+setweight(to_tsvector({config}::regconfig, coalesce(keywords, '')), 'B') ||
+setweight(to_tsvector({config}::regconfig, coalesce(content, '')), 'C')
+"""
 
 
 class KnowledgeRetriever:
     """PostgreSQL知识库检索类（MD文档）"""
+    # 已完成建表的表 → (search_vector 使用的文本搜索配置, 是否已有 search_vector 列, 是否已有 embedding/embedder 列)
+    # （每个进程每张表只检查一次）
+    _ready_tables: Dict[str, Tuple[str, bool, bool]] = {}
+    # 表 → (知识库版本号, 读取时间)：检索缓存键的一部分，本进程写入后立即更新，其他进程的写入按间隔重读
+    _versions: Dict[str, Tuple[int, float]] = {}
 
-    def __init__(self):
-        self.conn_params = {
-            "host": PG_HOST,
-            "port": PG_PORT,
-            "user": PG_USER,
-            "password": PG_PASSWORD,
-            "dbname": PG_DB
-        }
+    def __init__(self, table_name: str = "knowledge_base", search_mode: str = KNOWLEDGE_SEARCH_MODE,
+                 cache: Optional[RetrievalCache] = None):
+        """
+        :param table_name: 知识库表名（压测等场景可使用独立的表）
+        :param search_mode: 检索方式：hybrid（BM25 + 向量融合）、vector（向量检索）或 fulltext（全文检索）
+        :param cache: 检索结果缓存，不传时按 KNOWLEDGE_CACHE_ENABLED 使用进程内共用的缓存（未开启则不缓存）
+        """
+        if search_mode not in SEARCH_MODES:
+            raise ValueError("KNOWLEDGE_SEARCH_MODE 只能是 hybrid、vector 或 fulltext")
+        self.conn_params = PG_CONN_PARAMS
+        self.table_name = table_name
+        self.search_mode = search_mode
+        self._memory_retriever: Optional[VectorRetriever] = None
+        self.cache = cache or (get_retrieval_cache() if KNOWLEDGE_CACHE_ENABLED else None)
+        # ts_rank 权重数组顺序为 {D, C, B, A}：正文 C、关键词 B、标题 A
+        self.rank_weights = [0.0, KNOWLEDGE_WEIGHT_CONTENT, KNOWLEDGE_WEIGHT_KEYWORDS, KNOWLEDGE_WEIGHT_TITLE]
+        if table_name not in KnowledgeRetriever._ready_tables:
+            KnowledgeRetriever._ready_tables[table_name] = self._init_table()
+        self.ts_config, self.has_search_vector, self.has_embedding = KnowledgeRetriever._ready_tables[table_name]
 
     def _get_connection(self):
-        """获取数据库连接"""
-        try:
-            return psycopg.connect(**self.conn_params)
-        except psycopg.OperationalError as e:
-            raise Exception(f"PostgreSQL 知识库连接失败：{str(e)}")
+        """从共享连接池借出连接（with 退出时提交并归还）"""
+        return pooled_connection("PostgreSQL 知识库")
 
-    def add_knowledge(self, title: str, content: str, keywords: str = ""):
-        """添加MD文档到知识库"""
+    def _index_names(self) -> Dict[str, str]:
+        return {
+            "search_vector": f"idx_{self.table_name}_search_vector",
+            "source": f"idx_{self.table_name}_source",
+            "content_hash": f"idx_{self.table_name}_content_hash",
+        }
+
+    def _resolve_ts_config(self, cur) -> str:
+        """新建 search_vector 时使用的文本搜索配置：KNOWLEDGE_TS_CONFIG 不存在时回退 simple"""
+        if self._ts_config_exists(cur, KNOWLEDGE_TS_CONFIG):
+            return KNOWLEDGE_TS_CONFIG
+        print(f"❌ 文本搜索配置 {KNOWLEDGE_TS_CONFIG} 不存在（chinese 需要 zhparser 扩展），知识库检索回退为 simple")
+        return "simple"
+
+    def _search_vector_config(self, cur) -> Optional[str]:
+        """现有 search_vector 列使用的文本搜索配置（记录在列注释中），没有该列时返回 None"""
+        cur.execute(
+            """
+            SELECT col_description(attrelid, attnum)
+            FROM pg_attribute
+            WHERE attrelid = to_regclass(%s) AND attname = 'search_vector' AND NOT attisdropped
+            """,
+            (self.table_name,)
+        )
+        row = cur.fetchone()
+        return None if row is None else row[0] or KNOWLEDGE_TS_CONFIG
+
+    def _has_embedding_columns(self, cur) -> bool:
+        cur.execute(
+            """
+            SELECT count(*) FROM pg_attribute
+            WHERE attrelid = to_regclass(%s) AND attname IN ('embedding', 'embedder') AND NOT attisdropped
+            """,
+            (self.table_name,)
+        )
+        return cur.fetchone()[0] == 2
+
+    def _init_table(self) -> Tuple[str, bool, bool]:
+        """
+        建表：表不存在时连同检索列与索引一起创建（空表，不需要重写或长时间锁表）；
+        search_vector 为存储型生成列（标题 A、关键词 B、正文 C 三档权重），配 GIN 索引，写入时由数据库计算一次；
+        embedding 为写入时嵌入的向量（float32 字节串，embedder 记录生成它的嵌入器），进程内检索加载时直接使用
+        已有的老表启动时只检查，缺少检索列/索引时提示执行 python knowledge_cli.py migrate，迁移前全文检索现算 tsvector
+        :return: (search_vector 使用的文本搜索配置（记录在列注释中，已有列以注释为准）, 是否已有 search_vector 列,
+                  是否已有 embedding/embedder 列)
+        """
+        table = sql.Identifier(self.table_name)
+        indexes = self._index_names()
         with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s)", (self.table_name,))
+                if cur.fetchone()[0] is None:
+                    ts_config = self._resolve_ts_config(cur)
+                    # 生成列表达式不能带参数，配置名已在 pg_ts_config 中校验过，以字面量写入
+                    # source 为批量导入的来源文件（增量导入时按文件整体替换），content_hash 为内容哈希（唯一，重复切片只保留一份）
+                    cur.execute(sql.SQL("""
+                        CREATE TABLE IF NOT EXISTS {table} (
+                            id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+                            title TEXT NOT NULL,
+                            content TEXT NOT NULL,
+                            keywords TEXT NOT NULL DEFAULT '',
+                            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                            source TEXT,
+                            content_hash TEXT,
+                            embedding BYTEA,
+                            embedder TEXT,
+                            search_vector tsvector GENERATED ALWAYS AS ({expr}) STORED
+                        );
+                        COMMENT ON COLUMN {table}.search_vector IS {config};
+                        CREATE INDEX IF NOT EXISTS {vector_index} ON {table} USING GIN (search_vector);
+                        CREATE INDEX IF NOT EXISTS {source_index} ON {table} (source);
+                        CREATE UNIQUE INDEX IF NOT EXISTS {hash_index} ON {table} (content_hash);
+                    """).format(
+                        table=table, config=sql.Literal(ts_config),
+                        expr=sql.SQL(_SEARCH_VECTOR_EXPR).format(config=sql.Literal(ts_config)),
+                        vector_index=sql.Identifier(indexes["search_vector"]),
+                        source_index=sql.Identifier(indexes["source"]),
+                        hash_index=sql.Identifier(indexes["content_hash"]),
+                    ))
+                    has_search_vector = has_embedding = True
+                else:
+                    ts_config = self._search_vector_config(cur)
+                    has_search_vector = ts_config is not None
+                    if ts_config is None:
+                        ts_config = self._resolve_ts_config(cur)
+                    # 回退 simple 建列后又安装了对应扩展时提示重建
+                    elif ts_config != KNOWLEDGE_TS_CONFIG and self._ts_config_exists(cur, KNOWLEDGE_TS_CONFIG):
+                        print(f"❌ {self.table_name}.search_vector 使用 {ts_config} 建立，"
+                              f"切换到 {KNOWLEDGE_TS_CONFIG} 需要删除该列后重建")
+                    has_embedding = self._has_embedding_columns(cur)
+                    cur.execute("SELECT " + ", ".join(["to_regclass(%s)"] * len(indexes)), list(indexes.values()))
+                    if not has_search_vector or not has_embedding or None in cur.fetchone():
+                        print(f"❌ 知识库表 {self.table_name} 缺少检索列或索引（全文检索会逐行计算、批量导入不可用、"
+                              f"向量不落库），"
+                              f"请执行 python knowledge_cli.py migrate")
+                # 知识库版本号（每张知识库表一行），写入时递增，检索缓存据此失效；
+                # 每个版本增删的文档记入 knowledge_changes，其他进程的进程内索引据此追上（changes_since 之前的已清理）
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS knowledge_versions (
+                        table_name TEXT PRIMARY KEY,
+                        version BIGINT NOT NULL,
+                        changes_since BIGINT NOT NULL DEFAULT 0,
+                        updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );
+                    ALTER TABLE knowledge_versions ADD COLUMN IF NOT EXISTS changes_since BIGINT NOT NULL DEFAULT 0;
+                    CREATE TABLE IF NOT EXISTS knowledge_changes (
+                        table_name TEXT NOT NULL,
+                        version BIGINT NOT NULL,
+                        doc_id BIGINT NOT NULL,
+                        deleted BOOLEAN NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_knowledge_changes_version ON knowledge_changes (table_name, version);
+                """)
+            conn.commit()
+        return ts_config, has_search_vector, has_embedding
+
+    def migrate(self, lock_timeout: float = 5.0) -> Dict:
+        """
+        老表迁移（显式执行：python knowledge_cli.py migrate），在自动提交连接上逐步执行：
+        1. 补 source / content_hash / embedding / embedder 列（可空无默认值，只改元数据）
+        2. 补 search_vector 存储型生成列：会重写整表并在期间锁表，请在低峰期执行
+        3. CONCURRENTLY 创建 GIN、source、content_hash 索引，不阻塞读写
+        加列时设置 lock_timeout，拿不到表锁时直接失败（可稍后重试），不在锁队列中堵住其他读写
+        :return: 本次执行的步骤
+        """
+        table = sql.Identifier(self.table_name)
+        indexes = self._index_names()
+        steps = []
+        with autocommit_connection("PostgreSQL 知识库迁移") as conn:
+            conn.execute(sql.SQL("SET lock_timeout = {ms}").format(ms=sql.Literal(int(lock_timeout * 1000))))
             with conn.cursor() as cur:
                 cur.execute(
                     """
-                    INSERT INTO knowledge_base (title, content, keywords)
-                    VALUES (%s, %s, %s)
+                    SELECT attname FROM pg_attribute
+                    WHERE attrelid = to_regclass(%s) AND NOT attisdropped
+                      AND attname IN ('source', 'content_hash', 'embedding', 'embedder')
                     """,
-                    (title, content, keywords)
+                    (self.table_name,)
+                )
+                if len(cur.fetchall()) < 4:
+                    cur.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS source TEXT, "
+                                        "ADD COLUMN IF NOT EXISTS content_hash TEXT, "
+                                        "ADD COLUMN IF NOT EXISTS embedding BYTEA, "
+                                        "ADD COLUMN IF NOT EXISTS embedder TEXT").format(table=table))
+                    steps.append("add source/content_hash/embedding/embedder")
+                ts_config = self._search_vector_config(cur)
+                if ts_config is None:
+                    ts_config = self._resolve_ts_config(cur)
+                    start = time.perf_counter()
+                    cur.execute(sql.SQL("""
+                        ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+                            GENERATED ALWAYS AS ({expr}) STORED
+                    """).format(table=table, expr=sql.SQL(_SEARCH_VECTOR_EXPR).format(config=sql.Literal(ts_config))))
+                    cur.execute(sql.SQL("COMMENT ON COLUMN {table}.search_vector IS {config}").format(
+                        table=table, config=sql.Literal(ts_config)))
+                    steps.append(f"add search_vector ({ts_config}, {time.perf_counter() - start:.1f}s)")
+            conn.execute("RESET lock_timeout")
+            for column, index_sql in (
+                    ("search_vector", "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} USING GIN (search_vector)"),
+                    ("source", "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} (source)"),
+                    ("content_hash", "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} (content_hash)"),
+            ):
+                statement = sql.SQL(index_sql).format(index=sql.Identifier(indexes[column]), table=table)
+                if create_index_concurrently(conn, indexes[column], statement):
+                    steps.append(f"create index {indexes[column]}")
+        KnowledgeRetriever._ready_tables[self.table_name] = (ts_config, True, True)
+        self.ts_config, self.has_search_vector, self.has_embedding = ts_config, True, True
+        if self._memory_retriever is not None:
+            self._memory_retriever._stored_embeddings = None
+        print(f"✅ 知识库表 {self.table_name} 迁移完成：{', '.join(steps) or '无需变更'}")
+        return {"table": self.table_name, "ts_config": ts_config, "steps": steps}
+
+    @property
+    def index_path(self) -> Optional[Path]:
+        """进程内检索索引文件的路径（未配置 KNOWLEDGE_INDEX_DIR 时为 None）"""
+        return Path(KNOWLEDGE_INDEX_DIR) / f"{self.table_name}.idx" if KNOWLEDGE_INDEX_DIR else None
+
+    def _memory_retriever_cls(self):
+        return HybridRetriever if self.search_mode == "hybrid" else VectorRetriever
+
+    @property
+    def memory_retriever(self) -> VectorRetriever:
+        """
+        进程内检索器：hybrid 为 BM25 + 向量融合，vector 为纯向量检索
+        首次使用时创建，首次检索时加载（有索引文件时直接映射，否则读全表）
+        """
+        if self._memory_retriever is None:
+            self._memory_retriever = self._memory_retriever_cls()(self.table_name, index_path=self.index_path)
+        return self._memory_retriever
+
+    @property
+    def embedder_name(self) -> Optional[str]:
+        """写入 embedder 列的嵌入器标识（与进程内检索使用的嵌入器一致）"""
+        return getattr(self.memory_retriever.embedder, "name", None)
+
+    def embed_documents(self, docs: List[Dict]) -> List[bytes]:
+        """写入前嵌入文档（标题、关键词、正文），返回写入 embedding 列的字节串"""
+        vectors = self.memory_retriever.embedder.embed([VectorRetriever.document_text(doc) for doc in docs])
+        return [encode_vector(vector) for vector in vectors]
+
+    def build_index_file(self, path=None) -> Dict:
+        """
+        从数据库全量重建进程内检索索引并写成索引文件（先写临时文件再原子替换，运行中的进程检查到后自动切换）
+        :param path: 输出路径，默认为 KNOWLEDGE_INDEX_DIR 下的 {表名}.idx
+        :return: 路径、知识库版本号、文档数、文件字节数、耗时
+        """
+        if self.search_mode == "fulltext":
+            raise ValueError("fulltext 检索不使用进程内索引，不需要生成索引文件")
+        path = Path(path) if path else self.index_path
+        if path is None:
+            raise ValueError("未配置 KNOWLEDGE_INDEX_DIR，需要指定索引文件路径")
+        start = time.perf_counter()
+        # 先读版本号再读数据：读取期间有写入时文件记录的是较旧的版本，不会把新版本标成已包含
+        version = self.current_version()
+        retriever = self._memory_retriever_cls()(self.table_name)
+        size = retriever.build_index_file(path, version)
+        return {"path": str(path), "version": version, "documents": len(retriever.documents), "bytes": size,
+                "seconds": round(time.perf_counter() - start, 3)}
+
+    def current_version(self) -> int:
+        """知识库版本号（距上次读取超过 KNOWLEDGE_CACHE_VERSION_CHECK 秒时重新从数据库读取）"""
+        cached = KnowledgeRetriever._versions.get(self.table_name)
+        if cached is not None and time.monotonic() - cached[1] < KNOWLEDGE_CACHE_VERSION_CHECK:
+            return cached[0]
+        with self._get_connection() as conn:
+            row = conn.execute("SELECT version FROM knowledge_versions WHERE table_name = %s",
+                               (self.table_name,)).fetchone()
+        version = row[0] if row else 0
+        KnowledgeRetriever._versions[self.table_name] = (version, time.monotonic())
+        return version
+
+    def bump_version(self, cur, added_ids: List[int] = (), removed_ids: List[int] = ()) -> int:
+        """
+        在写入知识库的事务内递增版本号并记录本次增删的文档（提交后把返回值传给 sync_memory_index）
+        版本号行在事务结束前被锁住，写入按版本号顺序提交，读到版本 v 的进程一定能读到 v 及之前的全部变更
+        :return: 新版本号
+        """
+        cur.execute(
+            """
+            INSERT INTO knowledge_versions (table_name, version) VALUES (%s, 1)
+            ON CONFLICT (table_name) DO UPDATE
+            SET version = knowledge_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+            RETURNING version
+            """,
+            (self.table_name,)
+        )
+        version = cur.fetchone()[0]
+        doc_ids = list(added_ids) + list(removed_ids)
+        if doc_ids:
+            cur.execute(
+                """
+                INSERT INTO knowledge_changes (table_name, version, doc_id, deleted)
+                SELECT %s, %s, doc_id, deleted FROM unnest(%s::bigint[], %s::boolean[]) AS c(doc_id, deleted)
+                """,
+                (self.table_name, version, doc_ids, [False] * len(added_ids) + [True] * len(removed_ids))
+            )
+        if version % _CHANGE_LOG_KEEP == 0:
+            cur.execute("DELETE FROM knowledge_changes WHERE table_name = %s AND version <= %s",
+                        (self.table_name, version - _CHANGE_LOG_KEEP))
+            cur.execute("UPDATE knowledge_versions SET changes_since = %s WHERE table_name = %s",
+                        (version - _CHANGE_LOG_KEEP, self.table_name))
+        return version
+
+    def sync_memory_index(self, removed_ids: List[int], added_docs: List[Dict], version: Optional[int] = None):
+        """
+        写入提交后调用：本进程立即切换到新版本号（旧缓存不再命中）；
+        进程内检索索引已加载时同步增删（新文档在这里嵌入），未加载时跳过，首次检索会全量加载
+        """
+        if version is not None:
+            KnowledgeRetriever._versions[self.table_name] = (version, time.monotonic())
+        if self._memory_retriever is not None:
+            self._memory_retriever.remove_documents(removed_ids)
+            self._memory_retriever.add_documents(added_docs)
+            if version is not None:
+                self._memory_retriever.advance_version(version)
+
+    @staticmethod
+    def _ts_config_exists(cur, ts_config: str) -> bool:
+        cur.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = %s", (ts_config,))
+        return cur.fetchone() is not None
+
+    def add_knowledge(self, title: str, content: str, keywords: str = ""):
+        """
+        添加MD文档到知识库（search_vector 由数据库在写入时生成；使用进程内检索时同时写入向量，
+        已加载的进程内索引直接使用该向量同步加入）
+        """
+        doc = {"title": title, "content": content, "keywords": keywords}
+        if self.search_mode != "fulltext" and self.has_embedding:
+            doc["embedding"], doc["embedder"] = self.embed_documents([doc])[0], self.embedder_name
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL("INSERT INTO {table} ({columns}) VALUES ({values}) RETURNING id").format(
+                        table=sql.Identifier(self.table_name),
+                        columns=sql.SQL(", ").join(map(sql.Identifier, doc)),
+                        values=sql.SQL(", ").join(sql.Placeholder() * len(doc))),
+                    list(doc.values())
                 )
+                doc["id"] = cur.fetchone()[0]
+                version = self.bump_version(cur, [doc["id"]])
             conn.commit()
+        self.sync_memory_index([], [doc], version)
         print(f"✅ 知识库文档「{title}」添加成功")
 
     def search_knowledge(self, query: str, top_k: int = 3) -> List[Dict]:
-        return []
         """
-        检索知识库（基于关键词匹配+全文检索）
+        检索知识库（按 search_mode 走全文检索或向量检索；开启缓存时相同问题在知识库未变化前直接返回缓存结果）
         :param query: 用户问题（检索关键词）
         :param top_k: 返回最相关的top_k条结果
-        :return: 检索结果列表（含title/content）
-        """
-        # PostgreSQL全文检索语法（适配中文）
-        search_sql = """
-                     SELECT title, \
-                            content,
-                            ts_rank(to_tsvector('chinese', content), plainto_tsquery('chinese', %s)) AS rank
-                     FROM knowledge_base
-                     WHERE to_tsvector('chinese', content) @@ plainto_tsquery('chinese' \
-                         , %s)
-                        OR to_tsvector('chinese' \
-                         , title) @@ plainto_tsquery('chinese' \
-                         , %s)
-                        OR to_tsvector('chinese' \
-                         , keywords) @@ plainto_tsquery('chinese' \
-                         , %s)
-                     ORDER BY rank DESC
-                         LIMIT %s \
-                     """
+        :return: 检索结果列表（含id/title/content/keywords/rank）
+        """
+        if not query or not query.strip():
+            return []
+        version = self.current_version()
+        if self.cache is None:
+            return self._search(query, top_k, version)
+        key = make_retrieval_key(self.table_name, self.search_mode, version, query, top_k)
+        # 进程内索引没能追上该版本时（读取变更失败、检索中切换到了较旧的索引文件）结果不写入缓存
+        return self.cache.get_or_search(key, lambda: self._search(query, top_k, version), self.table_name, version,
+                                        is_fresh=lambda: self._index_version() >= version)
+
+    def cache_stats(self) -> Optional[Dict]:
+        """检索缓存命中率与节省耗时（未开启缓存时返回 None）"""
+        return self.cache.stats() if self.cache is not None else None
+
+    def _search(self, query: str, top_k: int, version: int) -> List[Dict]:
+        if self.search_mode != "fulltext":
+            # 先追上其他进程在 version 之前的写入，再检索
+            self.memory_retriever.catch_up(version)
+            return self.memory_retriever.search(query, top_k)
+        return self._fulltext_search(query, top_k)
 
+    def _index_version(self) -> float:
+        """检索所用数据的知识库版本号：全文检索直接查表，总是最新"""
+        if self.search_mode == "fulltext":
+            return float("inf")
+        return self.memory_retriever.version
+
+    def _fulltext_search(self, query: str, top_k: int) -> List[Dict]:
+        """GIN 索引全文检索，标题 > 关键词 > 正文加权排序（老表迁移前逐行现算 tsvector）"""
+        params = {"weights": self.rank_weights, "config": self.ts_config, "query": query, "top_k": top_k}
+        vector = (sql.Identifier("search_vector") if self.has_search_vector
+                  else sql.SQL(_SEARCH_VECTOR_EXPR).format(config=sql.SQL("%(config)s")))
         with self._get_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    search_sql,
-                    (query, query, query, query, top_k)
-                )
-                results = [dict(row) for row in cur.fetchall()]
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(sql.SQL(_SEARCH_SQL).format(table=sql.Identifier(self.table_name), vector=vector), params)
+                results = cur.fetchall()
 
         # 过滤掉rank为0的无关结果
-        results = [r for r in results if r["rank"] > 0]
-        return results
+        return [r for r in results if r["rank"] > 0]
 
     def format_knowledge(self, query: str) -> str:
         """
@@ -88,4 +433,4 @@ class KnowledgeRetriever:
         formatted = "【知识库参考内容】\n"
         for i, res in enumerate(results, 1):
             formatted += f"{i}. 标题：{res['title']}\n内容：{res['content']}\n\n"
-        return formatted.strip()
\ No newline at end of file
+        return formatted.strip()
@@ -1,42 +1,183 @@
+import asyncio
+import atexit
+import threading
+import weakref
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
 from langgraph.checkpoint.postgres import PostgresSaver  # 确保正常导入
-from langgraph.checkpoint.base import BaseCheckpointSaver
-import psycopg  # 导入 psycopg 3.x
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.checkpoint.base import BaseCheckpointSaver, writes_sort_key
+from langchain_core.runnables import RunnableConfig
 from psycopg.rows import dict_row
-import os
-from dotenv import load_dotenv
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
-load_dotenv()
+from config import PG_POOL_MIN_SIZE, PG_POOL_MAX_SIZE, PG_POOL_MAX_IDLE, PG_POOL_MAX_LIFETIME, PG_POOL_TIMEOUT
+from config import CHECKPOINT_PRUNE_ENABLED, CHECKPOINT_CACHE_ENABLED
+from app.eckert_agent.memory.checkpoint_pruner import CheckpointPruner
+from app.eckert_agent.memory.checkpoint_serde import get_checkpoint_serde
+from app.eckert_agent.memory.pg_pool import PG_CONN_PARAMS
+from app.eckert_agent.memory.tiered_checkpointer import TieredCheckpointSaver
 
-def get_postgres_checkpointer() -> BaseCheckpointSaver:
-    """确保 PostgresSaver 正常导入并使用，无兼容问题"""
-    # 1. 构建连接参数
-    conn_params = {
-        "host": os.getenv("PG_HOST"),
-        "port": int(os.getenv("PG_PORT")),
-        "user": os.getenv("PG_USER"),
-        "password": os.getenv("PG_PASSWORD"),
-        "dbname": os.getenv("PG_DB")
+# PostgresSaver 要求的连接属性：自动提交、关闭服务端预编译（兼容 pgbouncer）、字典行
+CHECKPOINT_CONN_KWARGS = {**PG_CONN_PARAMS, "autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+
+_pool: Optional[ConnectionPool] = None
+_async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncConnectionPool]" = weakref.WeakKeyDictionary()
+_saver: Optional[BaseCheckpointSaver] = None
+_async_savers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, BaseCheckpointSaver]" = weakref.WeakKeyDictionary()
+_pruner: Optional[CheckpointPruner] = None
+_setup_done = False
+_lock = threading.Lock()
+
+
+# 检查点 pending writes 的键（CheckpointTuple.pending_writes 不带 task_path 与 idx，两级缓存回填时需要）
+_WRITE_KEYS_SQL = """
+SELECT task_id, task_path, idx FROM checkpoint_writes
+WHERE thread_id = %s AND checkpoint_ns = %s AND checkpoint_id = %s
+"""
+
+
+def _write_keys_params(config: RunnableConfig) -> Tuple[str, str, str]:
+    configurable = config["configurable"]
+    return configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"]
+
+
+def _sorted_write_keys(rows) -> List[Tuple[str, str, int]]:
+    """按后端返回 pending_writes 的顺序（task_path, task_id, idx）排列，与 get_tuple 的结果一一对应"""
+    keys = [(row["task_id"], row["task_path"], row["idx"]) for row in rows]
+    return sorted(keys, key=lambda key: writes_sort_key(key[1], key[0], key[2]))
+
+
+def _pool_options() -> Dict:
+    return {
+        "kwargs": CHECKPOINT_CONN_KWARGS,
+        "min_size": PG_POOL_MIN_SIZE,
+        "max_size": PG_POOL_MAX_SIZE,
+        "max_idle": PG_POOL_MAX_IDLE,
+        "max_lifetime": PG_POOL_MAX_LIFETIME,
+        "timeout": PG_POOL_TIMEOUT,
     }
 
-    # 2. 创建 psycopg 3.x 兼容连接（满足 PostgresSaver 要求）
-    try:
-        compatible_conn = psycopg.connect(**conn_params, row_factory=dict_row)
-        compatible_conn.autocommit = True
-    except Exception as e:
-        raise Exception(f"❌ PostgreSQL 连接失败：{str(e)}") from e
-
-    # 3. 初始化 PostgresSaver（正常使用，无导入/类型错误）
-    memory = PostgresSaver(
-        conn=compatible_conn,
-        pipe=None,
-        serde=None
-    )
-
-    # 4. 初始化表（确保持久化功能正常）
-    try:
-        memory.setup()
-    except Exception:
-        pass
-
-    print("✅ PostgresSaver 正常导入并初始化成功（psycopg[binary] 3.x）")
-    return memory
\ No newline at end of file
+
+class PooledPostgresSaver(PostgresSaver):
+    """
+    基于连接池的 PostgresSaver：每次读写从池中借出独立连接
+    原实现对所有操作加同一把锁（为单连接设计），连接池下不需要，去掉后多线程可以并行写检查点
+    """
+
+    def __init__(self, pool: ConnectionPool, serde=None):
+        super().__init__(conn=pool, serde=serde)
+        self.lock = nullcontext()
+
+    def pending_write_keys(self, config: RunnableConfig) -> List[Tuple[str, str, int]]:
+        """检查点 pending writes 的 (task_id, task_path, idx)，顺序与 get_tuple 返回的 pending_writes 一致"""
+        with self._cursor() as cur:
+            cur.execute(_WRITE_KEYS_SQL, _write_keys_params(config))
+            return _sorted_write_keys(cur.fetchall())
+
+
+class PooledAsyncPostgresSaver(AsyncPostgresSaver):
+    """基于异步连接池的 AsyncPostgresSaver（同上，去掉单连接锁，多个协程并行读写）"""
+
+    def __init__(self, pool: AsyncConnectionPool, serde=None):
+        super().__init__(conn=pool, serde=serde)
+        self.lock = nullcontext()
+
+    async def apending_write_keys(self, config: RunnableConfig) -> List[Tuple[str, str, int]]:
+        async with self._cursor() as cur:
+            await cur.execute(_WRITE_KEYS_SQL, _write_keys_params(config))
+            return _sorted_write_keys(await cur.fetchall())
+
+
+def _mark_setup_done():
+    """setup() 完成后按配置启动后台检查点清理（每个进程一个）"""
+    global _setup_done, _pruner
+    _setup_done = True
+    if CHECKPOINT_PRUNE_ENABLED and _pruner is None:
+        _pruner = CheckpointPruner()
+        _pruner.start_background()
+
+
+def get_postgres_checkpointer() -> BaseCheckpointSaver:
+    """
+    获取进程内共享的同步检查点存储（PostgresSaver + 独立连接池，CHECKPOINT_CACHE_ENABLED 时外加进程内热缓存）
+    首次调用时执行 setup() 建表/迁移，失败直接抛出异常，不会带着缺表的存储继续运行
+    """
+    global _pool, _saver
+    if _saver is None:
+        with _lock:
+            if _saver is None:
+                pool = ConnectionPool(name="eckert-checkpoint", open=True, **_pool_options())
+                saver = PooledPostgresSaver(pool, serde=get_checkpoint_serde())
+                if not _setup_done:
+                    try:
+                        saver.setup()
+                    except Exception as e:
+                        pool.close()
+                        raise Exception(f"❌ PostgresSaver 初始化失败：{str(e)}") from e
+                    _mark_setup_done()
+                _pool, _saver = pool, TieredCheckpointSaver(saver) if CHECKPOINT_CACHE_ENABLED else saver
+                print("✅ PostgresSaver 初始化成功（连接池）")
+    return _saver
+
+
+async def aget_postgres_checkpointer() -> BaseCheckpointSaver:
+    """
+    获取当前事件循环的异步检查点存储（AsyncPostgresSaver + 异步连接池，每个事件循环各一个）
+    setup() 每个进程只执行一次，失败直接抛出异常
+    循环关闭前未调用 aclose_checkpointer 时，之后再获取时丢弃该循环的连接池与存储，连接随对象回收关闭
+    """
+    loop = asyncio.get_running_loop()
+    # 连接池的后台任务引用所属循环，弱引用不能自动回收，已关闭的循环在这里清理
+    for registry in (_async_savers, _async_pools):
+        for closed in [key for key in registry if key.is_closed()]:
+            del registry[closed]
+    saver = _async_savers.get(loop)
+    if saver is not None:
+        return saver
+    pool = AsyncConnectionPool(name="eckert-checkpoint-async", open=False, **_pool_options())
+    await pool.open()
+    saver = PooledAsyncPostgresSaver(pool, serde=get_checkpoint_serde())
+    if not _setup_done:
+        try:
+            await saver.setup()
+        except Exception as e:
+            await pool.close()
+            raise Exception(f"❌ AsyncPostgresSaver 初始化失败：{str(e)}") from e
+        _mark_setup_done()
+    if CHECKPOINT_CACHE_ENABLED:
+        saver = TieredCheckpointSaver(saver)
+    # 创建期间可能有其他协程抢先，以先登记的为准
+    existing = _async_savers.setdefault(loop, saver)
+    if existing is not saver:
+        await pool.close()
+        return existing
+    _async_pools[loop] = pool
+    return saver
+
+
+def close_checkpointer():
+    """关闭同步检查点连接池（进程退出时自动调用）"""
+    global _pool, _saver
+    with _lock:
+        if _pool is not None:
+            # 先写完热缓存的异步写入队列，再关闭连接池
+            if isinstance(_saver, TieredCheckpointSaver):
+                _saver.close()
+            _pool.close()
+            _pool, _saver = None, None
+
+
+async def aclose_checkpointer():
+    """关闭当前事件循环的异步检查点连接池"""
+    loop = asyncio.get_running_loop()
+    saver = _async_savers.pop(loop, None)
+    if isinstance(saver, TieredCheckpointSaver):
+        await saver.aflush()
+    pool = _async_pools.pop(loop, None)
+    if pool is not None:
+        await pool.close()
+
+
+atexit.register(close_checkpointer)
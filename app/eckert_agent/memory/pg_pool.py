@@ -0,0 +1,172 @@
+import asyncio
+import atexit
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
+
+from config import (
+    PG_HOST, PG_PORT, PG_USER, PG_PASSWORD, PG_DB,
+    PG_POOL_MIN_SIZE, PG_POOL_MAX_SIZE, PG_POOL_MAX_IDLE, PG_POOL_MAX_LIFETIME, PG_POOL_TIMEOUT, PG_POOL_CHECK,
+)
+
+# 数据库连接参数（所有记忆/检索类共用）
+PG_CONN_PARAMS = {
+    "host": PG_HOST,
+    "port": PG_PORT,
+    "user": PG_USER,
+    "password": PG_PASSWORD,
+    "dbname": PG_DB
+}
+
+_pool: Optional[ConnectionPool] = None
+# 事件循环 → 该循环的异步连接池（弱引用键，已关闭的循环在 get_async_pool 中清理）
+_async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncConnectionPool]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _pool_options() -> Dict:
+    return {
+        "kwargs": PG_CONN_PARAMS,
+        "min_size": PG_POOL_MIN_SIZE,
+        "max_size": PG_POOL_MAX_SIZE,
+        "max_idle": PG_POOL_MAX_IDLE,
+        "max_lifetime": PG_POOL_MAX_LIFETIME,
+        "timeout": PG_POOL_TIMEOUT,
+    }
+
+
+def get_pool() -> ConnectionPool:
+    """
+    获取进程内共享的同步连接池（首次调用时创建）
+    不等待最小连接数建好，数据库不可用时在取连接时报错
+    """
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    name="eckert-pg",
+                    check=ConnectionPool.check_connection if PG_POOL_CHECK else None,
+                    open=True,
+                    **_pool_options()
+                )
+    return _pool
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """
+    获取当前事件循环的异步连接池（异步连接与事件循环绑定，每个事件循环各一个）
+    循环关闭前未调用 aclose_pool 时，之后再获取连接池时丢弃该循环的连接池，连接随对象回收关闭
+    """
+    loop = asyncio.get_running_loop()
+    # 连接池的后台任务引用所属循环，弱引用不能自动回收，已关闭的循环在这里清理
+    for closed in [key for key in _async_pools if key.is_closed()]:
+        del _async_pools[closed]
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            name="eckert-pg-async",
+            check=AsyncConnectionPool.check_connection if PG_POOL_CHECK else None,
+            open=False,
+            **_pool_options()
+        )
+        # 创建与打开之间可能有其他协程抢先，以先登记的为准
+        existing = _async_pools.setdefault(loop, pool)
+        if existing is not pool:
+            return existing
+        await pool.open()
+    return pool
+
+
+@contextmanager
+def pooled_connection(label: str = "PostgreSQL") -> Iterator[psycopg.Connection]:
+    """
+    从同步连接池借出连接，用法与 psycopg.connect 的 with 语句一致：
+    正常退出时提交、异常时回滚，然后归还连接池（不关闭）
+    :param label: 报错时的调用方名称
+    """
+    pool = get_pool()
+    try:
+        conn = pool.getconn()
+    except (PoolTimeout, psycopg.OperationalError) as e:
+        raise Exception(f"{label} 连接失败：{str(e)}")
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn)
+
+
+@contextmanager
+def autocommit_connection(label: str = "PostgreSQL") -> Iterator[psycopg.Connection]:
+    """
+    单独建立一条自动提交的连接（不经过连接池，用完关闭）：
+    CREATE/DROP INDEX CONCURRENTLY、DETACH PARTITION CONCURRENTLY 等不能在事务中执行的迁移语句使用
+    """
+    try:
+        conn = psycopg.connect(**PG_CONN_PARAMS, autocommit=True)
+    except psycopg.OperationalError as e:
+        raise Exception(f"{label} 连接失败：{str(e)}")
+    with conn:
+        yield conn
+
+
+def create_index_concurrently(conn: psycopg.Connection, index_name: str, create_sql) -> bool:
+    """
+    在自动提交连接上执行 CREATE INDEX CONCURRENTLY（不阻塞写入）；
+    上次中断留下的无效索引（indisvalid = false）先 DROP INDEX CONCURRENTLY 再重建
+    :param create_sql: 完整的 CREATE INDEX CONCURRENTLY IF NOT EXISTS 语句
+    :return: 是否新建了索引
+    """
+    row = conn.execute(
+        "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s)", (index_name,)
+    ).fetchone()
+    if row is not None and row[0]:
+        return False
+    if row is not None:
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+    conn.execute(create_sql)
+    return True
+
+
+@asynccontextmanager
+async def apooled_connection(label: str = "PostgreSQL") -> AsyncIterator[psycopg.AsyncConnection]:
+    """从异步连接池借出连接（语义同 pooled_connection）"""
+    pool = await get_async_pool()
+    try:
+        conn = await pool.getconn()
+    except (PoolTimeout, psycopg.OperationalError) as e:
+        raise Exception(f"{label} 连接失败：{str(e)}")
+    try:
+        async with conn:
+            yield conn
+    finally:
+        await pool.putconn(conn)
+
+
+def pool_stats() -> Dict:
+    """同步连接池统计（连接数、等待数、取连接耗时等，未创建时返回空字典）"""
+    return _pool.get_stats() if _pool is not None else {}
+
+
+def close_pool():
+    """关闭同步连接池（进程退出时自动调用）"""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+async def aclose_pool():
+    """关闭当前事件循环的异步连接池"""
+    pool = _async_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+atexit.register(close_pool)
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (
+    KNOWLEDGE_CACHE_MAX_ENTRIES, KNOWLEDGE_CACHE_TTL, KNOWLEDGE_CACHE_PG_ENABLED, KNOWLEDGE_CACHE_PG_TTL,
+    KNOWLEDGE_CACHE_PG_MAX_ROWS,
+)
+from app.eckert_agent.memory.pg_pool import pooled_connection
+
+# 问句末尾的标点不影响检索结果（NFKC 后全角标点已转为半角）
+_TRAILING_PUNCTUATION = " ?!.。,，~"
+
+# 缓存条目：(检索结果, 未命中时检索耗时秒数)，命中时据此统计节省的耗时
+CachedResults = Tuple[List[Dict], float]
+
+
+def normalize_query(query: str) -> str:
+    """规范化检索问题：NFKC（全角转半角）、转小写、折叠空白、去掉末尾标点"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return " ".join(query.split()).rstrip(_TRAILING_PUNCTUATION)
+
+
+def to_json_safe(results: List[Dict]) -> List[Dict]:
+    """
+    把检索结果转换为 JSON 能原样表示的类型（时间、Decimal 等转为字符串），返回新的列表
+    写入缓存前统一转换：L1 命中、L2 命中与未命中时的检索结果字段类型一致
+    """
+    return json.loads(json.dumps(results, ensure_ascii=False, default=str))
+
+
+def make_retrieval_key(table_name: str, search_mode: str, version: int, query: str, top_k: int) -> str:
+    """
+    生成检索缓存键：知识库表 + 检索方式 + 知识库版本 + 规范化问题 + top_k
+    版本号写在键里，知识库变更后旧条目不再命中，随 LRU/TTL 自然淘汰
+    :return: sha256 十六进制字符串
+    """
+    payload = [table_name, search_mode, version, normalize_query(query), top_k]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class LRURetrievalCache:
+    """进程内 LRU 检索结果缓存（条数上限 + TTL，线程安全）"""
+
+    def __init__(self, max_entries: int = KNOWLEDGE_CACHE_MAX_ENTRIES, ttl: float = KNOWLEDGE_CACHE_TTL):
+        """
+        :param max_entries: 最大缓存条数，超出淘汰最久未使用的
+        :param ttl: 过期时间（秒），<=0 表示不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResults]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            cached, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return cached
+
+    def put(self, key: str, cached: CachedResults):
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0
+        with self._lock:
+            self._data[key] = (cached, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class PostgresRetrievalCache:
+    """PostgreSQL 共享检索结果缓存（多个进程共用；TTL + 行数上限，清理时顺带删除旧版本的行）"""
+
+    def __init__(self, ttl: float = KNOWLEDGE_CACHE_PG_TTL, max_rows: int = KNOWLEDGE_CACHE_PG_MAX_ROWS,
+                 evict_every: int = 100):
+        """
+        :param ttl: 过期时间（秒）
+        :param max_rows: 最大行数，超出后删除最早写入的行
+        :param evict_every: 每写入多少次执行一次清理
+        """
+        self.table_name = "knowledge_search_cache"
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.evict_every = evict_every
+        self._writes = 0
+        self._init_table()
+
+    def _get_connection(self):
+        """从共享连接池借出连接（with 退出时提交并归还）"""
+        return pooled_connection("知识库检索缓存")
+
+    def _init_table(self):
+        create_sql = f"""
+        CREATE TABLE IF NOT EXISTS {self.table_name} (
+            cache_key CHAR(64) PRIMARY KEY,
+            knowledge_table TEXT NOT NULL,
+            version BIGINT NOT NULL,
+            results JSONB NOT NULL,
+            search_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_{self.table_name}_created_at ON {self.table_name} (created_at);
+        """
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(create_sql)
+            conn.commit()
+
+    def get(self, key: str) -> Optional[CachedResults]:
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT results, search_seconds FROM {self.table_name}
+                    WHERE cache_key = %s AND expires_at > now()
+                    """,
+                    (key,)
+                )
+                row = cur.fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def put(self, key: str, cached: CachedResults, knowledge_table: str, version: int):
+        results, search_seconds = cached
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    INSERT INTO {self.table_name} (cache_key, knowledge_table, version, results, search_seconds,
+                                                   expires_at)
+                    VALUES (%s, %s, %s, %s, %s, now() + make_interval(secs => %s))
+                    ON CONFLICT (cache_key) DO UPDATE
+                        SET results = EXCLUDED.results,
+                            search_seconds = EXCLUDED.search_seconds,
+                            created_at = now(),
+                            expires_at = EXCLUDED.expires_at
+                    """,
+                    (key, knowledge_table, version, json.dumps(results, ensure_ascii=False),
+                     search_seconds, self.ttl)
+                )
+                self._writes += 1
+                if self._writes % self.evict_every == 0:
+                    self._evict(cur, knowledge_table, version)
+            conn.commit()
+
+    def _evict(self, cur, knowledge_table: str, version: int):
+        """清理过期行、该知识库旧版本的行（已不可能命中）与超出行数上限的最早行"""
+        cur.execute(f"DELETE FROM {self.table_name} WHERE expires_at <= now()")
+        cur.execute(f"DELETE FROM {self.table_name} WHERE knowledge_table = %s AND version < %s",
+                    (knowledge_table, version))
+        cur.execute(
+            f"""
+            DELETE FROM {self.table_name}
+            WHERE created_at < (SELECT created_at FROM {self.table_name}
+                                ORDER BY created_at DESC OFFSET %s LIMIT 1)
+            """,
+            (self.max_rows - 1,)
+        )
+
+    def clear(self):
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {self.table_name}")
+            conn.commit()
+
+
+class RetrievalCache:
+    """
+    两级知识库检索结果缓存：进程内 LRU（L1）+ 可选 PostgreSQL（L2，跨进程共享），附命中率与节省耗时统计
+    每个条目记录写入时的检索耗时，命中时累加“该检索耗时 - 本次命中耗时”（L2 命中也算，即使由其他进程写入）
+    """
+
+    def __init__(self, local: LRURetrievalCache, persistent: Optional[PostgresRetrievalCache] = None):
+        self.local = local
+        self.persistent = persistent
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Optional[CachedResults]:
+        """读取缓存（L1 未命中时查 L2 并回填 L1）并计数命中"""
+        cached = self.local.get(key)
+        field = "hits"
+        if cached is None and self.persistent is not None:
+            try:
+                cached = self.persistent.get(key)
+            except Exception as e:
+                # L2 故障不影响检索，只当作未命中
+                print(f"❌ 知识库检索缓存读取失败：{str(e)}")
+                cached = None
+            if cached is not None:
+                self.local.put(key, cached)
+                field = "persistent_hits"
+        if cached is not None:
+            with self._lock:
+                setattr(self, field, getattr(self, field) + 1)
+        return cached
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """返回缓存结果的副本（调用方修改不影响缓存），未命中返回 None"""
+        cached = self._lookup(key)
+        return None if cached is None else [dict(item) for item in cached[0]]
+
+    def put(self, key: str, results: List[Dict], knowledge_table: str, version: int, search_seconds: float = 0.0):
+        cached = (to_json_safe(results), search_seconds)
+        self.local.put(key, cached)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, cached, knowledge_table, version)
+            except Exception as e:
+                print(f"❌ 知识库检索缓存写入失败：{str(e)}")
+
+    def get_or_search(self, key: str, search: Callable[[], List[Dict]], knowledge_table: str,
+                      version: int, is_fresh: Optional[Callable[[], bool]] = None) -> List[Dict]:
+        """
+        命中时直接返回缓存结果；未命中时执行 search 并连同检索耗时写入缓存
+        返回值统一为 JSON 安全的类型（与缓存中保存的一致），无论是否命中
+        :param is_fresh: 检索后调用，返回 False 表示结果来自早于 version 的数据，不写入缓存（否则会以新版本的键缓存旧结果）
+        """
+        start = time.perf_counter()
+        cached = self._lookup(key)
+        if cached is not None:
+            results = [dict(item) for item in cached[0]]
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.saved_seconds += max(cached[1] - elapsed, 0.0)
+            return results
+        start = time.perf_counter()
+        results = to_json_safe(search())
+        search_seconds = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += search_seconds
+        if is_fresh is None or is_fresh():
+            self.put(key, results, knowledge_table, version, search_seconds)
+        return results
+
+    def clear(self):
+        self.local.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> Dict:
+        """命中统计：hits 为 L1 命中，persistent_hits 为 L2 命中，avg_miss_ms 为未命中时的平均检索耗时，
+        saved_seconds 为命中累计节省的检索耗时"""
+        total = self.hits + self.persistent_hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.persistent_hits) / total if total else 0.0,
+            "avg_miss_ms": self.miss_seconds / self.misses * 1000 if self.misses else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "local_size": len(self.local),
+        }
+
+
+_default_cache: Optional[RetrievalCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """进程内共用的检索缓存（按配置创建一次，各 KnowledgeRetriever 实例共享命中与统计）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            persistent = PostgresRetrievalCache() if KNOWLEDGE_CACHE_PG_ENABLED else None
+            _default_cache = RetrievalCache(LRURetrievalCache(), persistent)
+        return _default_cache
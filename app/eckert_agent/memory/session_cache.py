@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import HISTORY_CACHE_MAX_SESSIONS, HISTORY_CACHE_MAX_BYTES, HISTORY_CACHE_TTL
+
+# 摘要尚未加载时的占位（区别于“已加载且没有摘要”的 None）
+_UNLOADED = object()
+
+
+class _SessionEntry:
+    """单个会话的缓存：最新的若干条消息（时间正序）+ 滚动摘要"""
+    __slots__ = ("rows", "summary", "rows_size", "summary_size", "expires_at")
+
+    def __init__(self, expires_at: float):
+        self.rows: Optional[List[Dict]] = None
+        self.summary = _UNLOADED
+        self.rows_size = 0
+        self.summary_size = 0
+        self.expires_at = expires_at
+
+    @property
+    def size(self) -> int:
+        return self.rows_size + self.summary_size
+
+
+def _row_size(row: Dict) -> int:
+    return len(row["content"].encode("utf-8")) + 64
+
+
+class SessionHistoryCache:
+    """
+    进程内会话历史缓存（LRU，会话数 + 总字节数上限 + TTL，线程安全）
+    - 每个会话缓存与 ChatMemory.get_history 默认读取一致的最新 window 条消息
+    - 写穿：本进程保存消息后直接追加到已缓存的会话，不需要回读数据库
+    - 清空会话、后台摘要改写历史后整体失效；其他进程的写入在 TTL 到期后可见
+    - 每个会话维护版本号，读库期间发生写入/失效时丢弃本次读到的结果，避免缓存旧数据
+    """
+
+    def __init__(self, max_sessions: int = HISTORY_CACHE_MAX_SESSIONS, max_bytes: int = HISTORY_CACHE_MAX_BYTES,
+                 ttl: float = HISTORY_CACHE_TTL):
+        """
+        :param max_sessions: 最多缓存的会话数
+        :param max_bytes: 缓存消息内容的总字节数上限（近似值）
+        :param ttl: 会话缓存从数据库加载后的有效期（秒）
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_entry(self, session_id: str) -> Optional[_SessionEntry]:
+        """取出未过期的会话缓存并标记为最近使用（调用方需持有锁）"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._drop(session_id)
+            return None
+        self._entries.move_to_end(session_id)
+        return entry
+
+    def _drop(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+
+    def _bump(self, session_id: str):
+        self._versions[session_id] = self._versions.get(session_id, 0) + 1
+        if len(self._versions) > self.max_sessions * 4:
+            # 版本表过大时整体重置并推进纪元，重置前取得的版本号全部作废
+            self._versions.clear()
+            self._epoch += 1
+
+    def _version(self, session_id: str) -> Tuple[int, int]:
+        return self._epoch, self._versions.get(session_id, 0)
+
+    def version(self, session_id: str) -> Tuple[int, int]:
+        """读库前记录版本号，写回缓存时校验"""
+        with self._lock:
+            return self._version(session_id)
+
+    # ========== 历史消息 ==========
+    def get_rows(self, session_id: str, limit: int, window: int) -> Optional[List[Dict]]:
+        """
+        读取最新 limit 条消息（limit 不超过缓存窗口时才可能命中）
+        :return: 命中时返回时间正序列表，未命中返回 None
+        """
+        with self._lock:
+            entry = self._get_entry(session_id) if limit <= window else None
+            if entry is None or entry.rows is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [dict(row) for row in entry.rows[-limit:]]
+
+    def store_rows(self, session_id: str, rows: List[Dict], window: int, version: Tuple[int, int]):
+        """读库后回填最新 window 条消息（版本号已变化则丢弃）"""
+        with self._lock:
+            if self._version(session_id) != version:
+                return
+            entry = self._get_entry(session_id)
+            if entry is None:
+                entry = _SessionEntry(time.monotonic() + self.ttl)
+                self._entries[session_id] = entry
+            rows = [dict(row) for row in rows[-window:]]
+            size = sum(_row_size(row) for row in rows)
+            self._bytes += size - entry.rows_size
+            entry.rows = rows
+            entry.rows_size = size
+            self._evict()
+
+    def append_rows(self, session_id: str, rows: List[Dict], window: int):
+        """写穿：把刚保存的消息追加到已缓存的会话（未缓存的会话不做处理）"""
+        with self._lock:
+            self._bump(session_id)
+            entry = self._get_entry(session_id)
+            if entry is None or entry.rows is None:
+                return
+            merged = entry.rows + [dict(row) for row in rows]
+            dropped, kept = merged[:-window], merged[-window:]
+            entry.rows = kept
+            delta = sum(_row_size(row) for row in rows) - sum(_row_size(row) for row in dropped)
+            entry.rows_size += delta
+            self._bytes += delta
+            self._evict()
+
+    # ========== 滚动摘要 ==========
+    def get_summary(self, session_id: str) -> Tuple[bool, Optional[str]]:
+        """:return: (是否命中, 摘要)"""
+        with self._lock:
+            entry = self._get_entry(session_id)
+            if entry is None or entry.summary is _UNLOADED:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry.summary
+
+    def store_summary(self, session_id: str, summary: Optional[str], version: Tuple[int, int]):
+        with self._lock:
+            if self._version(session_id) != version:
+                return
+            entry = self._get_entry(session_id)
+            if entry is None:
+                entry = _SessionEntry(time.monotonic() + self.ttl)
+                self._entries[session_id] = entry
+            size = len(summary.encode("utf-8")) if summary else 0
+            self._bytes += size - entry.summary_size
+            entry.summary = summary
+            entry.summary_size = size
+            self._evict()
+
+    # ========== 失效 ==========
+    def invalidate(self, session_id: str):
+        """会话历史被清空或改写（如后台摘要）时整体失效"""
+        with self._lock:
+            self._bump(session_id)
+            self._drop(session_id)
+
+    def clear(self):
+        with self._lock:
+            for session_id in self._entries:
+                self._bump(session_id)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "sessions": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+
+_shared_cache: Optional[SessionHistoryCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_session_cache() -> SessionHistoryCache:
+    """进程内共享的会话历史缓存（多个 ChatMemory 实例共用，保证写穿对所有读取方可见）"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = SessionHistoryCache()
+    return _shared_cache
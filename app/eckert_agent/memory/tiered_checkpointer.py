@@ -0,0 +1,447 @@
+import asyncio
+import atexit
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP, BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple,
+    copy_checkpoint, get_checkpoint_id, get_serializable_checkpoint_metadata,
+)
+
+from config import (
+    CHECKPOINT_CACHE_MAX_THREADS, CHECKPOINT_CACHE_MAX_BYTES, CHECKPOINT_CACHE_TTL, CHECKPOINT_CACHE_WRITE_ASYNC,
+    CHECKPOINT_CACHE_MAX_PENDING,
+)
+
+# 所有开启异步写入的实例（进程退出时写完队列）
+_savers: "weakref.WeakSet[TieredCheckpointSaver]" = weakref.WeakSet()
+
+_ThreadKey = Tuple[str, str]
+
+
+class _LoopWrites:
+    """某个事件循环中的异步写入：有界信号量（满时 await 阻塞调用方）、在途任务、每个 thread 最近一次写入（按提交顺序串行）"""
+    __slots__ = ("slots", "tasks", "last")
+
+    def __init__(self, max_pending: int):
+        self.slots = asyncio.Semaphore(max_pending)
+        self.tasks: Set[asyncio.Task] = set()
+        self.last: Dict[str, asyncio.Task] = {}
+
+
+class _CachedCheckpoint:
+    """单个 (thread_id, checkpoint_ns) 的最新检查点，通道值与 pending writes 以序列化形式保存，读取时解码出新对象"""
+    __slots__ = ("config", "checkpoint", "values", "metadata", "parent_config", "writes", "size", "expires_at")
+
+    def __init__(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                 parent_config: Optional[RunnableConfig], values: Dict[str, Tuple[str, bytes]], expires_at: float):
+        self.config = config
+        self.checkpoint = checkpoint
+        self.values = values
+        self.metadata = metadata
+        self.parent_config = parent_config
+        self.writes: Dict[Tuple[str, int], Tuple[str, str, Tuple[str, bytes], str]] = {}
+        self.size = sum(len(data) for _, data in values.values())
+        self.expires_at = expires_at
+
+    @property
+    def checkpoint_id(self) -> str:
+        return self.checkpoint["id"]
+
+
+def _derive_write_keys(pending_writes: Sequence[Tuple[str, str, Any]]) -> List[Tuple[str, str, int]]:
+    """
+    后端没有提供 pending writes 的键时推算 (task_id, task_path, idx)：特殊通道取 WRITES_IDX_MAP 中的固定 idx，
+    普通写入按同一任务内的顺序编号（与单次 put_writes 的 idx 一致）；task_path 未知，记为空
+    """
+    counters: Dict[str, int] = {}
+    keys = []
+    for task_id, channel, _ in pending_writes:
+        if channel in WRITES_IDX_MAP:
+            keys.append((task_id, "", WRITES_IDX_MAP[channel]))
+        else:
+            idx = counters.get(task_id, 0)
+            counters[task_id] = idx + 1
+            keys.append((task_id, "", idx))
+    return keys
+
+
+def _thread_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+
+class TieredCheckpointSaver(BaseCheckpointSaver):
+    """
+    两级检查点存储：进程内 LRU（热数据）+ 后端存储（PostgresSaver，持久化）
+    - 每个 (thread_id, checkpoint_ns) 缓存最新一个检查点及其 pending writes；读取最新检查点（或正好是该检查点）时不访问数据库
+    - 写穿：put / put_writes 先更新缓存再写后端；默认同步写，返回时已落库，写入失败时使该 thread 的缓存失效并抛出异常，
+      持久性与直接使用后端一致
+    - write_async=True 时后端写入交给后台线程 / 事件循环任务（有界，满时阻塞调用方；同一 thread 的写入按提交顺序执行），
+      失败时使该 thread 的缓存失效，进程崩溃可能丢失最近几步，退出时自动写完
+    - 历史查询（list、指定旧 checkpoint_id）直接走后端；同一 thread 假定只由一个进程写入，其他进程的写入在 TTL 后可见
+    """
+
+    def __init__(self, backend: BaseCheckpointSaver, max_threads: int = CHECKPOINT_CACHE_MAX_THREADS,
+                 max_bytes: int = CHECKPOINT_CACHE_MAX_BYTES, ttl: float = CHECKPOINT_CACHE_TTL,
+                 write_async: bool = CHECKPOINT_CACHE_WRITE_ASYNC, max_pending: int = CHECKPOINT_CACHE_MAX_PENDING):
+        """
+        :param backend: 后端检查点存储（同步图需支持同步接口，异步图需支持异步接口）
+        :param max_threads: 最多缓存的 thread 数
+        :param max_bytes: 缓存的序列化数据总字节数上限
+        :param ttl: 缓存有效期（秒）
+        :param write_async: 是否后台异步写后端
+        :param max_pending: 异步写入时最多排队的写操作数
+        """
+        super().__init__(serde=backend.serde)
+        self.backend = backend
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.write_async = write_async
+        self.max_pending = max_pending
+        self._entries: "OrderedDict[_ThreadKey, _CachedCheckpoint]" = OrderedDict()
+        # 图默认异步保存检查点，put_writes 可能先于对应检查点的 put 到达，先暂存，put 时合并
+        self._early_writes: Dict[_ThreadKey, Tuple[str, List]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures: Set[Future] = set()
+        # 事件循环 → 该循环中的异步写入（循环关闭回收后自动移除）
+        self._loop_writes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopWrites]" = \
+            weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        if write_async:
+            # 单个后台线程按提交顺序写入
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint-write")
+            _savers.add(self)
+
+    # ========== 缓存 ==========
+    @staticmethod
+    def _key(config: RunnableConfig) -> _ThreadKey:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+    def _lookup(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_id = get_checkpoint_id(config)
+        key = self._key(config)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None or (checkpoint_id and checkpoint_id != entry.checkpoint_id):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # 与后端一致按 (task_path, task_id, idx) 排序
+            values = dict(entry.values)
+            writes = [write for _, write in sorted(entry.writes.items(), key=lambda item: (item[1][3], *item[0]))]
+            checkpoint, metadata = entry.checkpoint, entry.metadata
+            tuple_config, parent_config = entry.config, entry.parent_config
+        # 在锁外解码，每次返回独立的对象（图运行时会原地修改状态）
+        checkpoint = copy_checkpoint(checkpoint)
+        checkpoint["channel_values"] = {channel: self.serde.loads_typed(value) for channel, value in values.items()}
+        return CheckpointTuple(
+            config=tuple_config,
+            checkpoint=checkpoint,
+            metadata=dict(metadata),
+            parent_config=parent_config,
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value)) for task_id, channel, value, _ in writes],
+        )
+
+    def _store(self, key: _ThreadKey, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+               parent_config: Optional[RunnableConfig], pending_writes: Sequence[Tuple[str, str, Any]] = (),
+               write_keys: Optional[List[Tuple[str, str, int]]] = None):
+        """
+        :param pending_writes: 后端 get_tuple 返回的 pending writes（task_id, channel, value）
+        :param write_keys: 与 pending_writes 一一对应的 (task_id, task_path, idx)，后端不提供时按任务内顺序推算
+        """
+        values = {channel: self.serde.dumps_typed(value) for channel, value in checkpoint["channel_values"].items()}
+        stored = copy_checkpoint(checkpoint)
+        stored["channel_values"] = {}
+        entry = _CachedCheckpoint(config, stored, dict(metadata), parent_config, values, time.monotonic() + self.ttl)
+        if write_keys is None or len(write_keys) != len(pending_writes):
+            write_keys = _derive_write_keys(pending_writes)
+        for (task_id, channel, value), (_, task_path, idx) in zip(pending_writes, write_keys):
+            encoded = self.serde.dumps_typed(value)
+            entry.writes[(task_id, idx)] = (task_id, channel, encoded, task_path)
+            entry.size += len(encoded[1])
+        with self._lock:
+            current = self._entries.get(key)
+            # 只接受比已缓存检查点更新的版本（checkpoint id 按时间递增）
+            if current is not None and current.checkpoint_id > entry.checkpoint_id:
+                return
+            self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            early = self._early_writes.get(key)
+            if early is not None and early[0] <= entry.checkpoint_id:
+                del self._early_writes[key]
+                if early[0] == entry.checkpoint_id:
+                    for task_id, task_path, encoded in early[1]:
+                        self._apply_writes(entry, task_id, task_path, encoded)
+            self._evict()
+
+    def _drop(self, key: _ThreadKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_threads or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+
+    def _add_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str):
+        """pending writes 追加到缓存（规则与后端一致：普通写入按 (task_id, idx) 去重，特殊通道覆盖）"""
+        key = self._key(config)
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        encoded = [(channel, self.serde.dumps_typed(value)) for channel, value in writes]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.checkpoint_id == checkpoint_id:
+                self._apply_writes(entry, task_id, task_path, encoded)
+                self._evict()
+            elif entry is None or entry.checkpoint_id < checkpoint_id:
+                early = self._early_writes.get(key)
+                if early is None or early[0] < checkpoint_id:
+                    early = self._early_writes[key] = (checkpoint_id, [])
+                if early[0] == checkpoint_id:
+                    early[1].append((task_id, task_path, encoded))
+
+    def _apply_writes(self, entry: _CachedCheckpoint, task_id: str, task_path: str,
+                      encoded: List[Tuple[str, Tuple[str, bytes]]]):
+        """把 pending writes 合并进已缓存的检查点（调用方需持有锁）"""
+        for idx, (channel, value) in enumerate(encoded):
+            inner_key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+            if inner_key[1] >= 0 and inner_key in entry.writes:
+                continue
+            previous = entry.writes.get(inner_key)
+            delta = len(value[1]) - (len(previous[2][1]) if previous else 0)
+            entry.writes[inner_key] = (task_id, channel, value, task_path)
+            entry.size += delta
+            self._bytes += delta
+
+    def invalidate(self, thread_id: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == thread_id]:
+                self._drop(key)
+            for key in [key for key in self._early_writes if key[0] == thread_id]:
+                del self._early_writes[key]
+
+    # ========== 后端写入 ==========
+    def _submit(self, thread_id: str, func, *args):
+        """同步写后端，或交给后台线程（写入失败时使该 thread 的缓存失效，后续读取回到后端）"""
+        if self._executor is None:
+            try:
+                func(*args)
+            except Exception:
+                # 缓存中已是未落库的检查点，失效后读取回到后端
+                self.invalidate(thread_id)
+                raise
+            return
+        self._slots.acquire()
+
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"❌ 检查点异步写入失败（thread {thread_id}）：{str(e)}")
+                self.invalidate(thread_id)
+            finally:
+                self._slots.release()
+
+        future = self._executor.submit(run)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard_future)
+
+    def _discard_future(self, future: Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def flush(self, timeout: Optional[float] = None):
+        """等待已提交的异步写入全部完成"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result(timeout)
+
+    def close(self):
+        """写完队列并停止后台线程"""
+        if self._executor is not None:
+            self.flush()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _writes_for(self, loop: asyncio.AbstractEventLoop) -> _LoopWrites:
+        with self._lock:
+            # 信号量阻塞过后会引用所属循环，弱引用不能自动回收，已关闭的循环在这里清理
+            for closed in [key for key in self._loop_writes if key.is_closed()]:
+                del self._loop_writes[closed]
+            state = self._loop_writes.get(loop)
+            if state is None:
+                state = self._loop_writes[loop] = _LoopWrites(self.max_pending)
+            return state
+
+    async def _asubmit(self, thread_id: str, coro):
+        if not self.write_async:
+            try:
+                await coro
+            except Exception:
+                self.invalidate(thread_id)
+                raise
+            return
+        loop = asyncio.get_running_loop()
+        state = self._writes_for(loop)
+        await state.slots.acquire()
+        previous = state.last.get(thread_id)
+
+        async def run():
+            try:
+                if previous is not None:
+                    # 同一 thread 的写入串行：先等上一次写入结束（失败已在上一个任务中处理）
+                    await asyncio.gather(previous, return_exceptions=True)
+                await coro
+            except Exception as e:
+                print(f"❌ 检查点异步写入失败（thread {thread_id}）：{str(e)}")
+                self.invalidate(thread_id)
+            finally:
+                state.slots.release()
+
+        task = loop.create_task(run())
+        state.tasks.add(task)
+        state.last[thread_id] = task
+
+        def done(finished: asyncio.Task):
+            state.tasks.discard(finished)
+            if state.last.get(thread_id) is finished:
+                del state.last[thread_id]
+
+        task.add_done_callback(done)
+
+    async def aflush(self):
+        """等待当前事件循环中已提交的异步写入全部完成"""
+        state = self._loop_writes.get(asyncio.get_running_loop())
+        if state is not None and state.tasks:
+            await asyncio.gather(*list(state.tasks))
+
+    # ========== 同步接口 ==========
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        cached = self._lookup(config)
+        if cached is not None:
+            return cached
+        self.flush()
+        result = self.backend.get_tuple(config)
+        if result is not None and not get_checkpoint_id(config):
+            write_keys = None
+            if result.pending_writes and hasattr(self.backend, "pending_write_keys"):
+                write_keys = self.backend.pending_write_keys(result.config)
+            self._store(self._key(config), result.config, result.checkpoint, result.metadata, result.parent_config,
+                        result.pending_writes or (), write_keys)
+        return result
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        self.flush()
+        return self.backend.list(config, filter=filter, before=before, limit=limit)
+
+    def _prepare_put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata):
+        thread_id, checkpoint_ns = self._key(config)
+        next_config = _thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+        parent_id = config["configurable"].get("checkpoint_id")
+        parent_config = _thread_config(thread_id, checkpoint_ns, parent_id) if parent_id else None
+        self._store((thread_id, checkpoint_ns), next_config, checkpoint,
+                    get_serializable_checkpoint_metadata(config, metadata), parent_config)
+        return thread_id, next_config
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id, next_config = self._prepare_put(config, checkpoint, metadata)
+        self._submit(thread_id, self.backend.put, config, checkpoint, metadata, new_versions)
+        return next_config
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        self._add_writes(config, writes, task_id, task_path)
+        self._submit(config["configurable"]["thread_id"], self.backend.put_writes, config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.flush()
+        self.invalidate(thread_id)
+        self.backend.delete_thread(thread_id)
+
+    def get_delta_channel_history(self, *, config: RunnableConfig, channels: Sequence[str]):
+        self.flush()
+        return self.backend.get_delta_channel_history(config=config, channels=channels)
+
+    # ========== 异步接口 ==========
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        cached = self._lookup(config)
+        if cached is not None:
+            return cached
+        await self.aflush()
+        result = await self.backend.aget_tuple(config)
+        if result is not None and not get_checkpoint_id(config):
+            write_keys = None
+            if result.pending_writes and hasattr(self.backend, "apending_write_keys"):
+                write_keys = await self.backend.apending_write_keys(result.config)
+            self._store(self._key(config), result.config, result.checkpoint, result.metadata, result.parent_config,
+                        result.pending_writes or (), write_keys)
+        return result
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        await self.aflush()
+        async for item in self.backend.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id, next_config = self._prepare_put(config, checkpoint, metadata)
+        await self._asubmit(thread_id, self.backend.aput(config, checkpoint, metadata, new_versions))
+        return next_config
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        self._add_writes(config, writes, task_id, task_path)
+        await self._asubmit(config["configurable"]["thread_id"],
+                            self.backend.aput_writes(config, writes, task_id, task_path))
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.aflush()
+        self.invalidate(thread_id)
+        await self.backend.adelete_thread(thread_id)
+
+    async def aget_delta_channel_history(self, *, config: RunnableConfig, channels: Sequence[str]):
+        await self.aflush()
+        return await self.backend.aget_delta_channel_history(config=config, channels=channels)
+
+    def get_next_version(self, current, channel):
+        return self.backend.get_next_version(current, channel)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "threads": len(self._entries),
+            "bytes": self._bytes,
+            "pending_writes": len(self._futures) + sum(len(state.tasks) for state in list(self._loop_writes.values())),
+        }
+
+
+@atexit.register
+def _close_all():
+    """进程退出时写完所有异步写入队列"""
+    for saver in list(_savers):
+        saver.close()
@@ -0,0 +1,213 @@
+import math
+import threading
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import VECTOR_INDEX_MODE, VECTOR_IVF_MIN_SIZE, VECTOR_IVF_NLIST, VECTOR_IVF_NPROBE
+
+INDEX_MODES = ("auto", "flat", "ivf")
+# 暴力检索每块的行数：一次矩阵乘的临时结果为 查询数 × 块行数
+_BLOCK_ROWS = 65536
+# 建 IVF 后末尾未聚类的向量超过已聚类部分的该比例时重新聚类
+_RECLUSTER_RATIO = 0.2
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回每行分数最高的 k 个位置（按分数从高到低）"""
+    if scores.shape[-1] > k:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[-1]), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class VectorIndex:
+    """
+    进程内向量索引：向量存放在一块连续的 float32 矩阵中（行已归一化，内积即余弦相似度）
+    - flat：分块矩阵乘 + argpartition 取 top-k，结果精确
+    - ivf：球面 k-means 聚类后按聚类重排矩阵，每个聚类是一段连续行；查询只扫描最近的 nprobe 个聚类，结果近似
+    建 IVF 之后新增的向量追加在末尾（未聚类区），查询时暴力扫描，积累到一定比例后重新聚类
+    可以直接建在索引文件的映射内存上（from_sections，只读、不复制），首次新增向量时才复制到可写内存
+    """
+
+    def __init__(self, dim: int, mode: str = VECTOR_INDEX_MODE, nlist: int = VECTOR_IVF_NLIST,
+                 nprobe: int = VECTOR_IVF_NPROBE, ivf_min_size: int = VECTOR_IVF_MIN_SIZE):
+        """
+        :param dim: 向量维度
+        :param mode: auto（达到 ivf_min_size 时建 IVF）、flat 或 ivf
+        :param nlist: IVF 聚类数，0 表示按 4 * sqrt(向量数) 自动取值
+        :param nprobe: 每次查询探测的聚类数
+        """
+        if mode not in INDEX_MODES:
+            raise ValueError("VECTOR_INDEX_MODE 只能是 auto、flat 或 ivf")
+        self.dim = dim
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        # IVF：聚类中心、每个聚类在矩阵中的起止行（offsets[c]:offsets[c+1]）、已聚类的行数
+        self.centroids: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._clustered = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+
+    @property
+    def is_ivf(self) -> bool:
+        return self.centroids is not None
+
+    def memory_bytes(self) -> int:
+        extra = self.centroids.nbytes + self._offsets.nbytes if self.is_ivf else 0
+        return self._vectors.nbytes + self._ids.nbytes + extra
+
+    def sections(self) -> Dict[str, np.ndarray]:
+        """写入索引文件的段：向量矩阵、行 → 文档 id；已建 IVF 时另有聚类中心与各聚类起止行"""
+        with self._lock:
+            sections = {"vectors": self._vectors[:self._size], "vector_ids": self._ids[:self._size]}
+            if self.is_ivf:
+                sections.update(ivf_centroids=self.centroids, ivf_offsets=self._offsets,
+                                ivf_clustered=np.array([self._clustered], dtype=np.int64))
+            return sections
+
+    @classmethod
+    def from_sections(cls, sections: Mapping[str, np.ndarray], **kwargs) -> "VectorIndex":
+        """用索引文件中的段创建索引（数组直接引用，不复制），kwargs 为 mode/nprobe 等参数"""
+        vectors = sections["vectors"]
+        index = cls(vectors.shape[1], **kwargs)
+        index._vectors, index._ids, index._size = vectors, sections["vector_ids"], len(vectors)
+        if "ivf_centroids" in sections:
+            index.centroids, index._offsets = sections["ivf_centroids"], sections["ivf_offsets"]
+            index._clustered = int(sections["ivf_clustered"][0])
+        return index
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray):
+        """追加向量（需已归一化），容量不足时按倍数扩容，整体仍为一块连续矩阵"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        count = len(vectors)
+        with self._lock:
+            if self._size + count > len(self._vectors):
+                capacity = max(self._size + count, len(self._vectors) * 2, 1024)
+                grown = np.empty((capacity, self.dim), dtype=np.float32)
+                grown[:self._size] = self._vectors[:self._size]
+                grown_ids = np.empty(capacity, dtype=np.int64)
+                grown_ids[:self._size] = self._ids[:self._size]
+                self._vectors, self._ids = grown, grown_ids
+            self._vectors[self._size:self._size + count] = vectors
+            self._ids[self._size:self._size + count] = ids
+            self._size += count
+            if self._should_build():
+                self._build_ivf()
+
+    def _should_build(self) -> bool:
+        if self.mode == "flat":
+            return False
+        if not self.is_ivf:
+            return self._size >= (self.ivf_min_size if self.mode == "auto" else 1)
+        return self._size - self._clustered > self._clustered * _RECLUSTER_RATIO
+
+    def build_ivf(self, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        """（重新）聚类并按聚类重排矩阵"""
+        with self._lock:
+            self._build_ivf(nlist, iterations, seed)
+
+    def _build_ivf(self, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        size = self._size
+        if not self._vectors.flags.writeable:
+            # 映射的只读矩阵：重排前复制到可写内存
+            self._vectors, self._ids = self._vectors[:size].copy(), self._ids[:size].copy()
+        nlist = nlist or self.nlist or int(4 * math.sqrt(size))
+        nlist = max(1, min(nlist, size))
+        rng = np.random.default_rng(seed)
+        vectors = self._vectors[:size]
+        # 每个聚类约 64 个训练样本即可收敛，大库只在样本上训练
+        sample = vectors[rng.choice(size, min(size, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            # 空聚类重新取一个随机样本作为中心
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+
+        assign = self._assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        self._vectors[:size] = vectors[order]
+        self._ids[:size] = self._ids[:size][order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        self.centroids = centroids
+        self._clustered = size
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[start:start + _BLOCK_ROWS] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), _BLOCK_ROWS)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+               exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量检索
+        :param queries: 查询向量（已归一化），形状 (查询数, dim)
+        :param exact: 为 True 时即使已建 IVF 也做暴力检索（用于评估召回率）
+        :return: (分数, id)，形状均为 (查询数, min(top_k, 向量数))，按分数从高到低；IVF 候选不足时 id 为 -1
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            k = min(top_k, self._size)
+            if k == 0:
+                return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+            if exact or not self.is_ivf:
+                scores, rows = self._search_rows(queries, k, 0, self._size)
+            else:
+                scores, rows = self._search_ivf(queries, k, nprobe or self.nprobe)
+            return scores, np.where(rows >= 0, self._ids[rows], -1)
+
+    def _search_rows(self, queries: np.ndarray, k: int, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """对 [start, end) 行分块暴力检索，逐块合并 top-k"""
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for block in range(start, end, _BLOCK_ROWS):
+            scores = queries @ self._vectors[block:min(block + _BLOCK_ROWS, end)].T
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(
+                np.arange(block, block + scores.shape[1]), scores.shape)], axis=1)
+            keep = _top_k(best_scores, k)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        return best_scores, best_rows
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(nprobe, len(self.centroids))
+        probes = _top_k(queries @ self.centroids.T, nprobe)
+        # 未聚类的尾部向量整批暴力检索
+        tail_scores, tail_rows = self._search_rows(queries, k, self._clustered, self._size)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            ranges = [(self._offsets[c], self._offsets[c + 1]) for c in probes[i]]
+            scores = np.concatenate([self._vectors[a:b] @ query for a, b in ranges] + [tail_scores[i]])
+            rows = np.concatenate([np.arange(a, b) for a, b in ranges] + [tail_rows[i]])
+            keep = _top_k(scores, k)
+            out_scores[i, :len(keep)] = scores[keep]
+            out_rows[i, :len(keep)] = rows[keep]
+        return out_scores, out_rows
@@ -0,0 +1,351 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from config import KNOWLEDGE_INDEX_CHECK_INTERVAL
+from app.eckert_agent.memory.embeddings import decode_vector, encode_vector, get_embedder
+from app.eckert_agent.memory.index_file import (
+    MappedDocuments, MappedIndexFile, document_sections, file_identity, write_index_file,
+)
+from app.eckert_agent.memory.pg_pool import pooled_connection
+from app.eckert_agent.memory.vector_index import VectorIndex
+
+
+class VectorRetriever:
+    """
+    知识库向量检索：从知识库表分批读取文档、嵌入后放入进程内 VectorIndex，按余弦相似度返回 top-k
+    表中已存有同一嵌入器生成的向量（embedding/embedder 列，导入时写入）时直接使用，只对缺失的文档现算并回写
+    首次检索时加载全表，之后新增文档通过 add_documents 增量加入；version 记录索引已包含的知识库版本号，
+    catch_up 按 knowledge_changes 变更记录追上其他进程的写入
+    配置了 index_path 时优先映射索引文件（毫秒级启动，多进程共享页缓存），文件之后的变更同样由 catch_up 补齐；
+    检索时每隔 check_interval 秒检查文件是否被替换，有新版本时整体切换
+    """
+
+    def __init__(self, table_name: str = "knowledge_base", embedder=None, index: Optional[VectorIndex] = None,
+                 batch_size: int = 1000, index_path=None, check_interval: float = KNOWLEDGE_INDEX_CHECK_INTERVAL):
+        """
+        :param embedder: 嵌入器（需提供 embed(texts) -> 归一化矩阵），不传时按 EMBEDDING_PROVIDER 创建
+        :param index: 向量索引，不传时按第一批向量的维度创建
+        :param batch_size: 从数据库分批读取、嵌入的文档数
+        :param index_path: 索引文件路径（build_index_file 生成），为空时总是从数据库加载
+        :param check_interval: 检查索引文件是否被替换的间隔（秒）
+        """
+        self.table_name = table_name
+        self.embedder = embedder or get_embedder()
+        self.index = index
+        self.batch_size = batch_size
+        self.index_path = Path(index_path) if index_path else None
+        self.check_interval = check_interval
+        # 文档 id → 文档行（id/title/content/keywords），检索命中后按 id 取回正文；映射索引文件时为 MappedDocuments
+        self.documents: Dict[int, Dict] = {}
+        self.index_file: Optional[MappedIndexFile] = None
+        # 索引已包含的知识库版本号（knowledge_versions），映射索引文件时取文件头部记录的版本
+        self.version = 0
+        # 上次检查时索引文件的标识（已切换或已判定不可用的文件不再重复打开）
+        self._file_identity = None
+        self._checked_at = 0.0
+        # 知识库表是否有 embedding/embedder 列（首次读表时检查；老表迁移前没有，只能现算）
+        self._stored_embeddings: Optional[bool] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def document_text(doc: Dict) -> str:
+        """参与嵌入的文本：标题、关键词、正文"""
+        return "\n".join(part for part in (doc["title"], doc.get("keywords") or "", doc["content"]) if part)
+
+    def load(self, version: int = 0) -> int:
+        """
+        加载全部文档：有可用的索引文件时映射文件，否则从数据库读取（服务端游标分批读取），返回文档数
+        :param version: 读取前的知识库版本号（从数据库加载时记为索引已包含的版本，映射文件时以文件为准）
+        """
+        if self.index_path is not None and not self._loaded:
+            with self._lock:
+                if not self._loaded and self._open_index_file():
+                    self._loaded = True
+        return self.load_batches(self._read_batches(), version)
+
+    def load_batches(self, batches: Iterable[List[Dict]], version: int = 0) -> int:
+        """从给定的文档批次加载（load 读数据库；离线构建、压测可直接传入文档），已加载时跳过"""
+        with self._lock:
+            if not self._loaded:
+                self._fill(batches, version)
+            return len(self.documents)
+
+    def _fill(self, batches: Iterable[List[Dict]], version: int):
+        for docs in batches:
+            self._add(docs)
+        self.version = version
+        self._loaded = True
+
+    def _reset(self):
+        """清空检索状态（变更记录已清理、需要从数据库整体重新加载时调用），子类清空各自的索引"""
+        if self.index is not None:
+            self.index = VectorIndex(dim=self.index.dim, mode=self.index.mode, nlist=self.index.nlist,
+                                     nprobe=self.index.nprobe, ivf_min_size=self.index.ivf_min_size)
+        self.documents = {}
+        self.index_file = None
+        self.version = 0
+        self._loaded = False
+
+    def _select_columns(self, conn) -> sql.Composable:
+        """读取文档的列：有 embedding/embedder 列时一并读出存储的向量"""
+        if self._stored_embeddings is None:
+            row = conn.execute(
+                """
+                SELECT count(*) FROM pg_attribute
+                WHERE attrelid = to_regclass(%s) AND attname IN ('embedding', 'embedder') AND NOT attisdropped
+                """,
+                (self.table_name,)
+            ).fetchone()
+            self._stored_embeddings = row[0] == 2
+        columns = ["id", "title", "content", "keywords"] + (["embedding", "embedder"] if self._stored_embeddings else [])
+        return sql.SQL(", ").join(map(sql.Identifier, columns))
+
+    def _read_batches(self) -> Iterator[List[Dict]]:
+        with pooled_connection("PostgreSQL 知识库") as conn:
+            columns = self._select_columns(conn)
+            with conn.cursor(name="knowledge_vector_load", row_factory=dict_row) as cur:
+                cur.execute(sql.SQL("SELECT {columns} FROM {table} ORDER BY id").format(
+                    columns=columns, table=sql.Identifier(self.table_name)))
+                while True:
+                    rows = cur.fetchmany(self.batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    def add_documents(self, docs: List[Dict]):
+        """增量加入新文档（尚未加载时跳过，首次检索时随全表一起加载；catch_up 已补读的文档不重复加入）"""
+        with self._lock:
+            docs = [doc for doc in docs if doc["id"] not in self.documents]
+            if self._loaded and docs:
+                self._add(docs)
+
+    def advance_version(self, version: int):
+        """
+        本进程写入并已同步增删后调用：版本号紧接在索引版本之后时直接前移；
+        中间还有其他进程的写入时保持不变，留给 catch_up 按变更记录补齐
+        """
+        with self._lock:
+            if self._loaded and version == self.version + 1:
+                self.version = version
+
+    def catch_up(self, version: int) -> bool:
+        """
+        把索引同步到知识库版本 version（尚未加载时先加载）：按 knowledge_changes 变更记录移除已删除的文档、
+        补读新增的文档，其他进程的写入也能检索到；变更记录已被清理（落后太多）时从数据库整体重新加载
+        :return: 索引是否已包含该版本（读取变更失败时返回 False，本次检索使用旧索引）
+        """
+        if not self._loaded:
+            self.load(version)
+        if self.version >= version:
+            return True
+        with self._lock:
+            if self.version >= version:
+                return True
+            try:
+                changes = self._read_changes(version)
+                if changes is None:
+                    print(f"❌ 知识库 {self.table_name} 的变更记录已清理到版本 {self.version} 之后，从数据库重新加载")
+                    self._reset()
+                    self._fill(self._read_batches(), version)
+                    return True
+                removed, added = changes
+                for doc_id in removed:
+                    self.documents.pop(doc_id, None)
+                if added:
+                    self._add(added)
+            except Exception as e:
+                print(f"❌ 知识库索引同步到版本 {version} 失败，本次检索使用版本 {self.version} 的索引：{str(e)}")
+                return False
+            self.version = version
+            return True
+
+    def _read_changes(self, version: int) -> Optional[Tuple[set, List[Dict]]]:
+        """
+        读取 (当前版本, version] 之间的变更（调用方需持有锁）
+        :return: (删除的文档 id, 需要加入的新文档行)，变更记录已被清理时返回 None
+        """
+        with pooled_connection("PostgreSQL 知识库") as conn:
+            row = conn.execute("SELECT changes_since FROM knowledge_versions WHERE table_name = %s",
+                               (self.table_name,)).fetchone()
+            if row is not None and self.version < row[0]:
+                return None
+            rows = conn.execute(
+                """
+                SELECT doc_id, deleted FROM knowledge_changes
+                WHERE table_name = %s AND version > %s AND version <= %s
+                """,
+                (self.table_name, self.version, version)
+            ).fetchall()
+            removed = {doc_id for doc_id, deleted in rows if deleted}
+            added_ids = [doc_id for doc_id, deleted in rows
+                         if not deleted and doc_id not in removed and doc_id not in self.documents]
+            added = []
+            if added_ids:
+                with conn.cursor(row_factory=dict_row) as cur:
+                    cur.execute(sql.SQL("SELECT {columns} FROM {table} WHERE id = ANY(%s) ORDER BY id").format(
+                        columns=self._select_columns(conn), table=sql.Identifier(self.table_name)), (added_ids,))
+                    added = cur.fetchall()
+        return removed, added
+
+    def remove_documents(self, doc_ids: Iterable[int]):
+        """移除文档：索引中的向量保留为墓碑，检索时跳过（下次全量加载或重建索引文件时清除）"""
+        with self._lock:
+            for doc_id in doc_ids:
+                self.documents.pop(doc_id, None)
+
+    def _add(self, docs: List[Dict]):
+        vectors = self.document_vectors(docs)
+        if self.index is None:
+            self.index = VectorIndex(dim=vectors.shape[1])
+        self.index.add([doc["id"] for doc in docs], vectors)
+        for doc in docs:
+            self.documents[doc["id"]] = {field: doc.get(field) for field in ("id", "title", "content", "keywords")}
+
+    def document_vectors(self, docs: List[Dict]) -> np.ndarray:
+        """
+        文档向量：优先使用行中存储的向量（embedder 与当前嵌入器一致时），其余现算；
+        现算的向量回写到表中（表有 embedding 列时），之后加载的进程不再重复嵌入
+        """
+        name = getattr(self.embedder, "name", None)
+        vectors: List[Optional[np.ndarray]] = [
+            decode_vector(doc["embedding"]) if doc.get("embedding") is not None and doc.get("embedder") == name
+            else None for doc in docs
+        ]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embedder.embed([self.document_text(docs[i]) for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+            if self._stored_embeddings:
+                self._store_vectors([docs[i]["id"] for i in missing], computed)
+        return np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def _store_vectors(self, doc_ids: List[int], vectors: np.ndarray):
+        """回写现算的向量（失败只打印，不影响检索）"""
+        try:
+            with pooled_connection("PostgreSQL 知识库") as conn:
+                conn.execute(sql.SQL("""
+                    UPDATE {table} AS t SET embedding = v.embedding, embedder = %s
+                    FROM unnest(%s::bigint[], %s::bytea[]) AS v(id, embedding)
+                    WHERE t.id = v.id
+                """).format(table=sql.Identifier(self.table_name)), (
+                    getattr(self.embedder, "name", None), doc_ids, [encode_vector(vector) for vector in vectors],
+                ))
+        except Exception as e:
+            print(f"❌ 知识库 {self.table_name} 回写向量失败：{str(e)}")
+
+    def index_sections(self) -> Dict[str, np.ndarray]:
+        """写入索引文件的段（子类追加各自索引的段）"""
+        sections = document_sections(self.documents)
+        if self.index is not None:
+            sections.update(self.index.sections())
+        return sections
+
+    def _open_sections(self, mapped: MappedIndexFile) -> Optional[Dict]:
+        """
+        用映射的索引文件创建检索状态（属性名 → 值），文件与当前嵌入器不一致时返回 None
+        子类追加各自的索引
+        """
+        meta = mapped.meta
+        if meta.get("embedder") != getattr(self.embedder, "name", None) or meta.get("table") != self.table_name:
+            print(f"❌ 索引文件 {mapped.path} 由 {meta.get('table')}/{meta.get('embedder')} 生成，与当前配置不一致，"
+                  f"改为从数据库加载")
+            return None
+        index = None
+        if "vectors" in mapped:
+            params = {} if self.index is None else {"mode": self.index.mode, "nprobe": self.index.nprobe}
+            index = VectorIndex.from_sections({name: mapped.array(name) for name in (
+                "vectors", "vector_ids", "ivf_centroids", "ivf_offsets", "ivf_clustered") if name in mapped}, **params)
+        return {"index": index, "documents": MappedDocuments.from_file(mapped), "index_file": mapped}
+
+    def _open_index_file(self) -> bool:
+        """映射索引文件（调用方需持有锁），文件之后的变更由 catch_up 补齐；文件不存在或不可用时返回 False"""
+        self._checked_at = time.monotonic()
+        self._file_identity = file_identity(self.index_path)
+        try:
+            mapped = MappedIndexFile(self.index_path)
+            self._file_identity = mapped.identity
+            state = self._open_sections(mapped)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"❌ 索引文件 {self.index_path} 打开失败，改为从数据库加载：{str(e)}")
+            return False
+        if state is None:
+            return False
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.version = mapped.meta.get("version", 0)
+        return True
+
+    def _refresh_index_file(self):
+        """
+        索引文件被替换（重建完成）时切换到新文件，检索中的查询用完旧映射后自动释放
+        切换后 version 回到文件记录的版本，之后的变更由下一次 catch_up 补齐
+        """
+        if self.index_path is None or time.monotonic() - self._checked_at < self.check_interval:
+            return
+        self._checked_at = time.monotonic()
+        identity = file_identity(self.index_path)
+        if identity is None or identity == self._file_identity:
+            return
+        with self._lock:
+            if self._open_index_file():
+                print(f"✅ 知识库索引切换到 {self.index_path}（版本 {self.index_file.meta.get('version')}）")
+
+    def build_index_file(self, path, version: int = 0) -> int:
+        """
+        把当前已加载的全部索引写成索引文件（未加载时先从数据库加载）
+        :param version: 写入头部的知识库版本号（生成文件时对应的数据版本）
+        :return: 文件字节数
+        """
+        if not self._loaded:
+            self.load_batches(self._read_batches(), version)
+        with self._lock:
+            sections = self.index_sections()
+            meta = {
+                "table": self.table_name,
+                "embedder": getattr(self.embedder, "name", None),
+                "version": version,
+                "documents": len(self.documents),
+                "max_id": int(sections["doc_ids"][-1]) if len(sections["doc_ids"]) else 0,
+                "built_at": time.time(),
+            }
+            return write_index_file(path, sections, meta)
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+        """返回与 query 最相似的 top_k 篇文档（含 id/title/content/keywords/rank，rank 为余弦相似度）"""
+        return self.search_batch([query], top_k)[0]
+
+    def search_batch(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        """批量检索：查询一次嵌入（不持锁）、一次矩阵运算（持锁，与索引文件切换互斥）"""
+        if not self._loaded:
+            self.load()
+        self._refresh_index_file()
+        if not queries:
+            return []
+        vectors = self.embedder.embed(queries)
+        with self._lock:
+            return self._search_vectors(queries, vectors, top_k)
+
+    def _vector_rankings(self, vectors: np.ndarray, top_k: int) -> List[List[Tuple[int, float]]]:
+        """每个查询的 [(文档 id, 余弦相似度)]，跳过已移除的文档与无效分数"""
+        if self.index is None:
+            return [[] for _ in vectors]
+        scores, ids = self.index.search(vectors, top_k)
+        return [
+            [(int(doc_id), float(score)) for score, doc_id in zip(row_scores, row_ids)
+             if int(doc_id) in self.documents and score > 0 and np.isfinite(score)]
+            for row_scores, row_ids in zip(scores, ids)
+        ]
+
+    def _search_vectors(self, queries: List[str], vectors: np.ndarray, top_k: int) -> List[List[Dict]]:
+        return [[{**self.documents[doc_id], "rank": score} for doc_id, score in ranking]
+                for ranking in self._vector_rankings(vectors, top_k)]
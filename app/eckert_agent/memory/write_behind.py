@@ -0,0 +1,277 @@
+import atexit
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (
+    WRITE_BEHIND_MAX_QUEUE, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_FULL_POLICY,
+    WRITE_BEHIND_BLOCK_TIMEOUT, WRITE_BEHIND_MAX_RETRIES,
+)
+
+# 批量写入函数：[(session_id, [role+content 消息, ...]), ...]，一次事务写完
+BatchWriter = Callable[[List[Tuple[str, List[Dict]]]], None]
+
+# 队列中的控制标记：立即写出当前批次 / 停止工作线程
+_FLUSH = object()
+_STOP = object()
+
+# 所有存活的队列（读取历史前按会话检查是否有未落库的消息）
+_queues: "weakref.WeakSet[WriteBehindQueue]" = weakref.WeakSet()
+
+
+class WriteBehindFullError(Exception):
+    """异步落库队列已满（fail 策略立即抛出，block 策略等待超时后抛出）"""
+
+
+class WriteBehindError(Exception):
+    """异步落库重试耗尽后仍有消息没有写入（close 时抛出，消息保留在 dead_letters 中）"""
+
+
+class WriteBehindQueue:
+    """
+    异步落库队列：调用方只把消息放进有界内存队列即返回，后台线程合并写入
+    - 攒够 batch_size 条或距第一条超过 flush_interval 秒时写出一批，同一会话的消息合并为一条语句，整批一个事务
+    - 队列满时按 full_policy 处理：block 阻塞等待（背压），fail 立即抛 WriteBehindFullError
+    - 写入失败按指数退避重试 max_retries 次，仍失败的消息移入 dead_letters（不丢弃），
+      flush() 返回 False、close() 抛 WriteBehindError，可调用 retry_failed() 重新入队
+    - close() / 进程退出时把队列中剩余消息全部写完再返回
+    - 进程内共用一个队列（get_write_behind_queue）：每个条目带着自己的写入函数，同一批中按写入函数分组写出
+    """
+
+    def __init__(self, writer: Optional[BatchWriter] = None, max_size: int = WRITE_BEHIND_MAX_QUEUE,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE, flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 full_policy: str = WRITE_BEHIND_FULL_POLICY, block_timeout: float = WRITE_BEHIND_BLOCK_TIMEOUT,
+                 max_retries: int = WRITE_BEHIND_MAX_RETRIES):
+        """
+        :param writer: 默认的批量写入函数（如 ChatMemory.save_batch），enqueue 未指定写入函数时使用
+        :param max_size: 队列最多容纳的待写条目数（每次 enqueue 为一条）
+        :param batch_size: 每批最多写入的条目数
+        :param flush_interval: 批次最长等待时间（秒）
+        :param full_policy: 队列满时的策略：block 或 fail
+        :param block_timeout: block 策略的最长等待时间（秒），<=0 表示一直等
+        :param max_retries: 写入失败后的重试次数
+        """
+        if full_policy not in ("block", "fail"):
+            raise ValueError("队列满时的策略只能是 block 或 fail")
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_size)
+        self._cond = threading.Condition()
+        self._pending: Dict[str, int] = {}
+        self._enqueued = 0
+        self._processed = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+        # 重试耗尽仍未写入的条目：(session_id, 消息, 写入函数)
+        self.dead_letters: List[Tuple[str, List[Dict], BatchWriter]] = []
+        self.batches = 0
+        _queues.add(self)
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="chat-memory-write-behind", daemon=True)
+                    self._thread.start()
+
+    def enqueue(self, session_id: str, messages: List[Dict], writer: Optional[BatchWriter] = None):
+        """
+        放入队列后立即返回；队列满时按策略阻塞或抛 WriteBehindFullError
+        :param writer: 这条消息的批量写入函数，不传时使用队列的默认写入函数
+        """
+        if not messages:
+            return
+        writer = writer or self.writer
+        if writer is None:
+            raise ValueError("异步落库队列没有默认的写入函数，enqueue 需要指定 writer")
+        if self._closed:
+            raise WriteBehindFullError("异步落库队列已关闭")
+        self._ensure_worker()
+        # 先登记再入队，保证工作线程处理时计数已存在
+        with self._cond:
+            self._enqueued += 1
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        try:
+            if self.full_policy == "fail":
+                self._queue.put_nowait((session_id, messages, writer))
+            else:
+                self._queue.put((session_id, messages, writer),
+                                timeout=self.block_timeout if self.block_timeout > 0 else None)
+        except queue.Full:
+            with self._cond:
+                self._enqueued -= 1
+                self._release_pending(session_id)
+            raise WriteBehindFullError(f"异步落库队列已满（{self._queue.maxsize} 条）")
+
+    def _release_pending(self, session_id: str):
+        """会话待写计数减一（调用方需持有锁）"""
+        count = self._pending.get(session_id, 0) - 1
+        if count > 0:
+            self._pending[session_id] = count
+        else:
+            self._pending.pop(session_id, None)
+
+    def has_pending(self, session_id: str) -> bool:
+        """会话是否还有未落库的消息"""
+        return session_id in self._pending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待调用前已入队的消息全部写完（不等待批次间隔）
+        :return: 是否在超时前完成且没有新的写入失败（失败的消息见 dead_letters）
+        """
+        with self._cond:
+            target = self._enqueued
+            failed = self.dropped
+            if self._processed >= target:
+                return True
+        try:
+            self._queue.put_nowait(_FLUSH)
+        except queue.Full:
+            # 队列已满说明工作线程正在连续写出，无需额外唤醒
+            pass
+        with self._cond:
+            return self._cond.wait_for(lambda: self._processed >= target, timeout) and self.dropped == failed
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        停止接收新消息，写完队列中剩余的消息后结束工作线程（进程退出时自动调用）
+        :raises WriteBehindError: 有消息重试耗尽仍未写入（保留在 dead_letters 中）
+        """
+        if not self._closed:
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join(timeout)
+        if self.dead_letters:
+            count = sum(len(messages) for _, messages, _ in self.dead_letters)
+            raise WriteBehindError(f"异步落库有 {count} 条消息重试耗尽仍未写入，已保留在 dead_letters 中")
+
+    def retry_failed(self) -> int:
+        """
+        把 dead_letters 中的条目重新入队（数据库恢复后调用），返回重新入队的条目数
+        重新入队的消息排在失败之后已写入的消息后面，同一会话的 id 顺序可能与对话顺序不一致
+        """
+        with self._cond:
+            entries, self.dead_letters = self.dead_letters, []
+        for session_id, messages, writer in entries:
+            self.enqueue(session_id, messages, writer)
+        return len(entries)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            if item is _FLUSH:
+                continue
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _FLUSH:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                # 关闭前可能还有在 _STOP 之后入队的消息，继续写完
+                self._drain()
+                return
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _FLUSH and item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.batch_size):
+            self._write(batch[start:start + self.batch_size])
+
+    def _write(self, batch: List[Tuple[str, List[Dict], BatchWriter]]):
+        """按写入函数分组、合并同一会话的消息（保持顺序）后每组一次写入，失败时指数退避重试"""
+        groups: "OrderedDict[BatchWriter, OrderedDict[str, List[Dict]]]" = OrderedDict()
+        for session_id, messages, writer in batch:
+            groups.setdefault(writer, OrderedDict()).setdefault(session_id, []).extend(messages)
+        for writer, merged in groups.items():
+            count = sum(len(messages) for messages in merged.values())
+            for attempt in range(self.max_retries + 1):
+                try:
+                    writer(list(merged.items()))
+                    self.written += count
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        with self._cond:
+                            self.dropped += count
+                            self.dead_letters.extend((session_id, messages, writer)
+                                                     for session_id, messages in merged.items())
+                        print(f"❌ 异步落库失败，{count} 条消息移入 dead_letters：{str(e)}")
+                    else:
+                        time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        self.batches += 1
+        with self._cond:
+            self._processed += len(batch)
+            for session_id, _, _ in batch:
+                self._release_pending(session_id)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "dead_letters": len(self.dead_letters),
+            "batches": self.batches,
+            "pending_sessions": len(self._pending),
+        }
+
+
+_shared_queue: Optional[WriteBehindQueue] = None
+_shared_lock = threading.Lock()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """进程内共享的异步落库队列（多个 ChatMemory 实例共用一个后台线程与一个有界队列，按配置创建一次）"""
+    global _shared_queue
+    if _shared_queue is None:
+        with _shared_lock:
+            if _shared_queue is None:
+                _shared_queue = WriteBehindQueue()
+    return _shared_queue
+
+
+def flush_session(session_id: str, timeout: Optional[float] = None):
+    """读取会话历史前调用：若有队列还持有该会话未落库的消息，先等其写完（读己之写）"""
+    for write_queue in list(_queues):
+        if write_queue.has_pending(session_id):
+            write_queue.flush(timeout)
+
+
+@atexit.register
+def _close_all():
+    """进程退出时把所有队列中剩余的消息写完，仍有未写入的消息时逐个队列报错"""
+    for write_queue in list(_queues):
+        try:
+            write_queue.close()
+        except WriteBehindError as e:
+            print(f"❌ {str(e)}")
@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+
+class QueueFullError(Exception):
+    """排队中的请求数已达上限（快速失败，避免无限堆积）"""
+
+
+class DeadlineExceededError(TimeoutError):
+    """请求在截止时间前未拿到执行名额"""
+
+
+class _Waiter:
+    """排队中的请求：按 (priority, 到达顺序) 出队"""
+    __slots__ = ("priority", "seq", "deadline", "event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, priority: int, seq: int, deadline: Optional[float]):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.event = None
+        self.loop = None
+        self.future = None
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _set_future(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class InflightLimiter:
+    """
+    单个后端的在途请求上限 + 有界优先级等待队列（同步线程与协程共用同一计数）
+    - priority 数值越小越优先，同优先级先到先得
+    - deadline 为 time.monotonic() 时间点，超过仍未拿到名额则抛 DeadlineExceededError
+    - 释放名额时直接移交给队首等待者，后到的请求不能插队
+    """
+
+    def __init__(self, max_inflight: int, max_waiting: Optional[int] = None):
+        """
+        :param max_inflight: 同时在途的最大请求数
+        :param max_waiting: 最大排队数，为空表示不限；超出时抛 QueueFullError
+        """
+        if max_inflight < 1:
+            raise ValueError("max_inflight 必须大于等于 1")
+        self.max_inflight = max_inflight
+        self.max_waiting = max_waiting
+        self._inflight = 0
+        self._waiting = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def inflight(self) -> int:
+        """当前在途请求数"""
+        return self._inflight
+
+    @property
+    def waiting(self) -> int:
+        """当前排队请求数"""
+        return self._waiting
+
+    def _try_enqueue(self, priority: int, deadline: Optional[float]) -> Optional[_Waiter]:
+        """有空闲名额且无人排队时直接占用返回 None，否则入队返回等待者（调用方需持有锁）"""
+        if self._inflight < self.max_inflight and self._waiting == 0:
+            self._inflight += 1
+            return None
+        if deadline is not None and deadline <= time.monotonic():
+            raise DeadlineExceededError("LLM 请求已超过截止时间，未进入队列")
+        if self.max_waiting is not None and self._waiting >= self.max_waiting:
+            raise QueueFullError(f"LLM 请求队列已满（排队 {self._waiting} 个）")
+        waiter = _Waiter(priority, next(self._seq), deadline)
+        heapq.heappush(self._heap, waiter)
+        self._waiting += 1
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """等待者放弃排队；若名额已移交给它则返回 True（调用方需持有锁）"""
+        if waiter.granted:
+            return True
+        waiter.cancelled = True
+        self._waiting -= 1
+        return False
+
+    def acquire(self, priority: int = 0, deadline: Optional[float] = None) -> None:
+        """同步占用一个名额，超过截止时间抛 DeadlineExceededError"""
+        with self._lock:
+            waiter = self._try_enqueue(priority, deadline)
+            if waiter is None:
+                return
+            waiter.event = threading.Event()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if waiter.event.wait(timeout):
+            return
+        with self._lock:
+            if self._abandon(waiter):
+                return
+        raise DeadlineExceededError("LLM 请求排队超时")
+
+    async def aacquire(self, priority: int = 0, deadline: Optional[float] = None) -> None:
+        """异步占用一个名额（不阻塞事件循环），超过截止时间抛 DeadlineExceededError"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = self._try_enqueue(priority, deadline)
+            if waiter is None:
+                return
+            waiter.loop = loop
+            waiter.future = loop.create_future()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if self._abandon(waiter):
+                    return
+            raise DeadlineExceededError("LLM 请求排队超时")
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = self._abandon(waiter)
+            if granted:
+                # 名额已移交但调用方被取消：归还给下一个等待者
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """归还名额：有人排队则直接移交给队首，否则在途数减一"""
+        with self._lock:
+            while self._heap:
+                waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                if waiter.loop is not None:
+                    try:
+                        waiter.loop.call_soon_threadsafe(_set_future, waiter.future)
+                    except RuntimeError:
+                        # 等待者所在事件循环已关闭，顺延给下一个
+                        waiter.cancelled = True
+                        self._waiting -= 1
+                        continue
+                else:
+                    waiter.event.set()
+                waiter.granted = True
+                self._waiting -= 1
+                return
+            self._inflight -= 1
+
+    @contextmanager
+    def slot(self, priority: int = 0, deadline: Optional[float] = None) -> Iterator[None]:
+        """同步上下文：占用名额直到退出"""
+        self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = 0, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """异步上下文：占用名额直到退出"""
+        await self.aacquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
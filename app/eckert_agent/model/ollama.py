@@ -1,26 +1,105 @@
-from langchain_ollama import ChatOllama
-from config import OLLAMA_MODEL, OLLAMA_BASE_URL, OLLAMA_TEMPERATURE
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+
+from app.eckert_agent.model.ollama_pool import PooledChatOllama
+from app.eckert_agent.model.response_cache import LRUResponseCache, PostgresResponseCache, ResponseCache
+from config import (
+    OLLAMA_MODEL, OLLAMA_BASE_URL, OLLAMA_TEMPERATURE,
+    OLLAMA_MAX_INFLIGHT, OLLAMA_POOL_MAX_CONNECTIONS, OLLAMA_KEEPALIVE_EXPIRY, OLLAMA_REQUEST_TIMEOUT,
+    OLLAMA_BASE_URLS, OLLAMA_STICKY_SESSIONS, OLLAMA_EJECT_SECONDS, OLLAMA_LATENCY_EWMA_ALPHA,
+    OLLAMA_MAX_WAITING, OLLAMA_QUEUE_TIMEOUT, OLLAMA_COALESCE_REQUESTS,
+    LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_PG_ENABLED, LLM_CACHE_PG_TTL,
+    LLM_CACHE_PG_MAX_ROWS,
+)
 
 
 class OllamaModel:
-    """Ollama 模型封装类（单例模式）"""
+    """Ollama 模型封装类（单例模式，底层为 keep-alive 连接池 + 多后端路由的 PooledChatOllama）"""
     # 类属性：存储全局唯一实例
     _instance = None
     _llm = None
+    _lock = threading.Lock()
 
     def __new__(cls):
-        """控制实例创建，确保全局唯一"""
+        """控制实例创建，确保全局唯一（多线程并发首次创建时加锁）"""
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            # 仅在第一次实例化时初始化 llm
-            cls._llm = ChatOllama(
-                model=OLLAMA_MODEL,
-                base_url=OLLAMA_BASE_URL,
-                temperature=OLLAMA_TEMPERATURE,
-
-            )
+            with cls._lock:
+                if cls._instance is None:
+                    # 仅在第一次实例化时初始化 llm
+                    cls._llm = cls._build_llm()
+                    cls._instance = super().__new__(cls)
         return cls._instance
 
+    @staticmethod
+    def _build_llm() -> PooledChatOllama:
+        """构建带连接池的 llm：每个后端的同步/异步 httpx 客户端各自复用 keep-alive 连接"""
+        limits = httpx.Limits(
+            max_connections=OLLAMA_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_POOL_MAX_CONNECTIONS,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        )
+        return PooledChatOllama(
+            model=OLLAMA_MODEL,
+            base_url=OLLAMA_BASE_URL,
+            temperature=OLLAMA_TEMPERATURE,
+            max_inflight=OLLAMA_MAX_INFLIGHT,
+            base_urls=OLLAMA_BASE_URLS,
+            sticky_sessions=OLLAMA_STICKY_SESSIONS,
+            eject_seconds=OLLAMA_EJECT_SECONDS,
+            latency_ewma_alpha=OLLAMA_LATENCY_EWMA_ALPHA,
+            max_waiting=OLLAMA_MAX_WAITING,
+            queue_timeout=OLLAMA_QUEUE_TIMEOUT or None,
+            coalesce_requests=OLLAMA_COALESCE_REQUESTS,
+            client_kwargs={"limits": limits, "timeout": OLLAMA_REQUEST_TIMEOUT},
+            response_cache=OllamaModel._build_response_cache(),
+        )
+
+    @staticmethod
+    def _build_response_cache() -> Optional[ResponseCache]:
+        """按配置构建响应缓存（未开启时返回 None）"""
+        if not LLM_CACHE_ENABLED:
+            return None
+        persistent = None
+        if LLM_CACHE_PG_ENABLED:
+            persistent = PostgresResponseCache(ttl=LLM_CACHE_PG_TTL, max_rows=LLM_CACHE_PG_MAX_ROWS)
+        return ResponseCache(LRUResponseCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL), persistent)
+
     # 提供 getter 方法，暴露 llm 实例
-    def get_llm(self):
-        return self._llm
\ No newline at end of file
+    def get_llm(self) -> PooledChatOllama:
+        return self._llm
+
+    def backend_stats(self) -> List[Dict]:
+        """各后端的健康状态、在途数、延迟滑动平均"""
+        return self._llm.router.stats()
+
+    def coalesce_stats(self) -> Optional[Dict]:
+        """请求合并统计：领头请求数（实际上游调用）与跟随请求数（未开启合并时返回 None）"""
+        coalescer = self._llm.coalescer
+        return coalescer.stats() if coalescer is not None else None
+
+    def cache_stats(self) -> Optional[Dict]:
+        """响应缓存命中统计（未开启缓存时返回 None）"""
+        cache = self._llm.response_cache
+        return cache.stats() if cache is not None else None
+
+    # ========== 同步 / 异步调用入口 ==========
+    def invoke(self, messages: Any, **kwargs: Any):
+        """
+        同步调用，返回完整 AIMessage
+        可选调度参数：session_id（粘滞路由）、priority（越小越优先）、queue_timeout（排队超时秒数）
+        """
+        return self._llm.invoke(messages, **kwargs)
+
+    def stream(self, messages: Any, **kwargs: Any) -> Iterator:
+        """同步流式调用，逐块返回 AIMessageChunk"""
+        return self._llm.stream(messages, **kwargs)
+
+    async def ainvoke(self, messages: Any, **kwargs: Any):
+        """异步调用，等待期间不阻塞事件循环"""
+        return await self._llm.ainvoke(messages, **kwargs)
+
+    def astream(self, messages: Any, **kwargs: Any) -> AsyncIterator:
+        """异步流式调用：async for chunk in OllamaModel().astream(...)"""
+        return self._llm.astream(messages, **kwargs)
@@ -0,0 +1,350 @@
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Mapping, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.messages import AIMessage, BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_ollama import ChatOllama
+from pydantic import Field, PrivateAttr, model_validator
+
+from app.eckert_agent.model.ollama_router import OllamaRouter, is_backend_failure
+from app.eckert_agent.model.request_coalescer import (
+    LeaderAbandonedError, RequestCoalescer, is_deterministic, request_key,
+)
+from app.eckert_agent.model.response_cache import ResponseCache, make_cache_key, replay_as_stream
+
+
+# 只影响调度（路由/排队）的调用参数：不发往 Ollama，也不参与缓存键
+SCHEDULING_KWARGS = ("session_id", "priority", "queue_timeout")
+
+
+def resolve_call_options(kwargs: Dict[str, Any], run_manager: Any = None) -> Dict[str, Any]:
+    """
+    从运行元数据补全调度参数（调用参数优先），写回 kwargs
+    - session_id：metadata.session_id > LangGraph 的 thread_id（用于粘滞路由）
+    - priority / queue_timeout：metadata 中的同名字段（用于排队优先级与截止时间）
+    """
+    if run_manager is None:
+        return kwargs
+    metadata = run_manager.metadata or {}
+    if not kwargs.get("session_id"):
+        session_id = metadata.get("session_id") or metadata.get("thread_id")
+        if session_id:
+            kwargs["session_id"] = session_id
+    for key in ("priority", "queue_timeout"):
+        if kwargs.get(key) is None and metadata.get(key) is not None:
+            kwargs[key] = metadata[key]
+    return kwargs
+
+
+class PooledChatOllama(ChatOllama):
+    """
+    带连接池与多后端路由的 ChatOllama
+    - HTTP 连接复用由 client_kwargs 中的 httpx.Limits 控制（keep-alive 连接池）
+    - 每次请求（含流式输出全过程）占用所选后端的一个名额，超出上限的请求按优先级在本地有界队列排队，
+      可传 priority（越小越优先）与 queue_timeout（排队超时秒数）
+    - 可选请求合并：同一时刻参数完全相同的请求只发一次上游调用，共享输出流
+    - 多后端时按最少负载路由，后端故障自动摘除；尚未输出内容时换后端重试
+    - 可选响应缓存：相同的规范化消息 + 模型 + 温度直接返回缓存，流式调用按流重放
+    - 仍是 ChatOllama 子类，可直接传给 create_agent / bind_tools
+    """
+
+    max_inflight: int = Field(default=8, ge=1, description="单个后端同时在途的最大请求数")
+    base_urls: List[str] = Field(default_factory=list, description="后端地址列表，为空时只用 base_url")
+    sticky_sessions: bool = Field(default=False, description="同一 session_id 固定路由到同一后端")
+    eject_seconds: float = Field(default=30.0, description="后端故障后的摘除冷却时间（秒）")
+    latency_ewma_alpha: float = Field(default=0.2, description="首包延迟滑动平均系数")
+    response_cache: Optional[ResponseCache] = Field(default=None, exclude=True, description="响应缓存，为空时不缓存")
+    max_waiting: Optional[int] = Field(default=None, description="单个后端最大排队数，为空不限，超出快速失败")
+    queue_timeout: Optional[float] = Field(default=None, description="默认排队超时（秒），为空不限")
+    coalesce_requests: bool = Field(default=False,
+                                    description="合并同一时刻参数完全相同、且输出可复现（temperature=0 或指定 seed）的请求")
+
+    _router: OllamaRouter = PrivateAttr()
+    _coalescer: Optional[RequestCoalescer] = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def _set_router(self) -> "PooledChatOllama":
+        client_kwargs = self.client_kwargs or {}
+        self._router = OllamaRouter(
+            base_urls=self.base_urls or [self.base_url or "http://localhost:11434"],
+            max_inflight=self.max_inflight,
+            client_kwargs={**client_kwargs, **(self.sync_client_kwargs or {})},
+            async_client_kwargs={**client_kwargs, **(self.async_client_kwargs or {})},
+            sticky_sessions=self.sticky_sessions,
+            eject_seconds=self.eject_seconds,
+            ewma_alpha=self.latency_ewma_alpha,
+            max_waiting=self.max_waiting,
+        )
+        if self.coalesce_requests:
+            self._coalescer = RequestCoalescer()
+        return self
+
+    @property
+    def router(self) -> OllamaRouter:
+        return self._router
+
+    @property
+    def coalescer(self) -> Optional[RequestCoalescer]:
+        return self._coalescer
+
+    @property
+    def inflight(self) -> int:
+        """所有后端的在途请求数之和"""
+        return self._router.inflight
+
+    # ========== 入口：带出 session_id，查询/回填响应缓存 ==========
+    def _response_cache_key(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                            kwargs: Dict[str, Any]) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        # 绑定的工具、输出格式等调用参数也参与缓存键；调度参数不参与
+        extra = {k: v for k, v in kwargs.items() if k not in SCHEDULING_KWARGS}
+        if stop:
+            extra["stop"] = stop
+        options = kwargs.get("options") or {}
+        return make_cache_key(messages, self.model, options.get("temperature", self.temperature), extra)
+
+    def _store_response(self, cache_key: Optional[str], message: AIMessage):
+        """只缓存有效回复（有内容或工具调用）"""
+        if cache_key and (message.content or message.tool_calls):
+            self.response_cache.put(cache_key, message, self.model)
+
+    async def _astore_response(self, cache_key: Optional[str], message: AIMessage):
+        if cache_key and (message.content or message.tool_calls):
+            await self.response_cache.aput(cache_key, message, self.model)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = resolve_call_options(kwargs, run_manager)
+        cache_key = self._response_cache_key(messages, stop, kwargs)
+        if cache_key and (cached := self.response_cache.get(cache_key)) is not None:
+            return ChatResult(generations=[ChatGeneration(message=cached, generation_info={"cache_hit": True})])
+        result = super()._generate(messages, stop, run_manager, **kwargs)
+        self._store_response(cache_key, result.generations[0].message)
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        kwargs = resolve_call_options(kwargs, run_manager)
+        cache_key = self._response_cache_key(messages, stop, kwargs)
+        if cache_key and (cached := self.response_cache.get(cache_key)) is not None:
+            # 命中：把缓存回复按流式重放，调用方无需区分
+            for chunk in replay_as_stream(cached):
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+        final_chunk = None
+        for chunk in super()._stream(messages, stop, run_manager, **kwargs):
+            final_chunk = chunk if final_chunk is None else final_chunk + chunk
+            yield chunk
+        if final_chunk is not None:
+            self._store_response(cache_key, message_chunk_to_message(final_chunk.message))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = resolve_call_options(kwargs, run_manager)
+        cache_key = self._response_cache_key(messages, stop, kwargs)
+        if cache_key and (cached := await self.response_cache.aget(cache_key)) is not None:
+            return ChatResult(generations=[ChatGeneration(message=cached, generation_info={"cache_hit": True})])
+        result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+        await self._astore_response(cache_key, result.generations[0].message)
+        return result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        kwargs = resolve_call_options(kwargs, run_manager)
+        cache_key = self._response_cache_key(messages, stop, kwargs)
+        if cache_key and (cached := await self.response_cache.aget(cache_key)) is not None:
+            for chunk in replay_as_stream(cached):
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+        final_chunk = None
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            final_chunk = chunk if final_chunk is None else final_chunk + chunk
+            yield chunk
+        if final_chunk is not None:
+            await self._astore_response(cache_key, message_chunk_to_message(final_chunk.message))
+
+    # ========== 请求合并 ==========
+    def _pop_schedule(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """取出调度参数，并把排队超时换算为截止时间点"""
+        queue_timeout = kwargs.pop("queue_timeout", None) or self.queue_timeout
+        return {
+            "session_id": kwargs.pop("session_id", None),
+            "priority": kwargs.pop("priority", None) or 0,
+            "deadline": time.monotonic() + queue_timeout if queue_timeout else None,
+        }
+
+    def _create_chat_stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[Mapping[str, Any] | str]:
+        schedule = self._pop_schedule(kwargs)
+        chat_params = self._chat_params(messages, stop, **kwargs)
+        if self._coalescer is None or not is_deterministic(chat_params):
+            yield from self._dispatch(chat_params, **schedule)
+            return
+
+        key = request_key(chat_params)
+        shared, leader = self._coalescer.join(key)
+        if not leader:
+            received = 0
+            try:
+                for part in shared.iter_parts():
+                    received += 1
+                    yield part
+                return
+            except LeaderAbandonedError:
+                if received:
+                    raise
+            # 领头请求未输出任何内容就被关闭：自行发起调用
+            yield from self._dispatch(chat_params, **schedule)
+            return
+
+        try:
+            for part in self._dispatch(chat_params, **schedule):
+                shared.publish(part)
+                yield part
+        except Exception as e:
+            shared.finish(e)
+            raise
+        except BaseException:
+            shared.finish(LeaderAbandonedError("合并请求的领头调用被提前关闭"))
+            raise
+        else:
+            shared.finish()
+        finally:
+            self._coalescer.leave(key, shared)
+
+    async def _acreate_chat_stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Mapping[str, Any] | str]:
+        schedule = self._pop_schedule(kwargs)
+        chat_params = self._chat_params(messages, stop, **kwargs)
+        if self._coalescer is None or not is_deterministic(chat_params):
+            async for part in self._adispatch(chat_params, **schedule):
+                yield part
+            return
+
+        key = request_key(chat_params)
+        shared, leader = self._coalescer.join(key)
+        if not leader:
+            received = 0
+            try:
+                async for part in shared.aiter_parts():
+                    received += 1
+                    yield part
+                return
+            except LeaderAbandonedError:
+                if received:
+                    raise
+            async for part in self._adispatch(chat_params, **schedule):
+                yield part
+            return
+
+        try:
+            async for part in self._adispatch(chat_params, **schedule):
+                shared.publish(part)
+                yield part
+        except Exception as e:
+            shared.finish(e)
+            raise
+        except BaseException:
+            shared.finish(LeaderAbandonedError("合并请求的领头调用被提前关闭"))
+            raise
+        else:
+            shared.finish()
+        finally:
+            self._coalescer.leave(key, shared)
+
+    # ========== 路由 + 排队 + 故障转移 ==========
+    def _dispatch(self, chat_params: Dict[str, Any], session_id: Optional[str] = None, priority: int = 0,
+                  deadline: Optional[float] = None) -> Iterator[Mapping[str, Any] | str]:
+        tried = ()
+        while True:
+            backend = self._router.acquire(session_id, exclude=tried)
+            latency = None
+            try:
+                with backend.limiter.slot(priority, deadline):
+                    started = time.perf_counter()
+                    if chat_params["stream"]:
+                        for part in backend.client.chat(**chat_params):
+                            if latency is None:
+                                latency = time.perf_counter() - started
+                            yield part
+                    else:
+                        part = backend.client.chat(**chat_params)
+                        latency = time.perf_counter() - started
+                        yield part
+            except Exception as e:
+                self._router.release(backend, error=e)
+                # 后端故障且尚未输出任何内容：换一个后端重试
+                if latency is None and is_backend_failure(e) and len(tried) + 1 < len(self._router.backends):
+                    tried += (backend,)
+                    continue
+                raise
+            except BaseException:
+                # 调用方提前关闭生成器（GeneratorExit）等，不算后端故障
+                self._router.release(backend)
+                raise
+            self._router.release(backend, latency=latency)
+            return
+
+    async def _adispatch(self, chat_params: Dict[str, Any], session_id: Optional[str] = None, priority: int = 0,
+                         deadline: Optional[float] = None) -> AsyncIterator[Mapping[str, Any] | str]:
+        tried = ()
+        while True:
+            backend = await self._router.aacquire(session_id, exclude=tried)
+            latency = None
+            try:
+                async with backend.limiter.aslot(priority, deadline):
+                    started = time.perf_counter()
+                    if chat_params["stream"]:
+                        async for part in await backend.async_client.chat(**chat_params):
+                            if latency is None:
+                                latency = time.perf_counter() - started
+                            yield part
+                    else:
+                        part = await backend.async_client.chat(**chat_params)
+                        latency = time.perf_counter() - started
+                        yield part
+            except Exception as e:
+                self._router.release(backend, error=e)
+                if latency is None and is_backend_failure(e) and len(tried) + 1 < len(self._router.backends):
+                    tried += (backend,)
+                    continue
+                raise
+            except BaseException:
+                self._router.release(backend)
+                raise
+            self._router.release(backend, latency=latency)
+            return
@@ -0,0 +1,222 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+from ollama import AsyncClient, Client, ResponseError
+
+from app.eckert_agent.model.inflight_limiter import InflightLimiter
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """判断异常是否由后端自身故障引起（连接失败、超时、5xx），4xx 属于请求问题不摘除后端"""
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return True
+    if isinstance(error, ResponseError):
+        return error.status_code < 0 or error.status_code >= 500
+    return False
+
+
+class OllamaBackend:
+    """单个 Ollama 后端：客户端 + 在途计数 + 延迟滑动平均 + 健康状态"""
+
+    def __init__(self, base_url: str, max_inflight: int, client_kwargs: Optional[Dict] = None,
+                 async_client_kwargs: Optional[Dict] = None, ewma_alpha: float = 0.2,
+                 max_waiting: Optional[int] = None):
+        """
+        :param base_url: 后端地址
+        :param max_inflight: 该后端同时在途请求上限
+        :param client_kwargs: 传给同步 httpx 客户端的参数（连接池 limits、timeout 等）
+        :param async_client_kwargs: 传给异步 httpx 客户端的参数
+        :param ewma_alpha: 延迟滑动平均系数，越大越偏向最近的样本
+        :param max_waiting: 该后端最大排队数，为空不限
+        """
+        self.base_url = base_url.rstrip("/")
+        self.client = Client(host=self.base_url, **(client_kwargs or {}))
+        self.async_client = AsyncClient(host=self.base_url, **(async_client_kwargs or client_kwargs or {}))
+        self.limiter = InflightLimiter(max_inflight, max_waiting)
+        self.ewma_alpha = ewma_alpha
+        # 已分配到该后端的请求数（排队 + 执行中），用于最少负载选择
+        self.assigned = 0
+        self.latency_ewma: Optional[float] = None
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def record_success(self, latency: float):
+        """记录一次成功请求的首包延迟"""
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.latency_ewma
+        self.consecutive_failures = 0
+
+    def eject(self, eject_seconds: float):
+        """摘除后端：连续失败次数越多，冷却时间越长（上限 8 倍）"""
+        self.consecutive_failures += 1
+        self.healthy = False
+        backoff = min(2 ** (self.consecutive_failures - 1), 8)
+        self.ejected_until = time.monotonic() + eject_seconds * backoff
+
+    def readmit(self):
+        self.healthy = True
+        self.ejected_until = 0.0
+
+    def probe(self, timeout: float) -> bool:
+        """同步健康检查：GET /api/version"""
+        try:
+            return httpx.get(f"{self.base_url}/api/version", timeout=timeout).status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    async def aprobe(self, timeout: float) -> bool:
+        """异步健康检查：GET /api/version"""
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                return (await client.get(f"{self.base_url}/api/version")).status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def stats(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "assigned": self.assigned,
+            "inflight": self.limiter.inflight,
+            "waiting": self.limiter.waiting,
+            "latency_ewma": self.latency_ewma,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+        }
+
+
+class OllamaRouter:
+    """
+    多后端路由器
+    - 最少负载：按 (已分配请求数 + 1) × 首包延迟滑动平均 选择健康后端
+    - 故障摘除：后端故障时摘除并冷却，冷却结束后先健康检查再重新加入
+    - 会话粘滞（可选）：同一 session_id 固定路由到同一后端，保持服务端 KV cache 命中
+    """
+
+    def __init__(self, base_urls: List[str], max_inflight: int, client_kwargs: Optional[Dict] = None,
+                 async_client_kwargs: Optional[Dict] = None, sticky_sessions: bool = False,
+                 eject_seconds: float = 30.0, ewma_alpha: float = 0.2, probe_timeout: float = 2.0,
+                 max_sticky_sessions: int = 10000, max_waiting: Optional[int] = None):
+        if not base_urls:
+            raise ValueError("至少需要配置一个 Ollama 后端")
+        self.backends = [
+            OllamaBackend(url, max_inflight, client_kwargs, async_client_kwargs, ewma_alpha, max_waiting)
+            for url in dict.fromkeys(base_urls)
+        ]
+        self.sticky_sessions = sticky_sessions
+        self.eject_seconds = eject_seconds
+        self.probe_timeout = probe_timeout
+        self.max_sticky_sessions = max_sticky_sessions
+        self._sticky: "OrderedDict[str, OllamaBackend]" = OrderedDict()
+        # 轮转起点：得分相同的后端从这里开始依次轮流，不总是落到列表中的第一个
+        self._rotation = 0
+        self._lock = threading.Lock()
+
+    # ========== 选择后端 ==========
+    def _due_for_probe(self) -> List[OllamaBackend]:
+        """取出冷却结束、需要健康检查的后端，并占位避免并发请求重复探测"""
+        now = time.monotonic()
+        with self._lock:
+            due = [b for b in self.backends if not b.healthy and b.ejected_until <= now]
+            for backend in due:
+                backend.ejected_until = now + self.probe_timeout
+        return due
+
+    def _settle_probe(self, backend: OllamaBackend, ok: bool):
+        with self._lock:
+            if ok:
+                backend.readmit()
+                print(f"✅ Ollama 后端 {backend.base_url} 健康检查通过，重新加入路由")
+            else:
+                backend.eject(self.eject_seconds)
+
+    def _choose(self, session_id: Optional[str], exclude: tuple) -> OllamaBackend:
+        """在锁内选择后端并登记分配（调用方负责 release）"""
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in exclude]
+            if not candidates:
+                raise Exception("所有 Ollama 后端均不可用（已摘除或本次请求已失败）")
+
+            if self.sticky_sessions and session_id:
+                backend = self._sticky.get(session_id)
+                if backend in candidates:
+                    self._sticky.move_to_end(session_id)
+                    backend.assigned += 1
+                    return backend
+
+            # 还没有延迟样本且空闲的后端优先分到一个请求，先取得样本再参与按延迟选择
+            unsampled = [b for b in candidates if b.latency_ewma is None and b.assigned == 0]
+            if unsampled:
+                candidates = unsampled
+            known = [b.latency_ewma for b in candidates if b.latency_ewma is not None]
+            # 尚无延迟样本的后端按已知平均值估算，保证新后端也能分到流量
+            default_latency = sum(known) / len(known) if known else 1.0
+            order = {b: (i - self._rotation) % len(self.backends) for i, b in enumerate(self.backends)}
+            self._rotation += 1
+            backend = min(
+                candidates,
+                key=lambda b: ((b.assigned + 1) * (b.latency_ewma or default_latency), b.assigned, order[b]),
+            )
+            if self.sticky_sessions and session_id:
+                self._sticky[session_id] = backend
+                self._sticky.move_to_end(session_id)
+                while len(self._sticky) > self.max_sticky_sessions:
+                    self._sticky.popitem(last=False)
+            backend.assigned += 1
+            return backend
+
+    def acquire(self, session_id: Optional[str] = None, exclude: tuple = ()) -> OllamaBackend:
+        """同步选择后端（冷却结束的后端先做健康检查）"""
+        for backend in self._due_for_probe():
+            self._settle_probe(backend, backend.probe(self.probe_timeout))
+        return self._choose(session_id, exclude)
+
+    async def aacquire(self, session_id: Optional[str] = None, exclude: tuple = ()) -> OllamaBackend:
+        """异步选择后端（健康检查不阻塞事件循环）"""
+        for backend in self._due_for_probe():
+            self._settle_probe(backend, await backend.aprobe(self.probe_timeout))
+        return self._choose(session_id, exclude)
+
+    # ========== 请求结果回报 ==========
+    def release(self, backend: OllamaBackend, latency: Optional[float] = None,
+                error: Optional[BaseException] = None):
+        """
+        请求结束后回报结果
+        :param latency: 首包延迟（成功时）
+        :param error: 异常（失败时），后端故障会触发摘除
+        """
+        with self._lock:
+            backend.assigned -= 1
+            backend.total_requests += 1
+            if error is not None and is_backend_failure(error):
+                backend.total_failures += 1
+                if not backend.healthy:
+                    # 同一后端的其它在途请求随后失败，不重复累加冷却时间
+                    return
+                backend.eject(self.eject_seconds)
+                print(f"❌ Ollama 后端 {backend.base_url} 请求失败，暂时摘除：{str(error)}")
+                for session_id in [s for s, b in self._sticky.items() if b is backend]:
+                    del self._sticky[session_id]
+            elif latency is not None:
+                backend.record_success(latency)
+
+    def probe_all(self):
+        """主动检查所有已摘除且冷却结束的后端（可由定时任务调用）"""
+        for backend in self._due_for_probe():
+            self._settle_probe(backend, backend.probe(self.probe_timeout))
+
+    @property
+    def inflight(self) -> int:
+        return sum(b.limiter.inflight for b in self.backends)
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [b.stats() for b in self.backends]
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Mapping, Optional, Tuple
+
+
+class LeaderAbandonedError(Exception):
+    """领头请求在输出完成前被调用方提前关闭，跟随请求需自行发起调用"""
+
+
+def request_key(chat_params: Mapping[str, Any]) -> str:
+    """按最终发往 Ollama 的请求参数生成合并键（参数完全相同才合并）"""
+    raw = json.dumps(chat_params, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(chat_params: Mapping[str, Any]) -> bool:
+    """
+    请求的输出是否可复现（temperature 为 0 或指定了 seed）：只有这类请求才能合并，
+    采样请求各自调用本应得到不同的回复，合并后所有调用方会拿到同一条
+    """
+    options = chat_params.get("options") or {}
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+
+class SharedStream:
+    """一次上游调用的输出广播：领头请求逐块写入，跟随请求按序读取（支持线程与协程）"""
+
+    def __init__(self):
+        self.parts: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _notify(self):
+        """唤醒所有等待者（调用方需持有锁）"""
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+            except RuntimeError:
+                pass
+        self._async_waiters.clear()
+
+    def publish(self, part: Any):
+        with self._cond:
+            self.parts.append(part)
+            self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._notify()
+
+    def iter_parts(self) -> Iterator[Any]:
+        """同步读取：阻塞等待领头请求的后续输出"""
+        idx = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: idx < len(self.parts) or self.done)
+                if idx < len(self.parts):
+                    part = self.parts[idx]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            idx += 1
+            yield part
+
+    async def aiter_parts(self) -> AsyncIterator[Any]:
+        """异步读取：等待期间不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        idx = 0
+        while True:
+            future = None
+            with self._cond:
+                if idx < len(self.parts):
+                    part = self.parts[idx]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    future = loop.create_future()
+                    self._async_waiters.append((loop, future))
+            if future is not None:
+                await future
+                continue
+            idx += 1
+            yield part
+
+
+class RequestCoalescer:
+    """
+    相同请求合并：同一时刻参数完全相同的请求只发一次上游调用
+    第一个到达的为领头请求，其余请求共享领头请求的输出流（流式/非流式均可）
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, SharedStream] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key: str) -> Tuple[SharedStream, bool]:
+        """加入合并组，返回 (共享输出流, 是否为领头请求)"""
+        with self._lock:
+            stream = self._inflight.get(key)
+            if stream is not None:
+                self.followers += 1
+                return stream, False
+            stream = SharedStream()
+            self._inflight[key] = stream
+            self.leaders += 1
+            return stream, True
+
+    def leave(self, key: str, stream: SharedStream):
+        """领头请求结束后移出合并组，之后的相同请求重新发起上游调用"""
+        with self._lock:
+            if self._inflight.get(key) is stream:
+                del self._inflight[key]
+
+    def stats(self) -> Dict:
+        return {"leaders": self.leaders, "followers": self.followers, "inflight_groups": len(self._inflight)}
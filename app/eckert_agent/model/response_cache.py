@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGenerationChunk
+
+from app.eckert_agent.memory.pg_pool import PG_CONN_PARAMS, pooled_connection
+
+
+def _normalize_content(content: Any) -> Any:
+    """规范化消息内容：字符串折叠空白，多模态内容保持结构"""
+    if isinstance(content, str):
+        return " ".join(content.split())
+    return content
+
+
+def normalize_messages(messages: List[BaseMessage]) -> List[Dict]:
+    """把消息列表规范化为可哈希的结构（角色 + 内容 + 工具调用）"""
+    normalized = []
+    for msg in messages:
+        item = {"role": msg.type, "content": _normalize_content(msg.content)}
+        if getattr(msg, "tool_calls", None):
+            item["tool_calls"] = [{"name": tc["name"], "args": tc["args"]} for tc in msg.tool_calls]
+        if getattr(msg, "tool_call_id", None):
+            item["tool_call_id"] = msg.tool_call_id
+        normalized.append(item)
+    return normalized
+
+
+def make_cache_key(messages: List[BaseMessage], model: str, temperature: Optional[float],
+                   extra: Optional[Dict] = None) -> str:
+    """
+    生成缓存键：规范化消息列表 + 模型名 + 温度（+ 绑定的工具、输出格式等调用参数）
+    :return: sha256 十六进制字符串
+    """
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": normalize_messages(messages),
+        "extra": extra or {},
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def fresh_copy(message: AIMessage) -> AIMessage:
+    """
+    缓存消息的独立副本（深拷贝、清空 id）：写入和命中各复制一次，
+    LangChain 给每次调用的消息写入 run id、调用方修改消息都不会影响缓存和其他命中者
+    """
+    return message.model_copy(update={"id": None}, deep=True)
+
+
+def replay_as_stream(message: AIMessage, chunk_size: int = 16) -> Iterator[ChatGenerationChunk]:
+    """把缓存的完整回复切成小块，按流式接口的形式重新输出（工具调用放在最后一块）"""
+    content = message.content if isinstance(message.content, str) else ""
+    pieces = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)] or [""]
+    for idx, piece in enumerate(pieces):
+        last = idx == len(pieces) - 1
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=piece,
+                tool_calls=message.tool_calls if last else [],
+                usage_metadata=message.usage_metadata if last else None,
+                additional_kwargs=message.additional_kwargs if last else {},
+            ),
+            generation_info={"cache_hit": True} if last else None,
+        )
+
+
+class LRUResponseCache:
+    """进程内 LRU 缓存（条数上限 + TTL，线程安全）"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        """
+        :param max_entries: 最大缓存条数，超出淘汰最久未使用的
+        :param ttl: 过期时间（秒），<=0 表示不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            message, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return message
+
+    def put(self, key: str, message: AIMessage):
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0
+        with self._lock:
+            self._data[key] = (message, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class PostgresResponseCache:
+    """PostgreSQL 持久化缓存（跨进程、重启后仍有效；TTL + 行数上限）"""
+
+    def __init__(self, ttl: float = 86400, max_rows: int = 100000, evict_every: int = 100):
+        """
+        :param ttl: 过期时间（秒）
+        :param max_rows: 最大行数，超出后删除最早写入的行
+        :param evict_every: 每写入多少次执行一次过期/超量清理
+        """
+        self.conn_params = PG_CONN_PARAMS
+        self.table_name = "llm_response_cache"
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.evict_every = evict_every
+        self._writes = 0
+        self._init_table()
+
+    def _get_connection(self):
+        """从共享连接池借出连接（内部方法，with 退出时提交并归还）"""
+        return pooled_connection("LLM 响应缓存")
+
+    def _init_table(self):
+        create_sql = f"""
+        CREATE TABLE IF NOT EXISTS {self.table_name} (
+            cache_key CHAR(64) PRIMARY KEY,
+            model VARCHAR(100) NOT NULL,
+            response JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_{self.table_name}_created_at ON {self.table_name} (created_at);
+        """
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(create_sql)
+            conn.commit()
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT response FROM {self.table_name} WHERE cache_key = %s AND expires_at > now()",
+                    (key,)
+                )
+                row = cur.fetchone()
+        if row is None:
+            return None
+        return messages_from_dict([row[0]])[0]
+
+    def put(self, key: str, message: AIMessage, model: str = ""):
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    INSERT INTO {self.table_name} (cache_key, model, response, expires_at)
+                    VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+                    ON CONFLICT (cache_key) DO UPDATE
+                        SET response = EXCLUDED.response,
+                            created_at = now(),
+                            expires_at = EXCLUDED.expires_at
+                    """,
+                    (key, model, json.dumps(message_to_dict(message), ensure_ascii=False), self.ttl)
+                )
+                self._writes += 1
+                if self._writes % self.evict_every == 0:
+                    self._evict(cur)
+            conn.commit()
+
+    def _evict(self, cur):
+        """清理过期行与超出行数上限的最早行"""
+        cur.execute(f"DELETE FROM {self.table_name} WHERE expires_at <= now()")
+        cur.execute(
+            f"""
+            DELETE FROM {self.table_name}
+            WHERE created_at < (SELECT created_at FROM {self.table_name}
+                                ORDER BY created_at DESC OFFSET %s LIMIT 1)
+            """,
+            (self.max_rows - 1,)
+        )
+
+    def clear(self):
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {self.table_name}")
+            conn.commit()
+
+
+class ResponseCache:
+    """两级响应缓存：进程内 LRU（L1）+ 可选 PostgreSQL（L2），附命中统计"""
+
+    def __init__(self, local: LRUResponseCache, persistent: Optional[PostgresResponseCache] = None):
+        self.local = local
+        self.persistent = persistent
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        """命中时返回缓存消息的副本（id 为空，由本次调用重新分配），未命中返回 None"""
+        message = self._lookup(key)
+        return None if message is None else fresh_copy(message)
+
+    def _lookup(self, key: str) -> Optional[AIMessage]:
+        message = self.local.get(key)
+        if message is not None:
+            self._count("hits")
+            return message
+        if self.persistent is not None:
+            try:
+                message = self.persistent.get(key)
+            except Exception as e:
+                # L2 故障不影响正常调用，只当作未命中
+                print(f"❌ LLM 响应缓存读取失败：{str(e)}")
+                message = None
+            if message is not None:
+                self.local.put(key, message)
+                self._count("persistent_hits")
+                return message
+        self._count("misses")
+        return None
+
+    def put(self, key: str, message: AIMessage, model: str = ""):
+        message = fresh_copy(message)
+        self.local.put(key, message)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, message, model)
+            except Exception as e:
+                print(f"❌ LLM 响应缓存写入失败：{str(e)}")
+
+    async def aget(self, key: str) -> Optional[AIMessage]:
+        """异步读取：L1 直接读，L2 放到线程池，避免阻塞事件循环"""
+        if self.persistent is None:
+            return self.get(key)
+        message = self.local.get(key)
+        if message is not None:
+            self._count("hits")
+            return fresh_copy(message)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, message: AIMessage, model: str = ""):
+        if self.persistent is None:
+            return self.put(key, message, model)
+        await asyncio.to_thread(self.put, key, message, model)
+
+    def clear(self):
+        self.local.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> Dict:
+        """命中统计：hits 为 L1 命中，persistent_hits 为 L2 命中"""
+        total = self.hits + self.persistent_hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.persistent_hits) / total if total else 0.0,
+            "local_size": len(self.local),
+        }
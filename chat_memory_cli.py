@@ -0,0 +1,58 @@
+"""
+会话历史批量导入/导出（COPY 流式，适合数据回填、分析导出、压测造数）
+导出：python chat_memory_cli.py export --format ndjson --output history.ndjson [--session s1 --session s2] [--since 2025-01-01]
+导入：python chat_memory_cli.py import --format csv --input history.csv
+--output / --input 省略或为 - 时使用标准输出/标准输入
+索引迁移（一次性，CONCURRENTLY 在线建索引）：python chat_memory_cli.py migrate-indexes
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from app.eckert_agent.memory.chat_memory import ChatMemory, migrate_indexes
+from app.eckert_agent.memory.chat_memory_io import TRANSFER_FORMATS, export_sessions, import_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话历史批量导入/导出")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="导出会话历史")
+    export_parser.add_argument("--format", choices=TRANSFER_FORMATS, default="ndjson")
+    export_parser.add_argument("--output", default="-", help="输出文件，- 表示标准输出")
+    export_parser.add_argument("--session", action="append", dest="sessions", help="只导出指定会话，可重复")
+    export_parser.add_argument("--since", type=datetime.fromisoformat, help="created_at 起始时间（含）")
+    export_parser.add_argument("--until", type=datetime.fromisoformat, help="created_at 截止时间（不含）")
+
+    import_parser = sub.add_parser("import", help="导入会话历史")
+    import_parser.add_argument("--format", choices=TRANSFER_FORMATS, default="ndjson")
+    import_parser.add_argument("--input", default="-", help="输入文件，- 表示标准输入")
+
+    sub.add_parser("migrate-indexes", help="在线创建 (session_id, id) 复合索引并删除旧的单列索引")
+
+    args = parser.parse_args()
+    # 确保表已创建
+    ChatMemory()
+
+    if args.command == "migrate-indexes":
+        print(migrate_indexes(), file=sys.stderr)
+    elif args.command == "export":
+        output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            result = export_sessions(output, args.format, args.sessions, args.since, args.until)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        print(f"✅ 导出完成：{result}", file=sys.stderr)
+    else:
+        source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+        try:
+            result = import_sessions(source, args.format)
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+        print(f"✅ 导入完成：{result}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
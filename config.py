@@ -8,6 +8,23 @@ load_dotenv()
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3:4b")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_TEMPERATURE = float(os.getenv("OLLAMA_TEMPERATURE", 0.7))
+# 连接池配置：单后端在途请求上限、keep-alive 连接数与空闲过期时间（秒）、单次请求超时（秒）
+OLLAMA_MAX_INFLIGHT = int(os.getenv("OLLAMA_MAX_INFLIGHT", 8))
+OLLAMA_POOL_MAX_CONNECTIONS = int(os.getenv("OLLAMA_POOL_MAX_CONNECTIONS", 32))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", 60))
+OLLAMA_REQUEST_TIMEOUT = float(os.getenv("OLLAMA_REQUEST_TIMEOUT", 300))
+# 多后端配置：逗号分隔的地址列表，未配置时只使用 OLLAMA_BASE_URL
+OLLAMA_BASE_URLS = [url.strip() for url in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if url.strip()]
+# 同一会话固定路由到同一后端（保持服务端 KV cache 命中）
+OLLAMA_STICKY_SESSIONS = os.getenv("OLLAMA_STICKY_SESSIONS", "false").lower() == "true"
+# 后端故障后的摘除冷却时间（秒），冷却结束后健康检查通过才重新加入
+OLLAMA_EJECT_SECONDS = float(os.getenv("OLLAMA_EJECT_SECONDS", 30))
+OLLAMA_LATENCY_EWMA_ALPHA = float(os.getenv("OLLAMA_LATENCY_EWMA_ALPHA", 0.2))
+# 调度配置：单后端最大排队数（超出快速失败）、默认排队超时（秒，0 表示不限）
+OLLAMA_MAX_WAITING = int(os.getenv("OLLAMA_MAX_WAITING", 256))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", 0))
+# 是否合并相同的在途请求（默认关闭；开启后也只合并 temperature=0 或指定 seed 的请求，采样请求照常各自调用）
+OLLAMA_COALESCE_REQUESTS = os.getenv("OLLAMA_COALESCE_REQUESTS", "false").lower() == "true"
 
 # PostgreSQL 配置
 PG_HOST = os.getenv("PG_HOST", "localhost")
@@ -15,7 +32,128 @@ PG_PORT = os.getenv("PG_PORT", "5432")
 PG_USER = os.getenv("PG_USER", "postgres")
 PG_PASSWORD = os.getenv("PG_PASSWORD","123456")
 PG_DB = os.getenv("PG_DB", "postgres")
+# 连接池配置：最小/最大连接数、空闲回收时间（秒）、连接最长寿命（秒）、取连接等待超时（秒）、取出时是否做健康检查
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", 1))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", 10))
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", 300))
+PG_POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", 3600))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", 30))
+PG_POOL_CHECK = os.getenv("PG_POOL_CHECK", "true").lower() == "true"
 MAX_MEMORY_LEN = int(os.getenv("MAX_MEMORY_LEN", 10))
+# 滚动摘要：未摘要消息超过触发条数时，后台把较早的轮次折叠进摘要行，只保留最近若干条原文
+# 摘要方式：extractive（抽取式，无模型调用）或 llm（用 SUMMARY_MODEL 生成，失败时回退抽取式）
+# 默认关闭：开启后折叠进摘要的原文会从 chat_memory 中删除（由一条摘要行代替，不可恢复），需确认后显式开启
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "false").lower() == "true"
+SUMMARY_METHOD = os.getenv("SUMMARY_METHOD", "extractive")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", OLLAMA_MODEL)
+SUMMARY_TRIGGER_LEN = int(os.getenv("SUMMARY_TRIGGER_LEN", MAX_MEMORY_LEN * 2))
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", MAX_MEMORY_LEN))
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", 1200))
+# 会话历史缓存：进程内 LRU，写入时同步更新，会话数上限、总字节数上限、有效期（秒）
+HISTORY_CACHE_ENABLED = os.getenv("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", 1024))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", 300))
+# 异步落库（write-behind）：对话先进入有界内存队列，后台按批量大小或时间间隔（秒）合并写入
+# 队列满时的策略：block（阻塞等待，超过 WRITE_BEHIND_BLOCK_TIMEOUT 秒报错，0 表示一直等）或 fail（立即报错）
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", 1000))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 50))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 0.2))
+WRITE_BEHIND_FULL_POLICY = os.getenv("WRITE_BEHIND_FULL_POLICY", "block")
+WRITE_BEHIND_BLOCK_TIMEOUT = float(os.getenv("WRITE_BEHIND_BLOCK_TIMEOUT", 5))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", 3))
+# chat_memory 分区：none（不分区）、monthly（按 created_at 月度范围分区）、hash（按 session_id 哈希分区）
+# 月度分区提前创建的月数、保留的月数（0 表示不清理，超期分区整体删除）、后台维护间隔（秒）
+CHAT_MEMORY_PARTITIONING = os.getenv("CHAT_MEMORY_PARTITIONING", "none")
+CHAT_MEMORY_HASH_PARTITIONS = int(os.getenv("CHAT_MEMORY_HASH_PARTITIONS", 16))
+CHAT_MEMORY_PREMAKE_MONTHS = int(os.getenv("CHAT_MEMORY_PREMAKE_MONTHS", 2))
+CHAT_MEMORY_RETENTION_MONTHS = int(os.getenv("CHAT_MEMORY_RETENTION_MONTHS", 12))
+CHAT_MEMORY_MAINTENANCE_INTERVAL = float(os.getenv("CHAT_MEMORY_MAINTENANCE_INTERVAL", 3600))
+# LangGraph 检查点：开启后图编译时挂载 PostgreSQL 检查点存储（独立连接池），按 thread_id 持久化图状态
+CHECKPOINTER_ENABLED = os.getenv("CHECKPOINTER_ENABLED", "false").lower() == "true"
+# 对话权威来源（每轮只写一次、读一次）：checkpoint（检查点权威，历史随检查点恢复，chat_memory 为派生投影）
+# 或 chat_memory（chat_memory 表权威，图不挂载检查点）；默认开启检查点时为 checkpoint
+CONVERSATION_SOURCE = os.getenv("CONVERSATION_SOURCE", "checkpoint" if CHECKPOINTER_ENABLED else "chat_memory")
+# checkpoint 模式下 chat_memory 投影的写入方式：sync（同步写）、async（后台队列批量写）、off（不写）
+CONVERSATION_PROJECTION = os.getenv("CONVERSATION_PROJECTION", "async")
+# 检查点序列化：zstd（msgpack 编码后 zstd 压缩，带格式版本头）或 none（LangGraph 默认）；压缩级别；小于该字节数的数据不压缩
+# 两种格式读取时自动识别，切换配置不影响已有检查点
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "zstd")
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", 3))
+CHECKPOINT_COMPRESS_MIN_BYTES = int(os.getenv("CHECKPOINT_COMPRESS_MIN_BYTES", 512))
+# 检查点两级缓存：进程内 LRU 缓存各 thread 的最新检查点（thread 数、序列化字节数上限、有效期秒），写穿到 PostgreSQL
+# CHECKPOINT_CACHE_WRITE_ASYNC=true 时后台线程写库（最多排队 CHECKPOINT_CACHE_MAX_PENDING 个写操作），进程崩溃可能丢失最近几步
+CHECKPOINT_CACHE_ENABLED = os.getenv("CHECKPOINT_CACHE_ENABLED", "false").lower() == "true"
+CHECKPOINT_CACHE_MAX_THREADS = int(os.getenv("CHECKPOINT_CACHE_MAX_THREADS", 256))
+CHECKPOINT_CACHE_MAX_BYTES = int(os.getenv("CHECKPOINT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CHECKPOINT_CACHE_TTL = float(os.getenv("CHECKPOINT_CACHE_TTL", 300))
+CHECKPOINT_CACHE_WRITE_ASYNC = os.getenv("CHECKPOINT_CACHE_WRITE_ASYNC", "false").lower() == "true"
+CHECKPOINT_CACHE_MAX_PENDING = int(os.getenv("CHECKPOINT_CACHE_MAX_PENDING", 1000))
+# 检查点清理：每个 thread 保留最近 N 个检查点，或保留最近若干秒内的检查点（两者满足其一即保留，0 表示不按该条件保留）
+# 后台每隔 CHECKPOINT_PRUNE_INTERVAL 秒处理一批（CHECKPOINT_PRUNE_BATCH 个 thread），轮流覆盖全部 thread
+CHECKPOINT_PRUNE_ENABLED = os.getenv("CHECKPOINT_PRUNE_ENABLED", "false").lower() == "true"
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", 20))
+CHECKPOINT_KEEP_SECONDS = float(os.getenv("CHECKPOINT_KEEP_SECONDS", 0))
+CHECKPOINT_PRUNE_BATCH = int(os.getenv("CHECKPOINT_PRUNE_BATCH", 100))
+CHECKPOINT_PRUNE_INTERVAL = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL", 60))
+
+# 知识库全文检索：文本搜索配置（chinese 需要 zhparser 扩展，数据库中不存在时回退 simple 并提示）
+# 标题、关键词、正文分别以 A/B/C 权重写入生成列 search_vector，排序时的权重如下
+KNOWLEDGE_TS_CONFIG = os.getenv("KNOWLEDGE_TS_CONFIG", "chinese")
+KNOWLEDGE_WEIGHT_TITLE = float(os.getenv("KNOWLEDGE_WEIGHT_TITLE", 1.0))
+KNOWLEDGE_WEIGHT_KEYWORDS = float(os.getenv("KNOWLEDGE_WEIGHT_KEYWORDS", 0.4))
+KNOWLEDGE_WEIGHT_CONTENT = float(os.getenv("KNOWLEDGE_WEIGHT_CONTENT", 0.2))
+# 知识库检索方式：hybrid（进程内 BM25 + 向量检索，倒数排名融合）、vector（进程内向量检索，可回答换一种说法的问题）
+# 或 fulltext（PostgreSQL 全文检索，中文需要 zhparser）
+# 默认 fulltext：hybrid/vector 在每个进程首次检索时加载全表（导入时已存储的向量直接读取，缺失的现算并回写，需要嵌入服务）
+KNOWLEDGE_SEARCH_MODE = os.getenv("KNOWLEDGE_SEARCH_MODE", "fulltext")
+# 混合检索：BM25 参数 k1、b；倒数排名融合常数 k（越大越平滑）；每一路召回参与融合的候选数
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+RRF_K = int(os.getenv("RRF_K", 60))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 50))
+# 向量嵌入：ollama（Ollama 嵌入接口，EMBEDDING_MODEL 指定模型）或 hashing（本地确定性哈希嵌入，离线可用，维度 EMBEDDING_DIM）
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "ollama")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "bge-m3")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 256))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+# 向量索引：flat（暴力检索，精确）、ivf（倒排聚类近似检索）或 auto（向量数达到 VECTOR_IVF_MIN_SIZE 时建 IVF）
+# IVF 聚类数（0 表示按 4 * sqrt(向量数) 自动取值）与每次查询探测的聚类数（越大召回越高、越慢）
+VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "auto")
+VECTOR_IVF_MIN_SIZE = int(os.getenv("VECTOR_IVF_MIN_SIZE", 50000))
+VECTOR_IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", 0))
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", 16))
+# 知识库批量导入：markdown 按标题切片，单个切片的最大字符数（超出时按段落继续切分）、每批写入的切片数
+KNOWLEDGE_CHUNK_MAX_CHARS = int(os.getenv("KNOWLEDGE_CHUNK_MAX_CHARS", 1200))
+KNOWLEDGE_INGEST_BATCH = int(os.getenv("KNOWLEDGE_INGEST_BATCH", 500))
+# 知识库检索结果缓存：进程内 LRU（条数 + TTL 秒），可选 PostgreSQL 共享层（多进程共用，TTL 秒 + 最大行数）
+# 缓存键含知识库版本号（写入/导入时递增）；其他进程的写入最多 KNOWLEDGE_CACHE_VERSION_CHECK 秒后可见
+KNOWLEDGE_CACHE_ENABLED = os.getenv("KNOWLEDGE_CACHE_ENABLED", "true").lower() == "true"
+KNOWLEDGE_CACHE_MAX_ENTRIES = int(os.getenv("KNOWLEDGE_CACHE_MAX_ENTRIES", 2048))
+KNOWLEDGE_CACHE_TTL = float(os.getenv("KNOWLEDGE_CACHE_TTL", 600))
+KNOWLEDGE_CACHE_VERSION_CHECK = float(os.getenv("KNOWLEDGE_CACHE_VERSION_CHECK", 1.0))
+KNOWLEDGE_CACHE_PG_ENABLED = os.getenv("KNOWLEDGE_CACHE_PG_ENABLED", "false").lower() == "true"
+KNOWLEDGE_CACHE_PG_TTL = float(os.getenv("KNOWLEDGE_CACHE_PG_TTL", 3600))
+KNOWLEDGE_CACHE_PG_MAX_ROWS = int(os.getenv("KNOWLEDGE_CACHE_PG_MAX_ROWS", 50000))
+# 知识库索引文件目录：进程内检索索引（向量矩阵、BM25 倒排表、文档表）的磁盘快照 {表名}.idx，进程启动时直接 mmap，
+# 多个 worker 共享页缓存；为空时每个进程从数据库重建。重建：python knowledge_cli.py build-index
+# 运行中的进程每 KNOWLEDGE_INDEX_CHECK_INTERVAL 秒检查一次文件，重建完成后自动切换到新文件
+KNOWLEDGE_INDEX_DIR = os.getenv("KNOWLEDGE_INDEX_DIR", "")
+KNOWLEDGE_INDEX_CHECK_INTERVAL = float(os.getenv("KNOWLEDGE_INDEX_CHECK_INTERVAL", 5))
+
+# LLM 响应缓存配置：进程内 LRU（条数 + TTL 秒），可选 PostgreSQL 持久层（TTL 秒 + 最大行数）
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 3600))
+LLM_CACHE_PG_ENABLED = os.getenv("LLM_CACHE_PG_ENABLED", "false").lower() == "true"
+LLM_CACHE_PG_TTL = float(os.getenv("LLM_CACHE_PG_TTL", 86400))
+LLM_CACHE_PG_MAX_ROWS = int(os.getenv("LLM_CACHE_PG_MAX_ROWS", 100000))
 
 # 会话配置
-DEFAULT_SESSION_ID = os.getenv("DEFAULT_SESSION_ID", "default_session")
\ No newline at end of file
+DEFAULT_SESSION_ID = os.getenv("DEFAULT_SESSION_ID", "default_session")
+# 上下文窗口：模型上下文 token 上限与预留给输出的 token 数，历史按剩余预算从新到旧填充
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 4096))
+CONTEXT_RESERVE_TOKENS = int(os.getenv("CONTEXT_RESERVE_TOKENS", 1024))
+# 调试用：每轮回复后打印上下文预算报告（历史/知识库 token 数、丢弃条数、prefill 耗时），默认关闭
+CONTEXT_REPORT_DEBUG = os.getenv("CONTEXT_REPORT_DEBUG", "false").lower() == "true"
@@ -0,0 +1,53 @@
+"""
+知识库批量导入与检索（markdown 按标题切片、内容去重、增量导入）
+导入：python knowledge_cli.py ingest app/eckert_agent/skills [--prune] [--max-chars 1200] [--embed/--no-embed]
+检索：python knowledge_cli.py search "REST 分页怎么设计" [--top-k 3]
+生成索引文件（进程内检索索引的 mmap 快照，需配置 KNOWLEDGE_INDEX_DIR 或指定 --output）：
+python knowledge_cli.py build-index [--output data/knowledge_base.idx]，导入时也可加 --build-index
+老表迁移（补检索列与索引，启动时不再执行这些 DDL）：python knowledge_cli.py migrate
+"""
+import argparse
+
+from config import KNOWLEDGE_CHUNK_MAX_CHARS
+from app.eckert_agent.memory.knowledge_ingest import KnowledgeIngestor
+from app.eckert_agent.memory.knowledge_retriever import KnowledgeRetriever
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库批量导入与检索")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = sub.add_parser("ingest", help="导入目录下的 markdown 文件（未变化的文件跳过）")
+    ingest_parser.add_argument("root", help="要导入的目录")
+    ingest_parser.add_argument("--max-chars", type=int, default=KNOWLEDGE_CHUNK_MAX_CHARS, help="单个切片的最大字符数")
+    ingest_parser.add_argument("--prune", action="store_true", help="删除目录中已不存在的文件的切片")
+    ingest_parser.add_argument("--build-index", action="store_true", help="导入后重建索引文件")
+    ingest_parser.add_argument("--embed", action=argparse.BooleanOptionalAction, default=None,
+                               help="导入时嵌入并存储向量（默认按 KNOWLEDGE_SEARCH_MODE：hybrid/vector 嵌入，fulltext 不嵌入）")
+
+    search_parser = sub.add_parser("search", help="检索知识库")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--top-k", type=int, default=3)
+
+    build_parser = sub.add_parser("build-index", help="从数据库重建进程内检索索引并写成索引文件（原子替换）")
+    build_parser.add_argument("--output", help="索引文件路径，默认为 KNOWLEDGE_INDEX_DIR 下的 {表名}.idx")
+
+    sub.add_parser("migrate", help="老表补 search_vector/source/content_hash/embedding 列，CONCURRENTLY 创建索引")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        print(KnowledgeRetriever().migrate())
+    elif args.command == "ingest":
+        result = KnowledgeIngestor(max_chars=args.max_chars, embed=args.embed).ingest_directory(args.root, prune=args.prune)
+        print(f"✅ 导入完成：{result}")
+        if args.build_index:
+            print(f"✅ 索引文件已生成：{KnowledgeRetriever().build_index_file()}")
+    elif args.command == "build-index":
+        print(f"✅ 索引文件已生成：{KnowledgeRetriever().build_index_file(args.output)}")
+    else:
+        for i, res in enumerate(KnowledgeRetriever().search_knowledge(args.query, args.top_k), 1):
+            print(f"{i}. [{res['rank']:.4f}] {res['title']}\n{res['content']}\n")
+
+
+if __name__ == "__main__":
+    main()
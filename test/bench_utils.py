@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+压测/检查脚本共用的小工具（脚本直接运行时 test/ 在 sys.path 上：from bench_utils import percentile）
+"""
+
+
+def percentile(samples, pct: float) -> float:
+    """样本的近似分位数（pct 取 0~1，最近秩法）"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+ChatMemory 读写压测（改造前 vs 改造后，都使用共享连接池）
+1. 单轮写入：两次 save_message（INSERT + NOT IN 裁剪，各自一个事务） vs 一次 save_turn
+2. 历史读取：全量读取整个会话 vs 按 (session_id, id DESC) 索引只读最新 N 条，会话越长差距越大
+3. 热点会话连续对话（读历史 + 写一轮）：无缓存 vs 写穿会话缓存，统计实际借出的数据库连接次数
+4. 调用方感知的单轮保存延迟：同步 save_turn vs 异步落库 save_turn(defer=True)（含最终 flush 总耗时）
+运行：PYTHONPATH=. python test/chat_memory_bench.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+import time
+import uuid
+
+from app.eckert_agent.memory.chat_memory import ChatMemory
+from app.eckert_agent.memory.pg_pool import get_pool, pool_stats
+from app.eckert_agent.memory.session_cache import SessionHistoryCache
+from app.eckert_agent.memory.write_behind import WriteBehindQueue
+from bench_utils import percentile
+
+# ===================== 1. 压测参数 =====================
+TURNS = 500
+SESSION_SIZES = [100, 1000, 10000, 50000]
+READS = 200
+SESSION_PREFIX = "chat_memory_bench_"
+
+
+class LegacyChatMemory(ChatMemory):
+    """改造前的写入方式：每条消息单独 INSERT，再用 NOT IN 子查询裁剪"""
+
+    def save_message(self, session_id: str, role: str, content: str):
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO chat_memory (session_id, role, content) VALUES (%s, %s, %s)",
+                    (session_id, role, content)
+                )
+                cur.execute(
+                    """
+                    DELETE
+                    FROM chat_memory
+                    WHERE session_id = %s
+                      AND id NOT IN (SELECT id
+                                     FROM chat_memory
+                                     WHERE session_id = %s
+                                     ORDER BY created_at DESC
+                        LIMIT %s
+                        )
+                    """,
+                    (session_id, session_id, self.max_memory_len)
+                )
+            conn.commit()
+
+    def save_turn(self, session_id: str, user_input: str, assistant_response: str):
+        self.save_message(session_id, "user", user_input)
+        self.save_message(session_id, "assistant", assistant_response)
+
+    def get_history(self, session_id: str, limit=None, before_id=None):
+        """改造前的读取方式：无 LIMIT 读取整个会话"""
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT role, content FROM chat_memory WHERE session_id = %s ORDER BY created_at DESC",
+                    (session_id,)
+                )
+                return cur.fetchall()
+
+
+def bench_turns(memory: ChatMemory):
+    session_id = f"{SESSION_PREFIX}{uuid.uuid4().hex[:8]}"
+    latencies = []
+    for i in range(TURNS):
+        start = time.perf_counter()
+        memory.save_turn(session_id, f"第 {i} 个问题", f"第 {i} 个回答")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def fill_session(memory: ChatMemory, size: int) -> str:
+    """直接批量插入指定条数的历史（不裁剪）"""
+    session_id = f"{SESSION_PREFIX}{uuid.uuid4().hex[:8]}"
+    with memory._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO chat_memory (session_id, role, content)
+                SELECT %s, CASE WHEN i %% 2 = 0 THEN 'user' ELSE 'assistant' END, '历史消息 ' || i
+                FROM generate_series(1, %s) AS i
+                """,
+                (session_id, size)
+            )
+            cur.execute("ANALYZE chat_memory")
+        conn.commit()
+    return session_id
+
+
+def bench_reads(memory: ChatMemory, session_id: str):
+    latencies = []
+    for _ in range(READS):
+        start = time.perf_counter()
+        memory.get_history(session_id)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def cleanup(memory: ChatMemory):
+    with memory._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM chat_memory WHERE session_id LIKE %s", (f"{SESSION_PREFIX}%",))
+        conn.commit()
+
+
+def main():
+    memory = ChatMemory()
+    memory._init_table()
+    legacy = LegacyChatMemory()
+    # 只测裁剪写入路径与数据库读取，不触发后台摘要、不经过会话缓存
+    memory.summarizer = None
+    legacy.summarizer = None
+    memory.history_cache = None
+    legacy.history_cache = None
+    get_pool().wait()
+
+    print(f"{'mode':<22}{'turns':>7}{'turns/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    try:
+        for name, target in (("2 x save_message", legacy), ("save_turn", memory)):
+            latencies = bench_turns(target)
+            print(f"{name:<22}{len(latencies):>7}{len(latencies) / sum(latencies):>9.0f}"
+                  f"{percentile(latencies, 0.5) * 1000:>9.2f}{percentile(latencies, 0.99) * 1000:>9.2f}")
+
+        print(f"\n{'mode':<22}{'rows':>7}{'reads/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+        for size in SESSION_SIZES:
+            session_id = fill_session(memory, size)
+            for name, target in (("full scan", legacy), (f"latest {memory.history_limit}", memory)):
+                latencies = bench_reads(target, session_id)
+                print(f"{name:<22}{size:>7}{len(latencies) / sum(latencies):>9.0f}"
+                      f"{percentile(latencies, 0.5) * 1000:>9.2f}{percentile(latencies, 0.99) * 1000:>9.2f}")
+
+        print(f"\n{'mode':<22}{'turns':>7}{'turns/s':>9}{'db calls':>10}")
+        for name, history_cache in (("no cache", None), ("write-through cache", SessionHistoryCache())):
+            memory.history_cache = history_cache
+            session_id = f"{SESSION_PREFIX}{uuid.uuid4().hex[:8]}"
+            before = pool_stats().get("requests_num", 0)
+            start = time.perf_counter()
+            for i in range(TURNS):
+                memory.get_history_as_messages(session_id)
+                memory.save_turn(session_id, f"第 {i} 个问题", f"第 {i} 个回答")
+            elapsed = time.perf_counter() - start
+            calls = pool_stats().get("requests_num", 0) - before
+            print(f"{name:<22}{TURNS:>7}{TURNS / elapsed:>9.0f}{calls:>10}")
+        print(f"缓存统计：{memory.history_cache.stats()}")
+
+        print(f"\n{'mode':<22}{'turns':>7}{'p50 ms':>9}{'p99 ms':>9}{'total s':>9}")
+        memory.history_cache = None
+        for name, write_behind in (("sync save_turn", None), ("write-behind", WriteBehindQueue(memory.save_batch))):
+            memory.write_behind = write_behind
+            latencies = []
+            start = time.perf_counter()
+            for i in range(TURNS):
+                session_id = f"{SESSION_PREFIX}wb_{i % 8}"
+                turn_start = time.perf_counter()
+                memory.save_turn(session_id, f"第 {i} 个问题", f"第 {i} 个回答", defer=True)
+                latencies.append(time.perf_counter() - turn_start)
+            memory.flush()
+            total = time.perf_counter() - start
+            print(f"{name:<22}{TURNS:>7}{percentile(latencies, 0.5) * 1000:>9.3f}"
+                  f"{percentile(latencies, 0.99) * 1000:>9.3f}{total:>9.2f}")
+        print(f"异步落库统计：{memory.write_behind.stats()}")
+        memory.write_behind.close()
+    finally:
+        cleanup(memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+chat_memory 月度分区冒烟检查（使用独立的表，不影响 chat_memory）
+1. 普通表写入跨度很大的数据：保留期外、保留期内、当月，以及晚于预建范围的未来时间（时钟偏差/导入）
+2. migrate：行数与 id 不变，未来时间的行落入 DEFAULT 分区，自增 id 接在最大 id 之后
+3. 超出预建范围的写入不会失败（落入 DEFAULT 分区）；启动检查不建分区，维护任务创建对应月分区时这些行自动从 DEFAULT 移出
+4. apply_retention：保留期外的分区先 DETACH 再删除，保留期内的数据不受影响
+运行：PYTHONPATH=. python test/chat_memory_partitions_check.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+from datetime import datetime, timedelta, timezone
+
+from app.eckert_agent.memory.chat_memory_partitions import ChatMemoryPartitionManager
+from app.eckert_agent.memory.pg_pool import pooled_connection
+
+# ===================== 1. 检查参数 =====================
+TABLE_NAME = "chat_memory_partition_check"
+PREMAKE_MONTHS = 2
+RETENTION_MONTHS = 12
+# 各行距今的天数：保留期外、保留期内、当月、晚于预建范围
+AGES_DAYS = (-500, -400, -90, -30, 0, 0, 200)
+
+
+def partition_of(cur, row_id: int) -> str:
+    cur.execute(f"SELECT tableoid::regclass::text FROM {TABLE_NAME} WHERE id = %s", (row_id,))
+    return cur.fetchone()[0]
+
+
+def drop_all(cur):
+    cur.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}, {TABLE_NAME}_legacy CASCADE")
+    cur.execute(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE %s",
+        (TABLE_NAME.replace("_", r"\_") + r"\_p%",)
+    )
+    for (name,) in cur.fetchall():
+        cur.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+def main():
+    manager = ChatMemoryPartitionManager(mode="monthly", premake_months=PREMAKE_MONTHS,
+                                         retention_months=RETENTION_MONTHS, table_name=TABLE_NAME)
+    now = datetime.now(timezone.utc)
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            drop_all(cur)
+            cur.execute(f"""
+                CREATE TABLE {TABLE_NAME} (
+                    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+                    session_id VARCHAR(100) NOT NULL,
+                    role VARCHAR(20) NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            ids = {}
+            for days in AGES_DAYS:
+                cur.execute(f"INSERT INTO {TABLE_NAME} (session_id, role, content, created_at) "
+                            f"VALUES ('s', 'user', %s, %s) RETURNING id", (f"{days} 天", now + timedelta(days=days)))
+                ids.setdefault(days, cur.fetchone()[0])
+        conn.commit()
+
+    try:
+        result = manager.migrate()
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                assert result["rows"] == len(AGES_DAYS)
+                cur.execute(f"SELECT count(*), max(id) FROM {TABLE_NAME}")
+                count, max_id = cur.fetchone()
+                assert count == len(AGES_DAYS), "迁移后行数变化"
+                assert partition_of(cur, ids[200]) == manager.default_partition, "晚于预建范围的行应落入 DEFAULT 分区"
+                assert partition_of(cur, ids[0]) == f"{TABLE_NAME}_p{now:%Y%m}"
+                cur.execute(f"INSERT INTO {TABLE_NAME} (session_id, role, content) VALUES ('s', 'user', '新行') "
+                            f"RETURNING id")
+                assert cur.fetchone()[0] > max_id, "迁移后自增 id 没有接在最大 id 之后"
+                # 维护线程停摆：写入超出预建范围的时间也不会失败
+                cur.execute(f"INSERT INTO {TABLE_NAME} (session_id, role, content, created_at) "
+                            f"VALUES ('s', 'user', '未来', %s) RETURNING id", (now + timedelta(days=120),))
+                future_id = cur.fetchone()[0]
+                assert partition_of(cur, future_id) == manager.default_partition
+            conn.commit()
+        print(f"✅ migrate：{len(AGES_DAYS)} 行与 id 保留，超出预建范围的行进入 DEFAULT 分区，写入不失败")
+
+        # 预建范围扩大后：启动检查不做 DDL，由维护任务新建月分区并把 DEFAULT 中对应月份的行移入
+        manager.premake_months = 8
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                assert manager.ensure_schema(cur)
+                assert partition_of(cur, future_id) == manager.default_partition, "启动检查不应创建分区"
+            conn.commit()
+        manager.retention_months = 0
+        created = manager.run_maintenance()["created"]
+        manager.retention_months = RETENTION_MONTHS
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                assert partition_of(cur, future_id) != manager.default_partition, "新建月分区后行仍留在 DEFAULT"
+                assert partition_of(cur, ids[200]) != manager.default_partition
+        print(f"✅ 启动检查不建分区；维护任务新建 {len(created)} 个月分区，DEFAULT 中对应月份的行已移出")
+
+        # 保留期按整月计：早于 RETENTION_MONTHS 个月的行一定过期，最近 RETENTION_MONTHS - 1 个月内的行一定保留
+        expired_before = now - timedelta(days=RETENTION_MONTHS * 31)
+        kept_after = now - timedelta(days=(RETENTION_MONTHS - 1) * 28)
+        count_sql = f"SELECT count(*) FILTER (WHERE created_at < %s), count(*) FILTER (WHERE created_at >= %s) " \
+                    f"FROM {TABLE_NAME}"
+        with pooled_connection() as conn:
+            expired_rows, kept_rows = conn.execute(count_sql, (expired_before, kept_after)).fetchone()
+        assert expired_rows > 0
+        dropped = manager.apply_retention()
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(count_sql, (expired_before, kept_after))
+                assert cur.fetchone() == (0, kept_rows), "保留期外的行仍然存在，或保留期内的行被误删"
+                for item in dropped:
+                    cur.execute("SELECT to_regclass(%s)", (item["partition"],))
+                    assert cur.fetchone()[0] is None, f"{item['partition']} 没有被删除"
+        print(f"✅ apply_retention：删除过期分区 {[item['partition'] for item in dropped]}，保留期内数据完整")
+    finally:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                drop_all(cur)
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
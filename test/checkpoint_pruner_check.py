@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+检查点清理冒烟检查：在真实的 LangGraph 检查点表上运行清理 SQL
+1. 建表（PostgresSaver.setup）并为 THREADS 个 thread 各写 TURNS 轮对话
+2. 只清理这些 thread（keep_last=KEEP_LAST，不按时间保留）：每个 thread 剩下 KEEP_LAST 个检查点，
+   删除的 blobs 不被任何剩余检查点引用
+3. 剩余的每个检查点读取结果与清理前完全一致，图还能在最新检查点上继续运行
+运行：PYTHONPATH=. python test/checkpoint_pruner_check.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+import operator
+import uuid
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, StateGraph
+from psycopg_pool import ConnectionPool
+
+from app.eckert_agent.memory.checkpoint_pruner import CheckpointPruner
+from app.eckert_agent.memory.pg_checkpointer import CHECKPOINT_CONN_KWARGS, PooledPostgresSaver
+
+# ===================== 1. 检查参数 =====================
+THREADS = 3
+TURNS = 12
+KEEP_LAST = 3
+THREAD_PREFIX = "pruner_check_"
+
+
+class State(TypedDict):
+    messages: Annotated[List, operator.add]
+    turns: int
+
+
+def reply(state: State):
+    return {"messages": [AIMessage(content=f"第 {len(state['messages'])} 条回复")], "turns": state.get("turns", 0) + 1}
+
+
+def build(checkpointer):
+    graph = StateGraph(State)
+    graph.add_node("reply", reply)
+    graph.add_edge(START, "reply")
+    graph.add_edge("reply", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def snapshot(saver, thread_id: str):
+    """thread 的全部检查点：checkpoint_id → 通道值"""
+    return {item.config["configurable"]["checkpoint_id"]: item.checkpoint["channel_values"]
+            for item in saver.list({"configurable": {"thread_id": thread_id}})}
+
+
+def referenced_blobs(pool, thread_ids: List[str], latest: int = 0) -> set:
+    """
+    检查点引用且确实存在的 blob 键（没有变化的空通道不写 blob，不算在内）
+    :param latest: 只看每个 thread 最新的若干个检查点，0 表示全部
+    """
+    with pool.connection() as conn:
+        rows = conn.execute(
+            """
+            WITH kept AS (
+                SELECT thread_id, checkpoint_ns, checkpoint,
+                       row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+                FROM checkpoints
+                WHERE thread_id = ANY(%(threads)s)
+            )
+            SELECT DISTINCT b.thread_id, b.channel, b.version
+            FROM kept c
+                     CROSS JOIN jsonb_each_text(c.checkpoint -> 'channel_versions') AS v(channel, version)
+                     JOIN checkpoint_blobs b ON b.thread_id = c.thread_id AND b.checkpoint_ns = c.checkpoint_ns
+                                            AND b.channel = v.channel AND b.version = v.version
+            WHERE %(latest)s = 0 OR c.rn <= %(latest)s
+            """,
+            {"threads": thread_ids, "latest": latest}
+        ).fetchall()
+    return {(row["thread_id"], row["channel"], row["version"]) for row in rows}
+
+
+def main():
+    pool = ConnectionPool(kwargs=CHECKPOINT_CONN_KWARGS, min_size=1, open=True)
+    pool.wait()
+    saver = PooledPostgresSaver(pool)
+    saver.setup()
+    graph = build(saver)
+    thread_ids = [f"{THREAD_PREFIX}{uuid.uuid4().hex[:8]}" for _ in range(THREADS)]
+    try:
+        for thread_id in thread_ids:
+            for i in range(TURNS):
+                graph.invoke({"messages": [HumanMessage(content=f"第 {i} 个问题")]},
+                             {"configurable": {"thread_id": thread_id}})
+        before = {thread_id: snapshot(saver, thread_id) for thread_id in thread_ids}
+        kept_blobs = referenced_blobs(pool, thread_ids, KEEP_LAST)
+
+        result = CheckpointPruner(keep_last=KEEP_LAST, keep_seconds=0).prune_threads(thread_ids)
+        print(f"清理结果：{result}")
+        assert result["checkpoints"] > 0 and result["blobs"] > 0, "没有删除任何检查点或 blobs"
+
+        for thread_id in thread_ids:
+            after = snapshot(saver, thread_id)
+            assert len(after) == KEEP_LAST, f"{thread_id} 剩余 {len(after)} 个检查点，应为 {KEEP_LAST}"
+            # 最新的 KEEP_LAST 个检查点原样保留，读取结果（含 blobs 中的消息）与清理前一致
+            for checkpoint_id, values in after.items():
+                assert values == before[thread_id][checkpoint_id], f"{thread_id} 的检查点 {checkpoint_id} 读取结果变化"
+        assert referenced_blobs(pool, thread_ids) == kept_blobs, "剩余检查点引用的 blob 被删除"
+        print(f"✅ 每个 thread 保留最近 {KEEP_LAST} 个检查点，读取结果与清理前一致，没有引用丢失的 blob")
+
+        config = {"configurable": {"thread_id": thread_ids[0]}}
+        state = graph.invoke({"messages": [HumanMessage(content="清理后继续对话")]}, config)
+        assert state["turns"] == TURNS + 1 and len(state["messages"]) == (TURNS + 1) * 2
+        print("✅ 清理后图在最新检查点上继续运行，历史完整")
+    finally:
+        for thread_id in thread_ids:
+            saver.delete_thread(thread_id)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+检查点序列化压测：LangGraph 默认序列化器（JsonPlusSerializer，msgpack） vs msgpack + zstd（不同压缩级别）
+载荷为模拟 ReAct 会话的 AgentState：每轮 用户提问 → 工具调用 → 工具返回（较长的 JSON/代码输出） → 最终回答
+输出：不同轮数下的序列化大小、压缩率、编码/解码耗时（微秒）
+运行：PYTHONPATH=. python test/checkpoint_serde_bench.py（不需要数据库）
+"""
+import json
+import time
+
+from langchain_core.agents import AgentAction, AgentStep
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from app.eckert_agent.agent.code_agent import AgentState
+from app.eckert_agent.memory.checkpoint_serde import ZstdSerializer
+
+# ===================== 1. 压测参数 =====================
+TURN_COUNTS = [5, 20, 80]
+ZSTD_LEVELS = [1, 3, 9]
+ROUNDS = 200
+
+
+def build_state(turns: int) -> AgentState:
+    messages, steps = [], []
+    for i in range(turns):
+        call_id = f"call_{i:04d}"
+        args = {"a": i, "b": i * 2, "path": f"/srv/project/module_{i % 7}.py"}
+        tool_output = json.dumps({
+            "result": i * 3,
+            "lines": [f"def handler_{i}_{j}(request):\n    return process(request, retries={j})" for j in range(12)],
+            "meta": {"elapsed_ms": 12.5 + i, "cached": i % 3 == 0},
+        }, ensure_ascii=False)
+        messages.extend([
+            HumanMessage(content=f"第 {i} 个问题：帮我看看 module_{i % 7}.py 里的 handler 为什么会重试失败？"),
+            AIMessage(content="", tool_calls=[{"name": "read_file", "args": args, "id": call_id}]),
+            ToolMessage(content=tool_output, tool_call_id=call_id),
+            AIMessage(content=f"第 {i} 个回答：handler 在重试时没有重置连接状态，建议在 process 之前调用 reset()。" * 3),
+        ])
+        steps.append(AgentStep(action=AgentAction(tool="read_file", tool_input=args, log=f"读取文件 {i}"),
+                               observation=tool_output))
+    return AgentState(messages=messages, intermediate_steps=steps, session_id="bench")
+
+
+def channel_values(state: AgentState):
+    """检查点按通道分别存储（每个通道一个 blob），与 PostgresSaver 的写入方式一致"""
+    return [state.messages, state.intermediate_steps]
+
+
+def measure(serde, state: AgentState):
+    values = channel_values(state)
+    encoded = [serde.dumps_typed(value) for value in values]
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for value in values:
+            serde.dumps_typed(value)
+    encode_us = (time.perf_counter() - start) / ROUNDS * 1e6
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for item in encoded:
+            serde.loads_typed(item)
+    decode_us = (time.perf_counter() - start) / ROUNDS * 1e6
+    decoded = [serde.loads_typed(item) for item in encoded]
+    assert decoded == values, "解码结果与原始状态不一致"
+    return sum(len(data) for _, data in encoded), encode_us, decode_us
+
+
+def main():
+    serdes = [("msgpack (default)", JsonPlusSerializer())]
+    serdes += [(f"msgpack+zstd-{level}", ZstdSerializer(level=level)) for level in ZSTD_LEVELS]
+
+    print(f"{'serializer':<20}{'turns':>6}{'bytes':>10}{'ratio':>8}{'encode us':>11}{'decode us':>11}")
+    for turns in TURN_COUNTS:
+        state = build_state(turns)
+        baseline = None
+        for name, serde in serdes:
+            size, encode_us, decode_us = measure(serde, state)
+            baseline = baseline or size
+            print(f"{name:<20}{turns:>6}{size:>10}{baseline / size:>8.1f}{encode_us:>11.0f}{decode_us:>11.0f}")
+        print()
+
+    # 兼容性：压缩序列化器可以读取默认序列化器写入的旧数据
+    messages = build_state(2).messages
+    assert ZstdSerializer().loads_typed(JsonPlusSerializer().dumps_typed(messages)) == messages
+    print("✅ 压缩序列化器可读取未压缩的旧检查点")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+对话存储冒烟检查：OllamaAgent 的图每轮运行一次，模型用桩代替（不需要 Ollama）
+1. checkpoint 模式：每轮 invoke 落一次检查点，中途退出后用同一检查点存储新建的图能恢复已完成的轮次
+2. checkpoint 模式：检查点中的消息按 max_memory_len 裁剪；开启摘要时较早的轮次折叠进开头的摘要消息
+3. checkpoint 模式 sync 投影：每轮同时写入 chat_memory
+4. chat_memory 模式：图不挂检查点，每次运行从 chat_memory 表加载历史送入模型
+运行：PYTHONPATH=. python test/conversation_store_check.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+import uuid
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import InMemorySaver
+from psycopg_pool import ConnectionPool
+
+from app.eckert_agent.agent.code_agent import OllamaAgent
+from app.eckert_agent.memory.chat_memory import ChatMemory
+from app.eckert_agent.memory.context_window import ContextWindowManager
+from app.eckert_agent.memory.conversation_store import ConversationStore
+from app.eckert_agent.memory.conversation_summarizer import summary_from_message
+from app.eckert_agent.memory.pg_checkpointer import CHECKPOINT_CONN_KWARGS, PooledPostgresSaver
+
+# ===================== 1. 检查参数 =====================
+TURNS = 8
+MAX_MEMORY_LEN = 6
+SUMMARY_TRIGGER_LEN = 8
+SUMMARY_KEEP_RECENT = 4
+
+
+class StubModel:
+    """代替 create_agent 子图：记录每次送入模型的消息数，回复一条 AIMessage"""
+
+    def __init__(self):
+        self.seen: List[int] = []
+
+    def stream(self, state):
+        self.seen.append(len(state.messages))
+        yield {"model": {"messages": [AIMessage(content=f"第 {len(self.seen)} 次回答")]}}
+
+
+class StubSummarizer:
+    """把折叠的消息条数累加进摘要，便于断言"""
+
+    def summarize(self, previous_summary: Optional[str], messages: List[Dict]) -> str:
+        folded = int(previous_summary or 0) + len(messages)
+        return str(folded)
+
+
+def build_agent(store: ConversationStore, checkpointer) -> OllamaAgent:
+    """不连接 Ollama 的 OllamaAgent：只替换模型子图，load_memory/agent_node 与图结构不变"""
+    agent = OllamaAgent.__new__(OllamaAgent)
+    agent.prompt = SystemMessage(content="你是编程助手")
+    agent.context_manager = ContextWindowManager()
+    agent.last_context_report = None
+    agent.base_agent = StubModel()
+    agent.conversation_store = store
+    agent.checkpointer = checkpointer
+    agent.graph = agent._build_langgraph()
+    return agent
+
+
+def run_turns(agent: OllamaAgent, session_id: str, turns: int, start: int = 0):
+    config = RunnableConfig(configurable={"thread_id": session_id})
+    for i in range(start, start + turns):
+        agent.graph.invoke(agent.conversation_store.graph_input(session_id, f"第 {i} 个问题"), config=config)
+
+
+def checkpoint_messages(agent: OllamaAgent, session_id: str) -> List:
+    config = RunnableConfig(configurable={"thread_id": session_id})
+    return agent.graph.get_state(config).values.get("messages", [])
+
+
+def check_checkpoint_per_turn(saver, memory: ChatMemory):
+    session_id = f"store_check_{uuid.uuid4().hex[:8]}"
+    store = ConversationStore(memory, source="checkpoint", projection="sync")
+    agent = build_agent(store, saver)
+    try:
+        lengths = []
+        for i in range(TURNS):
+            run_turns(agent, session_id, 1, start=i)
+            lengths.append(len(checkpoint_messages(agent, session_id)))
+        assert lengths[:MAX_MEMORY_LEN // 2] == [2 * (i + 1) for i in range(MAX_MEMORY_LEN // 2)], \
+            f"每轮没有落一次检查点：{lengths}"
+        assert max(lengths) <= MAX_MEMORY_LEN, f"检查点消息超过 max_memory_len：{lengths}"
+        messages = checkpoint_messages(agent, session_id)
+        assert isinstance(messages[0], HumanMessage) and messages[-2].content == f"第 {TURNS - 1} 个问题"
+        print(f"✅ checkpoint：每轮落一次检查点，消息数 {lengths}（上限 {MAX_MEMORY_LEN}，从整轮开始）")
+
+        # 模拟进程重启：新建的图只靠检查点恢复历史，送入模型的历史包含之前的轮次
+        restarted = build_agent(ConversationStore(memory, source="checkpoint", projection="off"), saver)
+        run_turns(restarted, session_id, 1, start=TURNS)
+        assert restarted.base_agent.seen == [len(messages) + 1], "重启后没有从检查点恢复历史"
+        print(f"✅ checkpoint：新建的图从检查点恢复 {len(messages)} 条历史")
+
+        rows = memory.get_history(session_id, limit=TURNS * 2)
+        assert [row["content"] for row in rows[::2]] == [f"第 {i} 个问题" for i in range(TURNS)], \
+            "sync 投影没有逐轮写入 chat_memory"
+        print(f"✅ sync 投影：{TURNS} 轮全部写入 chat_memory（projection=off 的一轮不写）")
+    finally:
+        saver.delete_thread(session_id)
+        memory.clear(session_id)
+
+
+def check_summary_trim():
+    session_id = f"store_check_{uuid.uuid4().hex[:8]}"
+    summarizer_memory = ChatMemory(summarizer=StubSummarizer())
+    summarizer_memory.summary_trigger_len = SUMMARY_TRIGGER_LEN
+    summarizer_memory.summary_keep_recent = SUMMARY_KEEP_RECENT
+    agent = build_agent(ConversationStore(summarizer_memory, source="checkpoint", projection="off"), InMemorySaver())
+    run_turns(agent, session_id, TURNS)
+    messages = checkpoint_messages(agent, session_id)
+    summary = summary_from_message(messages[0])
+    assert summary is not None, "超过 summary_trigger_len 后检查点开头没有摘要消息"
+    history = messages[1:]
+    assert len(history) <= SUMMARY_TRIGGER_LEN and isinstance(history[0], HumanMessage)
+    assert int(summary) + len(history) == TURNS * 2, "折叠进摘要的消息与保留的消息数对不上"
+    print(f"✅ 摘要裁剪：{summary} 条消息折叠进摘要，检查点保留最近 {len(history)} 条")
+
+
+def check_chat_memory_source(memory: ChatMemory):
+    session_id = f"store_check_{uuid.uuid4().hex[:8]}"
+    store = ConversationStore(memory, source="chat_memory")
+    try:
+        agent = build_agent(store, store.checkpointer())
+        assert agent.checkpointer is None
+        run_turns(agent, session_id, 3)
+        store.flush()
+        # 每轮从表中加载历史：送入模型的消息数 = 已有历史 + 本轮输入
+        assert agent.base_agent.seen == [1, 3, 5], f"没有从 chat_memory 加载历史：{agent.base_agent.seen}"
+        print(f"✅ chat_memory：每轮从表中加载历史，送入模型的消息数 {agent.base_agent.seen}")
+    finally:
+        memory.clear(session_id)
+
+
+def main():
+    memory = ChatMemory()
+    memory.summarizer = None
+    memory.max_memory_len = MAX_MEMORY_LEN
+    memory.history_limit = TURNS * 2
+    pool = ConnectionPool(kwargs=CHECKPOINT_CONN_KWARGS, min_size=1, open=True)
+    pool.wait()
+    saver = PooledPostgresSaver(pool)
+    saver.setup()
+    try:
+        check_checkpoint_per_turn(saver, memory)
+        check_summary_trim()
+        check_chat_memory_source(memory)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+本地假 Ollama 服务（压测专用）
+特点：实现 /api/chat（NDJSON 流式/非流式）、/api/tags、/api/version，
+可配置固定延迟，统计请求数与 TCP 连接数（用于验证 keep-alive 复用），无需 GPU / 真实模型
+服务运行在独立子进程中，压测客户端的 CPU 开销不会干扰服务端
+"""
+import json
+import multiprocessing
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1：允许客户端复用连接（keep-alive）
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 关闭 Nagle：避免响应头与响应体分两次写时触发 40ms 延迟确认
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.shared["connections"].get_lock():
+            self.server.shared["connections"].value += 1
+
+    def log_message(self, format, *args):
+        # 压测时不打印访问日志
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.server.shared["failing"].value:
+            return self._send_json({"error": "backend down"}, status=503)
+        if self.path == "/api/tags":
+            return self._send_json({"models": [{"model": "fake", "name": "fake"}]})
+        if self.path == "/api/version":
+            return self._send_json({"version": "0.0.0-fake"})
+        self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.shared["requests"].get_lock():
+            self.server.shared["requests"].value += 1
+        if self.server.shared["failing"].value:
+            return self._send_json({"error": "backend down"}, status=503)
+        if self.path != "/api/chat":
+            return self._send_json({"error": "not found"}, status=404)
+
+        # 模拟推理耗时（prefill + decode）
+        time.sleep(self.server.shared["latency"].value)
+        model = request.get("model", "fake")
+        tokens = [f"{word} " for word in self.server.shared["reply"].split()] or [""]
+        done = {
+            "model": model,
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": len(request.get("messages", [])),
+            "eval_count": len(tokens),
+        }
+        if not request.get("stream", True):
+            done["message"]["content"] = "".join(tokens)
+            return self._send_json(done)
+
+        lines = [
+            json.dumps({
+                "model": model,
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": token},
+                "done": False,
+            })
+            for token in tokens
+        ]
+        lines.append(json.dumps(done))
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 加大监听队列：高并发建连时避免 SYN 被丢弃导致 1s 重传
+    request_queue_size = 512
+
+
+def _serve(port_value, ready, shared):
+    """子进程入口：独立进程运行假服务，避免与压测客户端争抢 GIL"""
+    httpd = _FakeHTTPServer(("127.0.0.1", 0), _FakeOllamaHandler)
+    httpd.shared = shared
+    port_value.value = httpd.server_address[1]
+    ready.set()
+    httpd.serve_forever()
+
+
+class FakeOllamaServer:
+    """假 Ollama 服务：with FakeOllamaServer(latency=0.05) as server: server.base_url"""
+
+    def __init__(self, latency: float = 0.05, reply: str = "这是 假 Ollama 的 回复"):
+        ctx = multiprocessing.get_context("spawn")
+        # 跨进程共享的配置与统计（子进程内的 handler 直接读写）
+        self._shared = {
+            "latency": ctx.Value("d", latency),
+            "failing": ctx.Value("b", False),
+            "requests": ctx.Value("q", 0),
+            "connections": ctx.Value("q", 0),
+            "reply": reply,
+        }
+        self._port = ctx.Value("i", 0)
+        self._ready = ctx.Event()
+        self._process = ctx.Process(target=_serve, args=(self._port, self._ready, self._shared), daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._port.value}"
+
+    @property
+    def requests(self) -> int:
+        return self._shared["requests"].value
+
+    @property
+    def connections(self) -> int:
+        return self._shared["connections"].value
+
+    def set_latency(self, latency: float):
+        self._shared["latency"].value = latency
+
+    def set_failing(self, failing: bool):
+        """模拟后端宕机（所有接口返回 503）"""
+        self._shared["failing"].value = failing
+
+    def reset_stats(self):
+        self._shared["requests"].value = 0
+        self._shared["connections"].value = 0
+
+    def start(self) -> "FakeOllamaServer":
+        self._process.start()
+        self._ready.wait(timeout=10)
+        return self
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join(timeout=5)
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+混合检索压测：字符二元组 BM25 的数组倒排表 vs 朴素的 dict[词] -> list[(行号, 词频)]
+1. 不同规模（最大 1M 条切片）下 BM25 建索引耗时、倒排记录数、倒排表字节数、进程 RSS 增量、查询延迟
+2. 朴素倒排表在 BASELINE_SIZE 条切片上的 RSS 增量（按倒排记录折算每条字节数）
+3. BM25 + 向量（本地哈希嵌入）倒数排名融合的端到端查询延迟
+运行：PYTHONPATH=. python test/hybrid_retrieval_bench.py（不需要数据库与 Ollama）
+"""
+import gc
+import random
+import time
+from collections import Counter
+
+from app.eckert_agent.memory.bm25_index import BM25Index, ngram_terms
+from app.eckert_agent.memory.embeddings import HashingEmbedder
+from app.eckert_agent.memory.hybrid_retriever import HybridRetriever
+from app.eckert_agent.memory.vector_index import VectorIndex
+from bench_utils import percentile
+
+# ===================== 1. 压测参数 =====================
+SIZES = [100_000, 1_000_000]
+BASELINE_SIZE = 100_000
+HYBRID_SIZE = 100_000
+WORDS_PER_CHUNK = 40
+VOCAB_SIZE = 20_000
+QUERIES = 200
+TOP_K = 5
+TOOL_NAMES = ["add_numbers_tool", "read_file", "search_knowledge", "save_turn", "run_maintenance"]
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def build_vocabulary(rng):
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+    return ["".join(rng.choices(chars, k=rng.randint(2, 4))) for _ in range(VOCAB_SIZE)] + TOOL_NAMES
+
+
+def make_chunks(rng, vocab, count):
+    cum_weights, total = [], 0.0
+    for rank in range(len(vocab)):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+    for i in range(count):
+        yield i, "".join(rng.choices(vocab, cum_weights=cum_weights, k=WORDS_PER_CHUNK))
+
+
+def main():
+    rng = random.Random(7)
+    vocab = build_vocabulary(rng)
+    queries = [" ".join(rng.sample(vocab[100:5000], 2)) for _ in range(QUERIES - len(TOOL_NAMES))] + TOOL_NAMES
+
+    print(f"{'size':>9}{'build s':>9}{'postings':>12}{'index MB':>10}{'RSS MB':>9}{'B/posting':>11}"
+          f"{'p50 ms':>9}{'p99 ms':>9}")
+    for size in SIZES:
+        gc.collect()
+        before = rss_bytes()
+        index = BM25Index()
+        start = time.perf_counter()
+        batch_ids, batch_texts = [], []
+        for doc_id, text in make_chunks(rng, vocab, size):
+            batch_ids.append(doc_id)
+            batch_texts.append(text)
+            if len(batch_ids) == 10_000:
+                index.add(batch_ids, batch_texts)
+                batch_ids, batch_texts = [], []
+        index.add(batch_ids, batch_texts)
+        index.compact()
+        build = time.perf_counter() - start
+        gc.collect()
+        rss = rss_bytes() - before
+        latencies = []
+        for query in queries:
+            begin = time.perf_counter()
+            index.search(query, TOP_K)
+            latencies.append(time.perf_counter() - begin)
+        print(f"{size:>9}{build:>9.1f}{index.postings:>12,}{index.memory_bytes() / 2 ** 20:>10.0f}"
+              f"{rss / 2 ** 20:>9.0f}{index.memory_bytes() / index.postings:>11.1f}"
+              f"{percentile(latencies, 0.5) * 1000:>9.2f}{percentile(latencies, 0.99) * 1000:>9.2f}")
+        del index
+    gc.collect()
+
+    before = rss_bytes()
+    naive, postings = {}, 0
+    for row, text in make_chunks(rng, vocab, BASELINE_SIZE):
+        for term, tf in Counter(ngram_terms(text)).items():
+            naive.setdefault(term, []).append((row, tf))
+            postings += 1
+    gc.collect()
+    rss = rss_bytes() - before
+    print(f"\n朴素倒排表（dict + list[tuple]）{BASELINE_SIZE} 条切片：{postings:,} 条倒排记录，"
+          f"RSS {rss / 2 ** 20:.0f} MB，约 {rss / postings:.0f} B/posting")
+    del naive
+    gc.collect()
+
+    embedder = HashingEmbedder()
+    retriever = HybridRetriever(table_name="", embedder=embedder, index=VectorIndex(embedder.dim, mode="flat"))
+    chunks = [{"id": doc_id, "title": "", "keywords": "", "content": text}
+              for doc_id, text in make_chunks(rng, vocab, HYBRID_SIZE)]
+    start = time.perf_counter()
+    retriever.load_batches(chunks[begin:begin + 10_000] for begin in range(0, len(chunks), 10_000))
+    build = time.perf_counter() - start
+    latencies = []
+    for query in queries:
+        begin = time.perf_counter()
+        retriever.search(query, TOP_K)
+        latencies.append(time.perf_counter() - begin)
+    print(f"\n混合检索（BM25 + 向量 + RRF）{HYBRID_SIZE} 条切片：建索引 {build:.1f}s，"
+          f"p50 {percentile(latencies, 0.5) * 1000:.2f} ms，p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+    hits = retriever.search("add_numbers_tool", TOP_K)
+    assert hits and "add_numbers_tool" in hits[0]["content"], "工具名精确匹配未排在最前"
+    print("✅ 工具名查询的融合结果第一条包含该工具名")
+
+
+if __name__ == "__main__":
+    main()
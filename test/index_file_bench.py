@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+知识库索引文件压测：worker 启动时从数据库重建进程内混合检索索引 vs 直接 mmap 索引文件
+1. COPY 写入 DOC_COUNT 篇模拟文档，从数据库全量加载（读表 + 嵌入 + 建 BM25/向量索引），生成索引文件
+2. WORKERS 个子进程分别映射同一索引文件：启动耗时、检索结果与全量加载一致、私有内存 vs 共享页（/proc/self/smaps_rollup）
+3. 对照：一个子进程从数据库全量加载时的启动耗时与私有内存
+4. 热切换：新增文档后重建索引文件，运行中的检索器在下一次检索时切换到新文件
+嵌入使用本地哈希嵌入（不需要 Ollama），运行：PYTHONPATH=. python test/index_file_bench.py（需要可连接的 PostgreSQL）
+"""
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from app.eckert_agent.memory.embeddings import HashingEmbedder
+from app.eckert_agent.memory.hybrid_retriever import HybridRetriever
+from app.eckert_agent.memory.knowledge_retriever import KnowledgeRetriever
+from app.eckert_agent.memory.pg_pool import pooled_connection
+
+# ===================== 1. 压测参数 =====================
+DOC_COUNT = 100_000
+CHARS_PER_DOC = 120
+WORKERS = 4
+QUERIES = 50
+TOP_K = 5
+TABLE_NAME = "index_file_bench"
+
+
+def smaps_mb() -> dict:
+    """本进程的常驻内存：rss 总量、pss（共享页按进程数分摊）、private（本进程独占）"""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"rss": fields["Rss"], "pss": fields["Pss"], "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def build_queries(rng: random.Random):
+    with pooled_connection() as conn:
+        rows = conn.execute(sql.SQL("SELECT content FROM {table} ORDER BY random() LIMIT %s").format(
+            table=sql.Identifier(TABLE_NAME)), (QUERIES,)).fetchall()
+    return [row[0][start:start + 12] for row in rows for start in [rng.randint(0, CHARS_PER_DOC - 12)]]
+
+
+def worker(index_path, queries, results_queue):
+    """子进程：映射索引文件（index_path 为 None 时从数据库加载）、检索，回报启动耗时、内存与检索结果"""
+    baseline = smaps_mb()
+    start = time.perf_counter()
+    retriever = HybridRetriever(TABLE_NAME, embedder=HashingEmbedder(), index_path=index_path)
+    retriever.load()
+    startup = time.perf_counter() - start
+    hits = [[doc["id"] for doc in retriever.search(query, TOP_K)] for query in queries]
+    memory = smaps_mb()
+    results_queue.put({
+        "startup_ms": startup * 1000, "hits": hits,
+        **{key: memory[key] - baseline[key] for key in memory},
+    })
+    # 等其他 worker 都完成映射后再退出，pss 才能反映共享
+    time.sleep(1)
+
+
+def run_workers(count, index_path, queries):
+    ctx = multiprocessing.get_context("spawn")
+    results_queue = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(index_path, queries, results_queue)) for _ in range(count)]
+    for proc in procs:
+        proc.start()
+    results = [results_queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    return results
+
+
+def main():
+    rng = random.Random(7)
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 2000)]
+    table = sql.Identifier(TABLE_NAME)
+    with pooled_connection() as conn:
+        conn.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=table))
+    KnowledgeRetriever._ready_tables.pop(TABLE_NAME, None)
+    KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext")
+    index_path = Path(tempfile.mkdtemp(prefix="index_file_bench_")) / f"{TABLE_NAME}.idx"
+
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                with cur.copy(sql.SQL("COPY {table} (title, keywords, content) FROM STDIN").format(table=table)) as copy:
+                    for i in range(DOC_COUNT):
+                        copy.write_row((f"文档{i}", "", "".join(rng.choices(chars, k=CHARS_PER_DOC))))
+        queries = build_queries(rng)
+
+        builder = HybridRetriever(TABLE_NAME, embedder=HashingEmbedder())
+        start = time.perf_counter()
+        builder.load()
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        size = builder.build_index_file(index_path)
+        print(f"{DOC_COUNT} 篇文档：从数据库全量加载 {load_seconds:.1f}s，"
+              f"生成索引文件 {time.perf_counter() - start:.1f}s，{size / 2 ** 20:.0f} MB\n")
+        expected = [[doc["id"] for doc in builder.search(query, TOP_K)] for query in queries]
+
+        print(f"{'worker':<16}{'startup ms':>12}{'rss MB':>9}{'pss MB':>9}{'private MB':>12}")
+        for i, result in enumerate(run_workers(WORKERS, index_path, queries)):
+            assert result["hits"] == expected, "映射索引文件的检索结果与全量加载不一致"
+            print(f"{'mmap #' + str(i):<16}{result['startup_ms']:>12.1f}{result['rss']:>9.0f}"
+                  f"{result['pss']:>9.0f}{result['private']:>12.0f}")
+        result = run_workers(1, None, queries)[0]
+        print(f"{'rebuild from PG':<16}{result['startup_ms']:>12.1f}{result['rss']:>9.0f}"
+              f"{result['pss']:>9.0f}{result['private']:>12.0f}")
+        print("✅ 各 worker 映射索引文件的检索结果与全量加载一致")
+
+        # 热切换：运行中的检索器每次检索都检查文件
+        running = HybridRetriever(TABLE_NAME, embedder=HashingEmbedder(), index_path=index_path, check_interval=0)
+        running.load()
+        with pooled_connection() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(sql.SQL("""
+                    INSERT INTO {table} (title, content) VALUES ('热切换文档', '热切换之后才可见的内容')
+                    RETURNING id, title, content, keywords
+                """).format(table=table))
+                builder.add_documents(cur.fetchall())
+        builder.build_index_file(index_path, version=1)
+        start = time.perf_counter()
+        hits = running.search("热切换之后才可见的内容", 1)
+        print(f"\n重建后首次检索（含切换）{(time.perf_counter() - start) * 1000:.1f} ms，"
+              f"当前文件版本 {running.index_file.meta['version']}")
+        assert hits and hits[0]["title"] == "热切换文档", "未切换到新的索引文件"
+        print("✅ 运行中的检索器已切换到新索引文件")
+    finally:
+        with pooled_connection() as conn:
+            conn.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=table))
+        if index_path.exists():
+            index_path.unlink()
+        os.rmdir(index_path.parent)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+知识库导入压测：逐条 add_knowledge（每个切片一次 INSERT + 提交） vs KnowledgeIngestor（按文件一个事务、unnest 批量写入）
+语料：以 skills 目录下的 markdown 为模板生成 FILES 个文件（每个文件追加唯一内容，模板部分跨文件重复，用于验证去重）
+1. 全量导入：文档/秒、切片/秒、重复切片数
+2. 再次导入（文件未变化）：全部跳过的耗时
+3. 修改 CHANGED_RATIO 的文件后增量导入
+运行：PYTHONPATH=. python test/knowledge_ingest_bench.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+import contextlib
+import io
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from psycopg import sql
+
+from app.eckert_agent.memory.knowledge_ingest import KnowledgeIngestor, iter_markdown_files, split_markdown
+from app.eckert_agent.memory.knowledge_retriever import KnowledgeRetriever
+from app.eckert_agent.memory.pg_pool import pooled_connection
+
+# ===================== 1. 压测参数 =====================
+TEMPLATE_DIR = Path("app/eckert_agent/skills")
+FILES = 2000
+UNIQUE_SECTIONS = 5
+CHANGED_RATIO = 0.05
+BASELINE_CHUNKS = 2000
+TABLE_NAME = "knowledge_ingest_bench"
+
+
+def build_corpus(root: Path):
+    templates = [path.read_text(encoding="utf-8") for path in iter_markdown_files(TEMPLATE_DIR)]
+    rng = random.Random(7)
+    for i in range(FILES):
+        sections = "\n".join(
+            f"## 场景 {i}-{j}\n\n第 {i} 个服务的第 {j} 条约定：接口超时 {rng.randint(100, 5000)} 毫秒，"
+            f"重试 {rng.randint(1, 5)} 次，缓存键前缀 svc{i}_{j}。\n" for j in range(UNIQUE_SECTIONS))
+        path = root / f"service_{i // 100:02d}" / f"doc_{i:05d}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(templates[i % len(templates)] + "\n" + sections, encoding="utf-8")
+
+
+def drop_tables():
+    with pooled_connection() as conn:
+        conn.execute(sql.SQL("DROP TABLE IF EXISTS {table}, {sources}").format(
+            table=sql.Identifier(TABLE_NAME), sources=sql.Identifier(f"{TABLE_NAME}_sources")))
+    KnowledgeRetriever._ready_tables.pop(TABLE_NAME, None)
+
+
+def main():
+    root = Path(tempfile.mkdtemp(prefix="knowledge_ingest_bench_"))
+    try:
+        build_corpus(root)
+        drop_tables()
+        retriever = KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext")
+
+        # 基线：逐条 add_knowledge
+        chunks = []
+        for path in iter_markdown_files(root):
+            with open(path, encoding="utf-8") as f:
+                chunks.extend(split_markdown(f))
+            if len(chunks) >= BASELINE_CHUNKS:
+                break
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for chunk in chunks[:BASELINE_CHUNKS]:
+                retriever.add_knowledge(chunk.heading, chunk.content)
+        elapsed = time.perf_counter() - start
+        print(f"逐条 add_knowledge：{BASELINE_CHUNKS} 个切片 {elapsed:.2f}s，{BASELINE_CHUNKS / elapsed:,.0f} 切片/秒")
+        drop_tables()
+
+        ingestor = KnowledgeIngestor(KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext"))
+        result = ingestor.ingest_directory(root)
+        print(f"全量导入：{result}")
+        result = ingestor.ingest_directory(root)
+        print(f"再次导入（未变化）：{result}")
+
+        changed = list(iter_markdown_files(root))[:int(FILES * CHANGED_RATIO)]
+        for path in changed:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n## 变更记录\n\n本次修改调整了超时时间。\n")
+        result = ingestor.ingest_directory(root)
+        print(f"增量导入（{len(changed)} 个文件变化）：{result}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        drop_tables()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+知识库全文检索压测：查询时现算 to_tsvector（全表扫描） vs 存储型生成列 search_vector + GIN 索引
+1. COPY 写入 DOC_COUNT 篇模拟文档（写入时由数据库生成 search_vector），输出写入吞吐
+2. 同一批查询分别走两种检索方式，输出延迟分位数，并校验两种方式命中的文档一致
+运行：PYTHONPATH=. python test/knowledge_search_bench.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+import itertools
+import random
+import time
+
+from psycopg import sql
+
+from app.eckert_agent.memory.knowledge_retriever import KnowledgeRetriever
+from app.eckert_agent.memory.pg_pool import pooled_connection
+from bench_utils import percentile
+
+# ===================== 1. 压测参数 =====================
+DOC_COUNT = 100_000
+VOCAB_SIZE = 5000
+WORDS_PER_DOC = 120
+QUERIES = 50
+BASELINE_QUERIES = 5
+TOP_K = 3
+TABLE_NAME = "knowledge_bench"
+
+# 查询时现算 tsvector 的旧写法（与 search_vector 相同的权重，结果可直接对比）
+BASELINE_SQL = """
+SELECT id, ts_rank(%(weights)s::float4[], doc, query) AS rank
+FROM (
+    SELECT id,
+           setweight(to_tsvector(%(config)s::regconfig, title), 'A') ||
+           setweight(to_tsvector(%(config)s::regconfig, keywords), 'B') ||
+           setweight(to_tsvector(%(config)s::regconfig, content), 'C') AS doc
+    FROM {table}
+) AS docs, plainto_tsquery(%(config)s::regconfig, %(query)s) AS query
+WHERE doc @@ query
+ORDER BY rank DESC, id
+LIMIT %(top_k)s
+"""
+
+
+def build_vocabulary():
+    syllables = ["接口", "缓存", "索引", "事务", "分区", "队列", "检索", "模型", "会话", "压缩",
+                 "schema", "graphql", "rest", "token", "pool", "async", "vector", "rank", "query", "shard"]
+    return [f"{random.choice(syllables)}{i}" for i in range(VOCAB_SIZE)]
+
+
+def zipf_cum_weights(size):
+    # 词频近似 Zipf 分布：少数词很常见，大部分词较少出现
+    return list(itertools.accumulate(1 / (rank + 1) for rank in range(size)))
+
+
+def main():
+    random.seed(7)
+    vocab = build_vocabulary()
+    cum_weights = zipf_cum_weights(len(vocab))
+    with pooled_connection() as conn:
+        conn.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=sql.Identifier(TABLE_NAME)))
+    KnowledgeRetriever._ready_tables.pop(TABLE_NAME, None)
+    retriever = KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext")
+    # 测的是索引本身的检索延迟，不经过检索缓存
+    retriever.cache = None
+    table = sql.Identifier(TABLE_NAME)
+
+    try:
+        start = time.perf_counter()
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                with cur.copy(sql.SQL("COPY {table} (title, keywords, content) FROM STDIN").format(table=table)) as copy:
+                    for i in range(DOC_COUNT):
+                        words = random.choices(vocab, cum_weights=cum_weights, k=WORDS_PER_DOC)
+                        copy.write_row((f"文档{i} " + " ".join(words[:4]), " ".join(words[4:8]), " ".join(words[8:])))
+            conn.execute(sql.SQL("ANALYZE {table}").format(table=table))
+        elapsed = time.perf_counter() - start
+        print(f"写入 {DOC_COUNT} 篇文档（含 search_vector 生成）：{elapsed:.1f}s，{DOC_COUNT / elapsed:,.0f} docs/s")
+        print(f"文本搜索配置：{retriever.ts_config}\n")
+
+        # 中频词组成的两词查询（plainto_tsquery 为 AND 语义）
+        queries = [" ".join(random.sample(vocab[50:500], 2)) for _ in range(QUERIES)]
+        indexed, baseline = [], []
+        for query in queries:
+            begin = time.perf_counter()
+            results = retriever.search_knowledge(query, top_k=TOP_K)
+            indexed.append(time.perf_counter() - begin)
+            query_ids = [row["id"] for row in results]
+            if len(baseline) < BASELINE_QUERIES:
+                params = {"weights": retriever.rank_weights, "config": retriever.ts_config,
+                          "query": query, "top_k": TOP_K}
+                begin = time.perf_counter()
+                with pooled_connection() as conn:
+                    rows = conn.execute(sql.SQL(BASELINE_SQL).format(table=table), params).fetchall()
+                baseline.append(time.perf_counter() - begin)
+                assert [row[0] for row in rows if row[1] > 0] == query_ids, f"两种检索结果不一致：{query}"
+
+        print(f"{'mode':<22}{'queries':>8}{'p50 ms':>10}{'p99 ms':>10}")
+        print(f"{'to_tsvector per query':<22}{len(baseline):>8}"
+              f"{percentile(baseline, 0.5) * 1000:>10.1f}{percentile(baseline, 0.99) * 1000:>10.1f}")
+        print(f"{'search_vector + GIN':<22}{len(indexed):>8}"
+              f"{percentile(indexed, 0.5) * 1000:>10.2f}{percentile(indexed, 0.99) * 1000:>10.2f}")
+        print("✅ 两种检索方式命中的文档与排序一致")
+    finally:
+        with pooled_connection() as conn:
+            conn.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=table))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 调度压测：请求合并（防惊群）与优先级排队（对接本地假 Ollama 服务）
+运行：PYTHONPATH=. python test/llm_scheduler_bench.py
+场景：
+  1. 热门问题同时到达：对比开启/关闭请求合并时的上游调用数与延迟分位数（temperature=0，输出可复现才会合并）
+  2. 混合流量（25% 热门问题 + 75% 独立问题）：对比开启/关闭请求合并
+  3. 后端饱和时高/低优先级请求的延迟分位数
+"""
+import asyncio
+import time
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+from app.eckert_agent.model.ollama_pool import PooledChatOllama
+from bench_utils import percentile
+from fake_ollama_server import FakeOllamaServer
+
+# ===================== 1. 压测参数 =====================
+FAKE_LATENCY = 0.1
+MAX_INFLIGHT = 8
+USERS = 64
+WAVES = 4
+POPULAR_PROMPT = "你们的退货政策是什么？"
+
+
+def build_llm(base_url: str, coalesce: bool) -> PooledChatOllama:
+    limits = httpx.Limits(max_connections=MAX_INFLIGHT, max_keepalive_connections=MAX_INFLIGHT)
+    return PooledChatOllama(
+        model="fake",
+        base_url=base_url,
+        temperature=0,
+        max_inflight=MAX_INFLIGHT,
+        max_waiting=USERS * 2,
+        coalesce_requests=coalesce,
+        client_kwargs={"limits": limits, "timeout": 30},
+    )
+
+
+async def timed_stream(llm: PooledChatOllama, prompt: str, **kwargs) -> float:
+    start = time.perf_counter()
+    async for _chunk in llm.astream([HumanMessage(content=prompt)], **kwargs):
+        pass
+    return time.perf_counter() - start
+
+
+# ===================== 2. 场景 =====================
+async def run_waves(llm: PooledChatOllama, popular_ratio: float):
+    """每一波 USERS 个请求同时到达，其中 popular_ratio 比例为同一个热门问题"""
+    latencies = []
+    popular_count = int(USERS * popular_ratio)
+    for wave in range(WAVES):
+        prompts = [POPULAR_PROMPT] * popular_count + [
+            f"第 {wave} 波的第 {i} 个独立问题" for i in range(USERS - popular_count)
+        ]
+        latencies += await asyncio.gather(*(timed_stream(llm, p) for p in prompts))
+    return latencies
+
+
+async def run_priority(llm: PooledChatOllama):
+    """后端饱和：高优先级（priority=0）与低优先级（priority=10）请求同时到达"""
+    tasks = []
+    for i in range(USERS):
+        priority = 0 if i % 4 == 0 else 10
+        tasks.append((priority, timed_stream(llm, f"优先级测试问题 {i}", priority=priority)))
+    results = await asyncio.gather(*(task for _, task in tasks))
+    high = [lat for (priority, _), lat in zip(tasks, results) if priority == 0]
+    low = [lat for (priority, _), lat in zip(tasks, results) if priority != 0]
+    return high, low
+
+
+def report(name: str, latencies, upstream: int):
+    print(
+        f"{name:<22}{len(latencies):>8}{upstream:>10}"
+        f"{percentile(latencies, 0.5) * 1000:>10.0f}{percentile(latencies, 0.99) * 1000:>10.0f}"
+    )
+
+
+async def run_all(server: FakeOllamaServer):
+    print(f"假服务延迟 {FAKE_LATENCY * 1000:.0f}ms，单后端在途上限 {MAX_INFLIGHT}，每波 {USERS} 个并发请求 × {WAVES} 波")
+    print(f"{'scenario':<22}{'calls':>8}{'upstream':>10}{'p50(ms)':>10}{'p99(ms)':>10}")
+    print("-" * 60)
+    for ratio, label in [(1.0, "热门问题"), (0.25, "混合流量")]:
+        for coalesce in (False, True):
+            llm = build_llm(server.base_url, coalesce)
+            server.reset_stats()
+            latencies = await run_waves(llm, ratio)
+            report(f"{label}/{'合并' if coalesce else '不合并'}", latencies, server.requests)
+
+    llm = build_llm(server.base_url, coalesce=False)
+    server.reset_stats()
+    high, low = await run_priority(llm)
+    report("优先级/高(priority=0)", high, server.requests)
+    report("优先级/低(priority=10)", low, server.requests)
+
+
+def main():
+    with FakeOllamaServer(latency=FAKE_LATENCY) as server:
+        asyncio.run(run_all(server))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+PooledChatOllama 吞吐压测（对接本地假 Ollama 服务，无需真实模型）
+运行：PYTHONPATH=. python test/ollama_pool_bench.py
+输出：不同并发度下 同步线程 / 异步协程 两种入口的吞吐、延迟分位数、新建 TCP 连接数
+"""
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+from app.eckert_agent.model.ollama_pool import PooledChatOllama
+from bench_utils import percentile
+from fake_ollama_server import FakeOllamaServer
+
+# ===================== 1. 压测参数 =====================
+FAKE_LATENCY = 0.05  # 假服务单次推理耗时（秒）
+MAX_INFLIGHT = 32  # 单后端在途上限
+CONCURRENCY_LEVELS = [1, 4, 16, 32, 64]
+REQUESTS_PER_WORKER = 8
+MESSAGES = [HumanMessage(content="你好，介绍一下你自己")]
+
+
+def build_llm(base_url: str) -> PooledChatOllama:
+    limits = httpx.Limits(max_connections=MAX_INFLIGHT, max_keepalive_connections=MAX_INFLIGHT)
+    return PooledChatOllama(
+        model="fake",
+        base_url=base_url,
+        max_inflight=MAX_INFLIGHT,
+        client_kwargs={"limits": limits, "timeout": 30},
+    )
+
+
+# ===================== 2. 同步入口（线程池） =====================
+def run_sync(llm: PooledChatOllama, concurrency: int):
+    latencies = []
+
+    def worker():
+        for _ in range(REQUESTS_PER_WORKER):
+            start = time.perf_counter()
+            for _chunk in llm.stream(MESSAGES):
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return time.perf_counter() - start, latencies
+
+
+# ===================== 3. 异步入口（单事件循环多协程） =====================
+async def run_async(llm: PooledChatOllama, concurrency: int):
+    latencies = []
+
+    async def worker():
+        for _ in range(REQUESTS_PER_WORKER):
+            start = time.perf_counter()
+            async for _chunk in llm.astream(MESSAGES):
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def report(mode: str, concurrency: int, elapsed: float, latencies, server: FakeOllamaServer):
+    total = len(latencies)
+    print(
+        f"{mode:<6}{concurrency:>6}{total / elapsed:>12.1f}"
+        f"{statistics.median(latencies) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}"
+        f"{server.requests:>10}{server.connections:>8}"
+    )
+
+
+async def run_async_levels(llm: PooledChatOllama, server: FakeOllamaServer):
+    # 所有并发度共用一个事件循环：异步连接池中的 keep-alive 连接绑定在创建它的事件循环上
+    for concurrency in CONCURRENCY_LEVELS:
+        server.reset_stats()
+        elapsed, latencies = await run_async(llm, concurrency)
+        report("async", concurrency, elapsed, latencies, server)
+
+
+def main():
+    with FakeOllamaServer(latency=FAKE_LATENCY) as server:
+        llm = build_llm(server.base_url)
+        print(f"假服务延迟 {FAKE_LATENCY * 1000:.0f}ms，单后端在途上限 {MAX_INFLIGHT}")
+        print(f"{'mode':<6}{'conc':>6}{'req/s':>12}{'p50(ms)':>10}{'p99(ms)':>10}{'requests':>10}{'conns':>8}")
+        print("-" * 62)
+        for concurrency in CONCURRENCY_LEVELS:
+            server.reset_stats()
+            elapsed, latencies = run_sync(llm, concurrency)
+            report("sync", concurrency, elapsed, latencies, server)
+        asyncio.run(run_async_levels(llm, server))
+
+
+if __name__ == "__main__":
+    main()
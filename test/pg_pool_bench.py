@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+ChatMemory 写入吞吐压测：每次 save 新建连接（改造前） vs 共享连接池（改造后）
+运行：PYTHONPATH=. python test/pg_pool_bench.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+输出：不同并发线程数下的 saves/s 与单次写入延迟分位数
+"""
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg
+
+from app.eckert_agent.memory.chat_memory import ChatMemory
+from app.eckert_agent.memory.pg_pool import get_pool, pool_stats
+from bench_utils import percentile
+
+# ===================== 1. 压测参数 =====================
+CONCURRENCY_LEVELS = [1, 4, 8]
+SAVES_PER_WORKER = 200
+SESSION_PREFIX = "pg_pool_bench_"
+
+
+class UnpooledChatMemory(ChatMemory):
+    """改造前的连接方式：每次调用都 psycopg.connect（TCP + 认证握手）"""
+
+    def _get_connection(self):
+        return psycopg.connect(**self.conn_params)
+
+
+# ===================== 2. 压测 =====================
+def run(memory: ChatMemory, concurrency: int):
+    latencies = []
+
+    def worker():
+        session_id = f"{SESSION_PREFIX}{uuid.uuid4().hex[:8]}"
+        for i in range(SAVES_PER_WORKER):
+            start = time.perf_counter()
+            memory.save_message(session_id, "user" if i % 2 == 0 else "assistant", f"压测消息 {i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return time.perf_counter() - start, latencies
+
+
+def cleanup(memory: ChatMemory):
+    with memory._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM chat_memory WHERE session_id LIKE %s", (f"{SESSION_PREFIX}%",))
+        conn.commit()
+
+
+def main():
+    pooled = ChatMemory()
+    pooled._init_table()
+    unpooled = UnpooledChatMemory()
+    # 只测单条写入路径，不触发后台摘要
+    pooled.summarizer = None
+    unpooled.summarizer = None
+    get_pool().wait()
+
+    print(f"{'mode':<10}{'threads':>8}{'saves':>8}{'saves/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    results = {}
+    try:
+        for concurrency in CONCURRENCY_LEVELS:
+            for name, memory in (("connect", unpooled), ("pool", pooled)):
+                elapsed, latencies = run(memory, concurrency)
+                rate = len(latencies) / elapsed
+                results[(name, concurrency)] = rate
+                print(f"{name:<10}{concurrency:>8}{len(latencies):>8}{rate:>10.0f}"
+                      f"{percentile(latencies, 0.5) * 1000:>9.2f}{percentile(latencies, 0.99) * 1000:>9.2f}")
+    finally:
+        cleanup(pooled)
+
+    for concurrency in CONCURRENCY_LEVELS:
+        speedup = results[("pool", concurrency)] / results[("connect", concurrency)]
+        print(f"✅ {concurrency} 线程：连接池写入吞吐为逐次连接的 {speedup:.1f} 倍")
+    print(f"连接池统计：{pool_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+知识库检索缓存压测：热门问题反复出现（Zipf 分布，同一问题的空白/大小写/全角标点写法不同）
+1. 不开缓存 vs 进程内 LRU：每次检索延迟分位数、命中率、累计节省耗时
+2. add_knowledge 递增知识库版本号后，同一问题不再命中旧结果，能检索到新文档
+3. PostgreSQL 共享层：模拟另一个进程（L1 为空、共用 L2）重放同一批问题的 L2 命中率与延迟
+运行：PYTHONPATH=. python test/retrieval_cache_bench.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+import contextlib
+import io
+import itertools
+import random
+import time
+
+from psycopg import sql
+
+from app.eckert_agent.memory.knowledge_retriever import KnowledgeRetriever
+from app.eckert_agent.memory.pg_pool import pooled_connection
+from app.eckert_agent.memory.retrieval_cache import LRURetrievalCache, PostgresRetrievalCache, RetrievalCache
+from bench_utils import percentile
+
+# ===================== 1. 压测参数 =====================
+DOC_COUNT = 50_000
+VOCAB_SIZE = 5000
+WORDS_PER_DOC = 120
+DISTINCT_QUESTIONS = 300
+REQUESTS = 3000
+TOP_K = 3
+TABLE_NAME = "retrieval_cache_bench"
+
+
+def build_table(rng: random.Random, vocab):
+    table = sql.Identifier(TABLE_NAME)
+    with pooled_connection() as conn:
+        conn.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=table))
+    KnowledgeRetriever._ready_tables.pop(TABLE_NAME, None)
+    KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext")
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            with cur.copy(sql.SQL("COPY {table} (title, keywords, content) FROM STDIN").format(table=table)) as copy:
+                for i in range(DOC_COUNT):
+                    words = rng.choices(vocab, cum_weights=cum_weights, k=WORDS_PER_DOC)
+                    copy.write_row((f"文档{i} " + " ".join(words[:4]), " ".join(words[4:8]), " ".join(words[8:])))
+        conn.execute(sql.SQL("ANALYZE {table}").format(table=table))
+
+
+def variant(rng: random.Random, question: str) -> str:
+    """同一问题的不同写法：多余空白、大写、全角问号"""
+    return rng.choice([question, f"  {question} ", question.upper(), f"{question}？", question.replace(" ", "   ")])
+
+
+def replay(retriever: KnowledgeRetriever, requests):
+    latencies = []
+    for query in requests:
+        begin = time.perf_counter()
+        retriever.search_knowledge(query, TOP_K)
+        latencies.append(time.perf_counter() - begin)
+    return latencies
+
+
+def report(name, latencies, stats=None):
+    line = f"{name:<24}{percentile(latencies, 0.5) * 1000:>9.3f}{percentile(latencies, 0.99) * 1000:>9.3f}" \
+           f"{sum(latencies):>9.2f}"
+    if stats:
+        line += f"  hit_rate={stats['hit_rate']:.3f} saved={stats['saved_seconds']:.2f}s"
+    print(line)
+
+
+def main():
+    rng = random.Random(7)
+    syllables = ["接口", "缓存", "索引", "事务", "分区", "队列", "检索", "模型", "会话", "压缩",
+                 "schema", "graphql", "rest", "token", "pool", "async", "vector", "rank", "query", "shard"]
+    vocab = [f"{rng.choice(syllables)}{i}" for i in range(VOCAB_SIZE)]
+    build_table(rng, vocab)
+    questions = [" ".join(rng.sample(vocab[20:300], 2)) for _ in range(DISTINCT_QUESTIONS)]
+    popularity = list(itertools.accumulate(1 / (rank + 1) for rank in range(DISTINCT_QUESTIONS)))
+    requests = [variant(rng, q) for q in rng.choices(questions, cum_weights=popularity, k=REQUESTS)]
+    persistent = PostgresRetrievalCache()
+    persistent.clear()
+
+    try:
+        print(f"{DOC_COUNT} 篇文档，{DISTINCT_QUESTIONS} 个不同问题，{REQUESTS} 次检索（Zipf 分布）\n")
+        print(f"{'mode':<24}{'p50 ms':>9}{'p99 ms':>9}{'total s':>9}")
+        uncached = KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext")
+        uncached.cache = None
+        report("no cache", replay(uncached, requests))
+
+        cached = KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext",
+                                    cache=RetrievalCache(LRURetrievalCache(), persistent))
+        report("LRU + PostgreSQL", replay(cached, requests), cached.cache_stats())
+
+        # 另一个进程：L1 为空，共用 PostgreSQL 层
+        other = KnowledgeRetriever(table_name=TABLE_NAME, search_mode="fulltext",
+                                   cache=RetrievalCache(LRURetrievalCache(), persistent))
+        report("other process (L2 warm)", replay(other, requests), other.cache_stats())
+        print(f"\n缓存统计：{cached.cache_stats()}")
+        print(f"另一进程缓存统计：{other.cache_stats()}")
+
+        # 写入后失效：新文档只含问题中的词，应排在第一位
+        question = requests[0]
+        before = cached.search_knowledge(question, TOP_K)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cached.add_knowledge(f"新增文档 {question}", question, question)
+        after = cached.search_knowledge(question, TOP_K)
+        assert after and after[0]["title"].startswith("新增文档"), "写入后仍返回了旧的缓存结果"
+        assert after != before
+        print(f"\n✅ add_knowledge 后版本号递增为 {cached.current_version()}，同一问题检索到新文档")
+    finally:
+        persistent.clear()
+        with pooled_connection() as conn:
+            conn.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=sql.Identifier(TABLE_NAME)))
+            conn.execute("DELETE FROM knowledge_versions WHERE table_name = %s", (TABLE_NAME,))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+检查点读取压测：PostgresSaver vs 两级检查点（进程内热缓存 + PostgreSQL 写穿）
+1. 恢复活跃会话（get_tuple 读取最新检查点）：延迟分位数与借出的数据库连接次数
+2. 连续多轮对话（每轮 invoke）：每轮耗时与数据库连接次数（写入仍全部落库）
+运行：PYTHONPATH=. python test/tiered_checkpointer_bench.py（需要可连接的 PostgreSQL，连接参数读取 .env）
+"""
+import operator
+import time
+import uuid
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, StateGraph
+from psycopg_pool import ConnectionPool
+
+from app.eckert_agent.memory.pg_checkpointer import CHECKPOINT_CONN_KWARGS, PooledPostgresSaver
+from app.eckert_agent.memory.tiered_checkpointer import TieredCheckpointSaver
+from bench_utils import percentile
+
+# ===================== 1. 压测参数 =====================
+HISTORY_TURNS = 40
+READS = 500
+TURNS = 100
+THREAD_PREFIX = "tiered_bench_"
+
+
+class State(TypedDict):
+    messages: Annotated[List, operator.add]
+
+
+def reply(state: State):
+    return {"messages": [AIMessage(content=f"第 {len(state['messages'])} 条回复：" + "内容" * 40)]}
+
+
+def build(checkpointer):
+    graph = StateGraph(State)
+    graph.add_node("reply", reply)
+    graph.add_edge(START, "reply")
+    graph.add_edge("reply", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def main():
+    pool = ConnectionPool(kwargs=CHECKPOINT_CONN_KWARGS, min_size=2, open=True)
+    pool.wait()
+    backend = PooledPostgresSaver(pool)
+    backend.setup()
+    savers = (("postgres", backend), ("tiered", TieredCheckpointSaver(backend)))
+
+    print(f"{'mode':<12}{'reads':>7}{'p50 ms':>9}{'p99 ms':>9}{'db calls':>10}")
+    threads = []
+    try:
+        for name, saver in savers:
+            graph = build(saver)
+            config = {"configurable": {"thread_id": f"{THREAD_PREFIX}{uuid.uuid4().hex[:8]}"}}
+            threads.append(config["configurable"]["thread_id"])
+            for i in range(HISTORY_TURNS):
+                graph.invoke({"messages": [HumanMessage(content=f"第 {i} 个问题")]}, config)
+            before = pool.get_stats().get("requests_num", 0)
+            latencies = []
+            for _ in range(READS):
+                start = time.perf_counter()
+                saver.get_tuple(config)
+                latencies.append(time.perf_counter() - start)
+            calls = pool.get_stats().get("requests_num", 0) - before
+            print(f"{name:<12}{READS:>7}{percentile(latencies, 0.5) * 1000:>9.3f}"
+                  f"{percentile(latencies, 0.99) * 1000:>9.3f}{calls:>10}")
+
+        print(f"\n{'mode':<12}{'turns':>7}{'ms/turn':>9}{'db calls':>10}")
+        for name, saver in savers:
+            graph = build(saver)
+            config = {"configurable": {"thread_id": f"{THREAD_PREFIX}{uuid.uuid4().hex[:8]}"}}
+            threads.append(config["configurable"]["thread_id"])
+            before = pool.get_stats().get("requests_num", 0)
+            start = time.perf_counter()
+            for i in range(TURNS):
+                graph.invoke({"messages": [HumanMessage(content=f"第 {i} 个问题")]}, config)
+            elapsed = time.perf_counter() - start
+            calls = pool.get_stats().get("requests_num", 0) - before
+            print(f"{name:<12}{TURNS:>7}{elapsed / TURNS * 1000:>9.2f}{calls:>10}")
+        print(f"缓存统计：{savers[1][1].stats()}")
+    finally:
+        for thread_id in threads:
+            backend.delete_thread(thread_id)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+两级检查点冒烟检查：后端写入失败时缓存不能返回未落库的状态，异步写入有界且同一 thread 按顺序落库
+1. 同步写：后端 put 抛错时 invoke 失败，之后 get_tuple 返回的状态与后端一致（不是缓存中未落库的那一步）
+2. 后台线程异步写：后端 put 失败时该 thread 的缓存失效，flush 后读取回到后端
+3. 事件循环异步写：后端 aput 随机延迟，同时在途的写入不超过 max_pending，全部写完后后端最新检查点与缓存一致
+4. 从后端回填带 pending writes 的检查点：按任务内 idx 与 task_path 建键，之后的 put_writes 去重与排序和后端一致
+后端使用 LangGraph 的内存检查点存储（不需要 PostgreSQL），运行：PYTHONPATH=. python test/tiered_checkpointer_check.py
+"""
+import asyncio
+import operator
+import random
+import uuid
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint, writes_sort_key
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from app.eckert_agent.memory.tiered_checkpointer import TieredCheckpointSaver
+
+# ===================== 1. 检查参数 =====================
+TURNS = 5
+ASYNC_TURNS = 30
+MAX_PENDING = 4
+
+
+class State(TypedDict):
+    messages: Annotated[List, operator.add]
+
+
+class FlakyBackend(InMemorySaver):
+    """可以按需让 put 失败、让 aput 随机延迟的内存后端，并记录同时在途的异步写入数"""
+
+    def __init__(self):
+        super().__init__()
+        self.fail = False
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        if self.fail:
+            raise RuntimeError("db down")
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def pending_write_keys(self, config):
+        """与 PooledPostgresSaver.pending_write_keys 相同的约定：(task_id, task_path, idx)，顺序与 get_tuple 一致"""
+        configurable = config["configurable"]
+        stored = self.writes.get((configurable["thread_id"], configurable.get("checkpoint_ns", ""),
+                                  configurable["checkpoint_id"]), {})
+        return [(task_id, stored[(task_id, idx)][3], idx)
+                for task_id, idx in sorted(stored, key=lambda k: writes_sort_key(stored[k][3], *k))]
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(random.uniform(0, 0.005))
+            return self.put(config, checkpoint, metadata, new_versions)
+        finally:
+            self.in_flight -= 1
+
+
+def reply(state: State):
+    return {"messages": [AIMessage(content=f"第 {len(state['messages'])} 条回复")]}
+
+
+def build(checkpointer):
+    graph = StateGraph(State)
+    graph.add_node("reply", reply)
+    graph.add_edge(START, "reply")
+    graph.add_edge("reply", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def contents(saver, config) -> List[str]:
+    result = saver.get_tuple(config)
+    return [message.content for message in result.checkpoint["channel_values"]["messages"]] if result else []
+
+
+def check_failed_put(write_async: bool):
+    backend = FlakyBackend()
+    saver = TieredCheckpointSaver(backend, write_async=write_async)
+    graph = build(saver)
+    config = {"configurable": {"thread_id": f"tiered_check_{uuid.uuid4().hex[:8]}"}}
+    for i in range(TURNS):
+        graph.invoke({"messages": [HumanMessage(content=f"第 {i} 个问题")]}, config)
+    saver.flush()
+    backend.fail = True
+    try:
+        graph.invoke({"messages": [HumanMessage(content="写入失败的一轮")]}, config)
+        assert write_async, "后端写入失败时同步写的 invoke 应该抛出异常"
+    except RuntimeError:
+        assert not write_async, "异步写入的失败不应该抛给调用方"
+    saver.flush()
+    backend.fail = False
+    assert contents(saver, config) == contents(backend, config), "缓存返回了未落库的检查点"
+    assert "写入失败的一轮" not in contents(saver, config)
+    saver.close()
+    mode = "后台线程异步写" if write_async else "同步写"
+    print(f"✅ {mode}：后端写入失败后读取与后端一致（{len(contents(saver, config))} 条消息）")
+
+
+async def check_async_writes():
+    backend = FlakyBackend()
+    saver = TieredCheckpointSaver(backend, write_async=True, max_pending=MAX_PENDING)
+    graph = build(saver)
+    configs = [{"configurable": {"thread_id": f"tiered_check_{uuid.uuid4().hex[:8]}"}} for _ in range(3)]
+    for i in range(ASYNC_TURNS):
+        await asyncio.gather(*(graph.ainvoke({"messages": [HumanMessage(content=f"第 {i} 个问题")]}, config)
+                               for config in configs))
+    await saver.aflush()
+    assert backend.max_in_flight <= MAX_PENDING, f"同时在途的异步写入 {backend.max_in_flight} 超过 {MAX_PENDING}"
+    for config in configs:
+        latest = contents(backend, config)
+        assert latest == contents(saver, config), "后端最新检查点与缓存不一致（同一 thread 写入乱序）"
+        assert len(latest) == ASYNC_TURNS * 2
+    saver.close()
+    print(f"✅ 事件循环异步写：同时在途最多 {backend.max_in_flight} 个（上限 {MAX_PENDING}），"
+          f"{len(configs)} 个 thread 的最新检查点与缓存一致")
+
+
+def pending(saver, config) -> List:
+    return [(task_id, channel, value) for task_id, channel, value in saver.get_tuple(config).pending_writes]
+
+
+def check_seeded_writes():
+    backend = FlakyBackend()
+    config = {"configurable": {"thread_id": f"tiered_check_{uuid.uuid4().hex[:8]}", "checkpoint_ns": ""}}
+    config = backend.put(config, empty_checkpoint(), {}, {})
+    # 两个任务各写两条：task_path 顺序与 task_id 顺序相反，后端按 (task_path, task_id, idx) 排序
+    backend.put_writes(config, [("messages", "a0"), ("messages", "a1")], "task-a", "~1")
+    backend.put_writes(config, [("messages", "b0"), ("messages", "b1")], "task-b", "~0")
+    saver = TieredCheckpointSaver(backend)
+    latest = {"configurable": {"thread_id": config["configurable"]["thread_id"]}}
+    assert pending(saver, latest) == pending(backend, latest)
+    # 重复写入已有的 (task_id, idx)：后端忽略，缓存也应忽略；新任务按 task_path 排在中间
+    saver.put_writes(config, [("messages", "b0 重复")], "task-b", "~0")
+    saver.put_writes(config, [("messages", "c0")], "task-c", "~0~x")
+    assert saver._lookup(latest) is not None, "检查点没有从后端回填到缓存"
+    assert pending(saver, latest) == pending(backend, latest), \
+        f"回填后缓存与后端的 pending writes 不一致：{pending(saver, latest)} != {pending(backend, latest)}"
+    print(f"✅ 回填 pending writes：去重与排序与后端一致（{len(pending(backend, latest))} 条）")
+
+
+def main():
+    check_failed_put(write_async=False)
+    check_failed_put(write_async=True)
+    asyncio.run(check_async_writes())
+    check_seeded_writes()
+
+
+if __name__ == "__main__":
+    main()
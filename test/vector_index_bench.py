@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+向量检索压测：暴力检索（flat） vs IVF 近似检索（不同 nprobe）
+载荷为带聚类结构的模拟嵌入（高斯混合 + 归一化，接近真实文本嵌入的分布），规模 10k 与 1M 条切片
+输出：建索引耗时、内存占用、批量检索的每条查询耗时、recall@k（以 flat 结果为准）
+另外用本地哈希嵌入器测一次文本嵌入吞吐
+运行：PYTHONPATH=. python test/vector_index_bench.py（不需要数据库与 Ollama）
+"""
+import time
+
+import numpy as np
+
+from app.eckert_agent.memory.embeddings import HashingEmbedder, normalize_rows
+from app.eckert_agent.memory.vector_index import VectorIndex
+
+# ===================== 1. 压测参数 =====================
+SIZES = [10_000, 1_000_000]
+DIM = 128
+# 模拟数据的自然聚类：每类约 POINTS_PER_TOPIC 条切片
+POINTS_PER_TOPIC = 200
+NOISE = 0.1
+QUERIES = 200
+TOP_K = 10
+NPROBES = [4, 16, 64]
+EMBED_TEXTS = 2000
+
+
+def make_vectors(rng, centers, count, chunk=100_000):
+    parts = []
+    for start in range(0, count, chunk):
+        n = min(chunk, count - start)
+        noise = rng.standard_normal((n, DIM), dtype=np.float32) * NOISE
+        parts.append(normalize_rows(centers[rng.integers(0, len(centers), n)] + noise))
+    return np.concatenate(parts)
+
+
+def recall(truth: np.ndarray, found: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(truth, found)]))
+
+
+def main():
+    rng = np.random.default_rng(7)
+    print(f"{'size':>9}{'mode':>14}{'build s':>9}{'MB':>8}{'ms/query':>10}{'recall@' + str(TOP_K):>11}")
+    for size in SIZES:
+        centers = normalize_rows(rng.standard_normal((size // POINTS_PER_TOPIC, DIM), dtype=np.float32))
+        vectors = make_vectors(rng, centers, size)
+        queries = make_vectors(rng, centers, QUERIES)
+        index = VectorIndex(DIM, mode="flat")
+        index.add(np.arange(size), vectors)
+        del vectors
+
+        start = time.perf_counter()
+        _, truth = index.search(queries, TOP_K)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>9}{'flat':>14}{0:>9.1f}{index.memory_bytes() / 2 ** 20:>8.0f}"
+              f"{elapsed / QUERIES * 1000:>10.3f}{1.0:>11.3f}")
+
+        start = time.perf_counter()
+        index.build_ivf()
+        build = time.perf_counter() - start
+        for nprobe in NPROBES:
+            start = time.perf_counter()
+            _, found = index.search(queries, TOP_K, nprobe=nprobe)
+            elapsed = time.perf_counter() - start
+            print(f"{size:>9}{f'ivf/{len(index.centroids)}/{nprobe}':>14}{build:>9.1f}"
+                  f"{index.memory_bytes() / 2 ** 20:>8.0f}{elapsed / QUERIES * 1000:>10.3f}"
+                  f"{recall(truth, found):>11.3f}")
+        print()
+
+    embedder = HashingEmbedder()
+    texts = [f"第 {i} 段：如何在 GraphQL schema 中设计分页与错误码，缓存 {i % 50} 何时失效" * 4 for i in range(EMBED_TEXTS)]
+    start = time.perf_counter()
+    embedder.embed(texts)
+    elapsed = time.perf_counter() - start
+    print(f"哈希嵌入：{EMBED_TEXTS} 条文本 {elapsed:.2f}s，{EMBED_TEXTS / elapsed:,.0f} 条/s")
+
+
+if __name__ == "__main__":
+    main()